@@ -4,7 +4,7 @@ from django import forms
 from django.utils.html import format_html
 from django.urls import reverse
 from django.utils.safestring import mark_safe
-from .models import DocumentCategory, Document, DocumentVersion, Changelog
+from .models import DocumentCategory, Document, DocumentVersion, Changelog, QueuedTask
 
 class DocumentAdminForm(forms.ModelForm):
     class Meta:
@@ -74,9 +74,7 @@ class DocumentCategoryAdminForm(forms.ModelForm):
         if self.instance.pk:
             # Exclude self and descendants from parent choices
             descendants = self.instance.get_descendants(include_self=True)
-            self.fields['parent'].queryset = DocumentCategory.objects.exclude(
-                pk__in=descendants.values_list('pk', flat=True)
-            )
+            self.fields['parent'].queryset = DocumentCategory.objects.exclude(pk__in=descendants.values('pk'))
 
 @admin.register(DocumentCategory)
 class DocumentCategoryAdmin(admin.ModelAdmin):
@@ -85,7 +83,10 @@ class DocumentCategoryAdmin(admin.ModelAdmin):
     list_filter = ('depth', 'parent')
     search_fields = ('name', 'slug', 'description')
     prepopulated_fields = {'slug': ('name',)}
-    readonly_fields = ('path', 'depth', 'get_breadcrumb_trail')
+    readonly_fields = (
+        'path', 'depth', 'url_path', 'get_breadcrumb_trail',
+        'document_count', 'child_count', 'subtree_document_count',
+    )
     ordering = ('path',)
     
     fieldsets = (
@@ -93,7 +94,11 @@ class DocumentCategoryAdmin(admin.ModelAdmin):
             'fields': ('name', 'slug', 'parent', 'description')
         }),
         ('Hierarchy Information', {
-            'fields': ('path', 'depth', 'get_breadcrumb_trail'),
+            'fields': ('path', 'depth', 'url_path', 'get_breadcrumb_trail'),
+            'classes': ('collapse',)
+        }),
+        ('Counters', {
+            'fields': ('document_count', 'child_count', 'subtree_document_count'),
             'classes': ('collapse',)
         }),
     )
@@ -114,21 +119,23 @@ class DocumentCategoryAdmin(admin.ModelAdmin):
     
     def get_document_count(self, obj):
         """Show number of documents in this category"""
-        count = obj.documents.count()
+        count = obj.document_count
         if count > 0:
             return format_html('<a href="{}?category__id__exact={}">{}</a>', 
                               reverse('admin:docvault_document_changelist'), obj.id, count)
         return '0'
     get_document_count.short_description = 'Documents'
+    get_document_count.admin_order_field = 'document_count'
     
     def get_children_count(self, obj):
         """Show number of child categories"""
-        count = obj.children.count()
+        count = obj.child_count
         if count > 0:
             return format_html('<a href="{}?parent__id__exact={}">{}</a>', 
                               reverse('admin:docvault_documentcategory_changelist'), obj.id, count)
         return '0'
     get_children_count.short_description = 'Children'
+    get_children_count.admin_order_field = 'child_count'
     
     def get_breadcrumb_trail(self, obj):
         """Display breadcrumb trail for the category"""
@@ -200,7 +207,7 @@ class DocumentAdmin(admin.ModelAdmin):
     
     def get_version_count(self, obj):
         """Show number of versions"""
-        count = obj.versions.count()
+        count = obj.version_count
         if count > 0:
             return format_html('<a href="{}?document__id__exact={}">{}</a>', 
                               reverse('admin:docvault_documentversion_changelist'), obj.id, count)
@@ -213,10 +220,12 @@ class DocumentAdmin(admin.ModelAdmin):
 
 @admin.register(DocumentVersion)
 class DocumentVersionAdmin(admin.ModelAdmin):
-    list_display = ('document', 'version_number', 'get_document_category', 'created_at', 'created_by')
-    list_filter = ('document__category', 'created_at')
-    search_fields = ('document__title', 'content', 'document__category__name')
-    readonly_fields = ('version_number', 'created_at')
+    list_display = ('document', 'version_number', 'get_document_category', 'storage', 'created_at', 'created_by')
+    list_filter = ('storage', 'document__category', 'created_at')
+    # Not 'content': compressed, delta and blob-stored rows cannot be matched
+    # in SQL, so history is found by document and category only
+    search_fields = ('document__title', 'document__category__name')
+    readonly_fields = ('version_number', 'storage', 'created_at')
 
     def get_form(self, request, obj=None, **kwargs):
         form = super().get_form(request, obj, **kwargs)
@@ -289,4 +298,19 @@ class ChangelogAdmin(admin.ModelAdmin):
     
     def get_queryset(self, request):
         """Optimize queryset with select_related"""
-        return super().get_queryset(request).select_related('document__category', 'created_by', 'version')
\ No newline at end of file
+        return super().get_queryset(request).select_related('document__category', 'created_by', 'version')
+
+@admin.register(QueuedTask)
+class QueuedTaskAdmin(admin.ModelAdmin):
+    """Pending and failing post-save tasks; rows are written by the task queue only"""
+    list_display = ('kind', 'document', 'created_at', 'available_at', 'attempts')
+    list_filter = ('kind', 'attempts')
+    search_fields = ('document__title',)
+    readonly_fields = ('kind', 'document', 'created_at', 'enqueued_at', 'available_at', 'attempts', 'last_error')
+
+    def has_add_permission(self, request):
+        return False
+
+    def get_queryset(self, request):
+        """Optimize queryset with select_related"""
+        return super().get_queryset(request).select_related('document')
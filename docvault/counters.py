@@ -0,0 +1,89 @@
+"""
+Denormalized per-category counters.
+
+Every category stores how many documents it holds directly
+(``document_count``), how many child categories it has (``child_count``) and
+how many documents its whole subtree holds (``subtree_document_count``).
+The signal handlers in signals.py keep them current with relative
+``F()`` updates; ``rebuild_category_counts`` recomputes them from scratch.
+"""
+from django.db.models import Case, F, PositiveIntegerField, When
+
+from .models import DocumentCategory
+
+
+def _ancestor_ids(path, category_id):
+    """Ids on the materialized path, ending with the category itself"""
+    if path:
+        return [int(part) for part in path.split('.')]
+    return [category_id]
+
+
+def adjust_document_count(category_id, delta):
+    """Add delta documents to a category and to the subtree totals of its ancestors"""
+    path = DocumentCategory.objects.filter(pk=category_id).values_list('path', flat=True).first()
+    if path is None:
+        return
+
+    DocumentCategory.objects.filter(pk__in=_ancestor_ids(path, category_id)).update(
+        document_count=Case(
+            When(pk=category_id, then=F('document_count') + delta),
+            default=F('document_count'),
+            output_field=PositiveIntegerField(),
+        ),
+        subtree_document_count=F('subtree_document_count') + delta,
+    )
+
+
+def adjust_child_count(category_id, delta):
+    DocumentCategory.objects.filter(pk=category_id).update(child_count=F('child_count') + delta)
+
+
+def move_category_counts(category, old_parent_id, old_path):
+    """Move a category's subtree total from its old ancestors to its new ones"""
+    if old_parent_id:
+        adjust_child_count(old_parent_id, -1)
+    if category.parent_id:
+        adjust_child_count(category.parent_id, 1)
+
+    subtree_total = DocumentCategory.objects.filter(pk=category.pk)\
+        .values_list('subtree_document_count', flat=True).first()
+    if not subtree_total:
+        return
+
+    old_ancestor_ids = set(_ancestor_ids(old_path, category.pk)[:-1]) if old_path else set()
+    new_ancestor_ids = set(_ancestor_ids(category.path, category.pk)[:-1])
+
+    # Shared ancestors keep the subtree either way
+    DocumentCategory.objects.filter(pk__in=old_ancestor_ids - new_ancestor_ids).update(
+        subtree_document_count=F('subtree_document_count') - subtree_total
+    )
+    DocumentCategory.objects.filter(pk__in=new_ancestor_ids - old_ancestor_ids).update(
+        subtree_document_count=F('subtree_document_count') + subtree_total
+    )
+
+
+def compute_category_counts(parents, document_counts):
+    """
+    Compute (document_count, child_count, subtree_document_count) for every
+    category from an id -> parent_id dict and an id -> document count dict.
+    Categories in a parent cycle only count their own documents.
+    """
+    counts = {
+        category_id: [document_counts.get(category_id, 0), 0, 0]
+        for category_id in parents
+    }
+    for category_id, parent_id in parents.items():
+        if parent_id in counts:
+            counts[parent_id][1] += 1
+
+    for category_id, (own_documents, _, _) in counts.items():
+        if not own_documents:
+            continue
+        ancestor_id, seen = category_id, set()
+        while ancestor_id in counts and ancestor_id not in seen:
+            seen.add(ancestor_id)
+            counts[ancestor_id][2] += own_documents
+            ancestor_id = parents[ancestor_id]
+
+    return {category_id: tuple(values) for category_id, values in counts.items()}
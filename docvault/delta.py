@@ -0,0 +1,42 @@
+"""
+Line-based deltas for version history.
+
+A delta rebuilds a target text from a base text. It is stored as a JSON
+list where ``[start, end]`` copies lines ``start:end`` of the base and a
+string inserts new text. Deltas are only applied to the exact base they were
+made from.
+"""
+from difflib import SequenceMatcher
+import json
+
+
+def _split(text):
+    return text.splitlines(keepends=True)
+
+
+def make_delta(base, target):
+    """Serialized delta that turns base into target"""
+    base_lines = _split(base)
+    target_lines = _split(target)
+
+    ops = []
+    matcher = SequenceMatcher(None, base_lines, target_lines, autojunk=False)
+    for tag, base_start, base_end, target_start, target_end in matcher.get_opcodes():
+        if tag == 'equal':
+            ops.append([base_start, base_end])
+        elif target_end > target_start:
+            # 'replace' and 'insert'; 'delete' simply copies nothing
+            ops.append(''.join(target_lines[target_start:target_end]))
+    return json.dumps(ops, separators=(',', ':'))
+
+
+def apply_delta(base, delta):
+    """Rebuild the target text from its base and a delta from make_delta()"""
+    base_lines = _split(base)
+    parts = []
+    for op in json.loads(delta):
+        if isinstance(op, str):
+            parts.append(op)
+        else:
+            parts.extend(base_lines[op[0]:op[1]])
+    return ''.join(parts)
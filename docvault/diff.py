@@ -0,0 +1,422 @@
+"""
+Server-side diffs between document versions.
+
+Versions are diffed with Myers' O(ND) algorithm in its linear-space
+(middle snake) form, so the result is a shortest edit script and memory
+stays proportional to the input. The structured result is cached per pair of
+versions and their content hashes, so editing a version (e.g. in the admin)
+moves it to a new key instead of serving a stale diff; old entries simply
+expire.
+
+The search is capped at DOCVAULT_DIFF_MAX_COST edits. Beyond that, texts are
+aligned with difflib's SequenceMatcher instead, which is fast but does not
+guarantee a minimal diff.
+
+For HTML content there is also a word-level mode that treats tags, entities
+and words as tokens. It diffs block by block first and refines changed
+blocks word by word, falling back to whole blocks when a change is too large
+to refine, and renders hunk by hunk so the output can be streamed.
+"""
+from difflib import SequenceMatcher
+import re
+
+from django.conf import settings
+from django.core.cache import cache
+from django.utils.html import escape
+
+
+DIFF_KEY = 'docvault:diff:{}:{}:{}:{}:{}:{}'
+DIFF_TIMEOUT = getattr(settings, 'DOCVAULT_DIFF_CACHE_TIMEOUT', 60 * 60 * 24 * 7)
+DIFF_CONTEXT = getattr(settings, 'DOCVAULT_DIFF_CONTEXT_LINES', 3)
+
+# Edit distance above which a diff gives up and falls back to something coarser
+DIFF_MAX_COST = getattr(settings, 'DOCVAULT_DIFF_MAX_COST', 1000)
+# Changed regions with more tokens than this are shown as whole blocks
+WORD_DIFF_MAX_TOKENS = getattr(settings, 'DOCVAULT_WORD_DIFF_MAX_TOKENS', 20000)
+
+# Tags, entities, words, whitespace runs and single punctuation characters
+TOKEN_RE = re.compile(r'<[^>]*>|&#?\w+;|\w+|\s+|[^\w\s]')
+# A block ends after a block-level closing tag, a <br> or a newline
+BLOCK_RE = re.compile(
+    r'[\s\S]*?(?:</(?:p|h[1-6]|li|div|tr|table|ul|ol|pre|blockquote|section)\s*>\n?|<br\s*/?>\n?|\n)|[\s\S]+',
+    re.IGNORECASE,
+)
+
+WORD_RE = re.compile(r'\w+')
+TAG_RE = re.compile(r'<[^>]*>')
+
+
+class DiffTooLarge(Exception):
+    """The edit distance exceeds the allowed cost"""
+
+
+def _middle_snake(a, b, left, top, right, bottom, max_d=None):
+    """
+    Find the middle snake of the shortest edit path through the box
+    ``a[left:right]`` x ``b[top:bottom]`` by searching from both corners at
+    once. Returns its start and end points.
+
+    Raises DiffTooLarge if the search would need more than ``max_d`` rounds.
+    """
+    width = right - left
+    height = bottom - top
+    delta = width - height
+    limit = (width + height + 1) // 2
+    if max_d is not None:
+        limit = min(limit, max_d)
+
+    # Furthest x reached forwards and furthest y reached backwards, per diagonal
+    forward = [0] * (2 * limit + 4)
+    backward = [0] * (2 * limit + 4)
+    forward[1] = left
+    backward[1] = bottom
+
+    for d in range(limit + 1):
+        for k in range(d, -d - 1, -2):
+            if k == -d or (k != d and forward[k - 1] < forward[k + 1]):
+                x = start_x = forward[k + 1]
+            else:
+                start_x = forward[k - 1]
+                x = start_x + 1
+            y = top + (x - left) - k
+            start_y = y if d == 0 or x != start_x else y - 1
+            while x < right and y < bottom and a[x] == b[y]:
+                x += 1
+                y += 1
+            forward[k] = x
+            c = k - delta
+            if delta & 1 and -(d - 1) <= c <= d - 1 and y >= backward[c]:
+                return (start_x, start_y), (x, y)
+
+        for c in range(d, -d - 1, -2):
+            k = c + delta
+            if c == -d or (c != d and backward[c - 1] > backward[c + 1]):
+                y = start_y = backward[c + 1]
+            else:
+                start_y = backward[c - 1]
+                y = start_y - 1
+            x = left + (y - top) + k
+            start_x = x if d == 0 or y != start_y else x + 1
+            while x > left and y > top and a[x - 1] == b[y - 1]:
+                x -= 1
+                y -= 1
+            backward[c] = y
+            if not delta & 1 and -d <= k <= d and x <= forward[k]:
+                return (x, y), (start_x, start_y)
+    raise DiffTooLarge
+
+
+def _find_path(a, b, left, top, right, bottom, path, max_d=None):
+    """Append the points of the shortest edit path through the box to path"""
+    if right - left + bottom - top == 0:
+        return
+    (start_x, start_y), (end_x, end_y) = _middle_snake(a, b, left, top, right, bottom, max_d)
+    _find_path(a, b, left, top, start_x, start_y, path, max_d)
+    path.append((start_x, start_y))
+    path.append((end_x, end_y))
+    _find_path(a, b, end_x, end_y, right, bottom, path, max_d)
+
+
+def diff_opcodes(a, b, max_cost=None):
+    """
+    Shortest edit script between two sequences as difflib-style opcodes:
+    ``(tag, i1, i2, j1, j2)`` with tag one of equal, delete, insert, replace.
+
+    With ``max_cost`` the search stops with DiffTooLarge once more than about
+    that many insertions and deletions would be needed, which bounds the
+    time spent on unrelated texts.
+    """
+    # Compare small integers instead of (possibly long) strings
+    ids = {}
+    a = [ids.setdefault(item, len(ids)) for item in a]
+    b = [ids.setdefault(item, len(ids)) for item in b]
+
+    # Unchanged leading and trailing items are common and need no search
+    prefix = 0
+    limit = min(len(a), len(b))
+    while prefix < limit and a[prefix] == b[prefix]:
+        prefix += 1
+    suffix = 0
+    while suffix < limit - prefix and a[-1 - suffix] == b[-1 - suffix]:
+        suffix += 1
+
+    # Both halves of the path cost at most half the total
+    max_d = None if max_cost is None else (max_cost + 1) // 2
+    path = [(prefix, prefix)]
+    _find_path(a, b, prefix, prefix, len(a) - suffix, len(b) - suffix, path, max_d)
+    path.append((len(a) - suffix, len(b) - suffix))
+
+    # Walk the path, turning each step into equal / delete / insert runs
+    steps = []
+    for (x1, y1), (x2, y2) in zip(path, path[1:]):
+        while x1 < x2 and y1 < y2 and a[x1] == b[y1]:
+            steps.append(('equal', x1, y1))
+            x1 += 1
+            y1 += 1
+        if x2 - x1 > y2 - y1:
+            steps.append(('delete', x1, y1))
+            x1 += 1
+        elif x2 - x1 < y2 - y1:
+            steps.append(('insert', x1, y1))
+            y1 += 1
+        while x1 < x2 and y1 < y2:
+            steps.append(('equal', x1, y1))
+            x1 += 1
+            y1 += 1
+
+    opcodes = []
+    if prefix:
+        opcodes.append(['equal', 0, prefix, 0, prefix])
+    for tag, x, y in steps:
+        step = (x + (tag != 'insert'), y + (tag != 'delete'))
+        last = opcodes[-1] if opcodes else None
+        if last and (last[0] == tag or (tag != 'equal' and last[0] in ('delete', 'insert', 'replace'))):
+            if last[0] != tag:
+                last[0] = 'replace'
+            last[2], last[4] = step
+        else:
+            opcodes.append([tag, x, step[0], y, step[1]])
+    if suffix:
+        opcodes.append(['equal', len(a) - suffix, len(a), len(b) - suffix, len(b)])
+    return [tuple(opcode) for opcode in opcodes]
+
+
+def coarse_opcodes(a, b, max_cost=DIFF_MAX_COST):
+    """
+    Opcodes from diff_opcodes(), or from SequenceMatcher when the edit
+    distance exceeds max_cost. Returns ``(opcodes, coarse)``.
+    """
+    try:
+        return diff_opcodes(a, b, max_cost), False
+    except DiffTooLarge:
+        return SequenceMatcher(None, a, b).get_opcodes(), True
+
+
+def group_opcodes(opcodes, context=DIFF_CONTEXT):
+    """Split opcodes into hunks with up to ``context`` unchanged items around each change"""
+    opcodes = list(opcodes)
+    if not opcodes:
+        return []
+    if opcodes[0][0] == 'equal':
+        tag, i1, i2, j1, j2 = opcodes[0]
+        opcodes[0] = tag, max(i1, i2 - context), i2, max(j1, j2 - context), j2
+    if opcodes[-1][0] == 'equal':
+        tag, i1, i2, j1, j2 = opcodes[-1]
+        opcodes[-1] = tag, i1, min(i2, i1 + context), j1, min(j2, j1 + context)
+
+    hunks = []
+    hunk = []
+    for tag, i1, i2, j1, j2 in opcodes:
+        # Long unchanged runs end the current hunk
+        if tag == 'equal' and i2 - i1 > context * 2:
+            hunk.append((tag, i1, min(i2, i1 + context), j1, min(j2, j1 + context)))
+            hunks.append(hunk)
+            hunk = []
+            i1, j1 = max(i1, i2 - context), max(j1, j2 - context)
+        hunk.append((tag, i1, i2, j1, j2))
+    if hunk and not (len(hunk) == 1 and hunk[0][0] == 'equal'):
+        hunks.append(hunk)
+    return [hunk for hunk in hunks if any(opcode[0] != 'equal' for opcode in hunk)]
+
+
+def diff_lines(old, new, context=DIFF_CONTEXT, max_cost=DIFF_MAX_COST):
+    """
+    Line diff of two texts as a plain, cacheable structure.
+
+    Each hunk has 1-based ``old_start``/``new_start`` and a list of
+    ``lines`` ``[tag, old_number, new_number, text]`` where tag is ``' '``,
+    ``'-'`` or ``'+'`` and the number of the side a line is absent from is
+    None. ``coarse`` is set when the diff may not be minimal.
+    """
+    old_lines = old.splitlines()
+    new_lines = new.splitlines()
+    opcodes, coarse = coarse_opcodes(old_lines, new_lines, max_cost)
+
+    hunks = []
+    added = removed = 0
+    for group in group_opcodes(opcodes, context):
+        lines = []
+        for tag, i1, i2, j1, j2 in group:
+            if tag == 'equal':
+                lines.extend([' ', i + 1, j + 1, old_lines[i]] for i, j in zip(range(i1, i2), range(j1, j2)))
+                continue
+            lines.extend(['-', i + 1, None, old_lines[i]] for i in range(i1, i2))
+            lines.extend(['+', None, j + 1, new_lines[j]] for j in range(j1, j2))
+            removed += i2 - i1
+            added += j2 - j1
+        hunks.append({
+            'old_start': group[0][1] + 1,
+            'old_count': group[-1][2] - group[0][1],
+            'new_start': group[0][3] + 1,
+            'new_count': group[-1][4] - group[0][3],
+            'lines': lines,
+        })
+    return {'hunks': hunks, 'added': added, 'removed': removed, 'coarse': coarse}
+
+
+def _words(lines):
+    """Words of some lines of HTML, ignoring markup"""
+    return WORD_RE.findall(TAG_RE.sub(' ', '\n'.join(lines)))
+
+
+def diff_stats(old, new, max_cost=DIFF_MAX_COST):
+    """
+    Lines and words added and removed from old to new. Words are only
+    compared within changed lines, so the cost follows the size of the edit.
+    """
+    old_lines = old.splitlines()
+    new_lines = new.splitlines()
+    stats = dict.fromkeys(('lines_added', 'lines_removed', 'words_added', 'words_removed'), 0)
+    for tag, i1, i2, j1, j2 in coarse_opcodes(old_lines, new_lines, max_cost)[0]:
+        if tag == 'equal':
+            continue
+        stats['lines_removed'] += i2 - i1
+        stats['lines_added'] += j2 - j1
+        old_words = _words(old_lines[i1:i2])
+        new_words = _words(new_lines[j1:j2])
+        for word_tag, k1, k2, l1, l2 in coarse_opcodes(old_words, new_words, max_cost)[0]:
+            if word_tag != 'equal':
+                stats['words_removed'] += k2 - k1
+                stats['words_added'] += l2 - l1
+    return stats
+
+
+def side_by_side(lines):
+    """
+    Pair a hunk's lines into ``(changed, left, right)`` rows for a
+    two-column view. Removed and added runs are lined up next to each other;
+    either side of a changed row may be None.
+    """
+    rows = []
+    removed = []
+    added = []
+
+    def flush():
+        for index in range(max(len(removed), len(added))):
+            rows.append((
+                True,
+                removed[index] if index < len(removed) else None,
+                added[index] if index < len(added) else None,
+            ))
+        removed.clear()
+        added.clear()
+
+    for tag, old_number, new_number, text in lines:
+        if tag == '-':
+            removed.append((old_number, text))
+        elif tag == '+':
+            added.append((new_number, text))
+        else:
+            flush()
+            rows.append((False, (old_number, text), (new_number, text)))
+    flush()
+    return rows
+
+
+def get_version_diff(version1, version2, context=DIFF_CONTEXT):
+    """
+    Cached diff from version1 to version2.
+
+    The versions' content is only read when the diff is not cached, so pass
+    versions loaded with ``defer('content')``.
+    """
+    key = DIFF_KEY.format(
+        version1.document_id, version1.pk, version2.pk, version1.content_hash, version2.content_hash, context
+    )
+    result = cache.get(key)
+    if result is None:
+        result = diff_lines(version1.content, version2.content, context)
+        cache.set(key, result, DIFF_TIMEOUT)
+    return result
+
+
+def tokenize_html(text):
+    """Split HTML into tags, entities, words, whitespace and punctuation"""
+    return TOKEN_RE.findall(text)
+
+
+def split_blocks(text):
+    """Split HTML after block-level closing tags and line breaks"""
+    return [match.group() for match in BLOCK_RE.finditer(text)]
+
+
+def _render_tokens(tokens):
+    """Escaped source with tags set apart"""
+    return ''.join(
+        f'<span class="diff-tag">{escape(token)}</span>' if token.startswith('<') else escape(token)
+        for token in tokens
+    )
+
+
+def _render_change(old_text, new_text, max_cost, refine=True):
+    """Word-level markup for a changed region, or whole blocks if it is too large"""
+    old_tokens = tokenize_html(old_text)
+    new_tokens = tokenize_html(new_text)
+    if refine and old_tokens and new_tokens and len(old_tokens) + len(new_tokens) <= WORD_DIFF_MAX_TOKENS:
+        try:
+            opcodes = diff_opcodes(old_tokens, new_tokens, max_cost)
+        except DiffTooLarge:
+            pass
+        else:
+            parts = []
+            for tag, i1, i2, j1, j2 in opcodes:
+                if tag == 'equal':
+                    parts.append(_render_tokens(old_tokens[i1:i2]))
+                    continue
+                if i2 > i1:
+                    parts.append(f'<del class="diff-removed">{_render_tokens(old_tokens[i1:i2])}</del>')
+                if j2 > j1:
+                    parts.append(f'<ins class="diff-added">{_render_tokens(new_tokens[j1:j2])}</ins>')
+            return ''.join(parts)
+
+    parts = []
+    if old_tokens:
+        parts.append(f'<del class="diff-removed diff-block">{_render_tokens(old_tokens)}</del>')
+    if new_tokens:
+        parts.append(f'<ins class="diff-added diff-block">{_render_tokens(new_tokens)}</ins>')
+    return ''.join(parts)
+
+
+def stream_word_diff(old, new, context=DIFF_CONTEXT, max_cost=DIFF_MAX_COST):
+    """
+    Yield an HTML-aware word diff of two HTML texts as rendered hunks.
+
+    Blocks (paragraphs, list items, lines) are aligned first and only changed
+    blocks are diffed token by token, so the work grows with the size of the
+    changes rather than the size of the document. When the blocks themselves
+    differ too much, changed blocks are shown whole. Nothing is computed
+    until the generator is iterated.
+    """
+    old_blocks = split_blocks(old)
+    new_blocks = split_blocks(new)
+    opcodes, coarse = coarse_opcodes(old_blocks, new_blocks, max_cost)
+    if coarse:
+        yield (
+            '<p class="text-muted small mb-2">These versions differ too much for a word diff; '
+            'changed blocks are shown whole.</p>'
+        )
+
+    # Line numbers of each hunk, counted incrementally
+    old_line = new_line = 1
+    old_position = new_position = 0
+    hunks = 0
+    for group in group_opcodes(opcodes, context):
+        old_start, new_start = group[0][1], group[0][3]
+        old_line += sum(block.count('\n') for block in old_blocks[old_position:old_start])
+        new_line += sum(block.count('\n') for block in new_blocks[new_position:new_start])
+        old_position, new_position = old_start, new_start
+
+        parts = [f'<div class="diff-hunk"><div class="diff-hunk-header">@@ line {old_line} / line {new_line} @@</div><pre>']
+        for tag, i1, i2, j1, j2 in group:
+            if tag == 'equal':
+                parts.append(_render_tokens(tokenize_html(''.join(old_blocks[i1:i2]))))
+            else:
+                parts.append(_render_change(
+                    ''.join(old_blocks[i1:i2]), ''.join(new_blocks[j1:j2]), max_cost, refine=not coarse
+                ))
+        parts.append('</pre></div>')
+        hunks += 1
+        yield ''.join(parts)
+
+    if not hunks:
+        yield '<p class="text-muted text-center py-4 mb-0">The versions have the same content.</p>'
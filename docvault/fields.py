@@ -0,0 +1,132 @@
+"""
+Content fields with optional transparent compression.
+
+With ``DOCVAULT_CONTENT_COMPRESSION = 'zlib'`` (or ``'lzma'``) bodies are
+compressed when they are written and decompressed the first time the
+attribute is read. Compressed values are stored in the existing text column
+as a marker, the method name and the base64 of the compressed bytes, so the
+schema does not depend on the setting and compressed and plain rows can
+coexist while ``recompress_content`` converts a table.
+
+``TSVectorField`` holds the search vectors of the PostgreSQL search backend.
+"""
+import base64
+import lzma
+import zlib
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.db import models
+from django.db.models import Lookup
+from django.db.models.query_utils import DeferredAttribute
+
+# Conditionally use TinyMCE based on settings
+if getattr(settings, 'DOCVAULT_EDITOR', 'text') == 'tinymce':
+    from tinymce.models import HTMLField as BaseContentField
+else:
+    BaseContentField = models.TextField
+
+
+MARKER = '\x01'
+
+COMPRESSORS = {
+    'zlib': (lambda data: zlib.compress(data, 9), zlib.decompress),
+    'lzma': (lzma.compress, lzma.decompress),
+}
+
+# Compressing very short bodies costs more than it saves
+MIN_COMPRESS_LENGTH = 256
+
+
+def get_compression():
+    """The configured compression method, or None"""
+    method = getattr(settings, 'DOCVAULT_CONTENT_COMPRESSION', None)
+    if method and method not in COMPRESSORS:
+        raise ImproperlyConfigured(
+            f"DOCVAULT_CONTENT_COMPRESSION must be one of {', '.join(COMPRESSORS)} or None, not {method!r}"
+        )
+    return method or None
+
+
+def is_compressed(value):
+    return isinstance(value, str) and value.startswith(MARKER)
+
+
+def compress_text(text, method):
+    compress, _ = COMPRESSORS[method]
+    payload = base64.b64encode(compress(text.encode('utf-8'))).decode('ascii')
+    return f"{MARKER}{method}:{payload}"
+
+
+def decompress_text(value):
+    """Decode a stored value; plain text is returned unchanged"""
+    if not is_compressed(value):
+        return value
+    method, _, payload = value[1:].partition(':')
+    _, decompress = COMPRESSORS[method]
+    return decompress(base64.b64decode(payload)).decode('utf-8')
+
+
+class CompressedContentDescriptor(DeferredAttribute):
+    """Decompresses the stored value on first access and keeps the text"""
+
+    def __get__(self, instance, cls=None):
+        value = super().__get__(instance, cls)
+        if instance is not None and is_compressed(value):
+            value = instance.__dict__[self.field.attname] = decompress_text(value)
+        return value
+
+
+class CompressedContentField(BaseContentField):
+    """
+    Content field that compresses on write when DOCVAULT_CONTENT_COMPRESSION
+    is set. Reading always understands both compressed and plain values.
+    ``compressible=False`` keeps a column plain, e.g. one searched in SQL.
+    """
+    descriptor_class = CompressedContentDescriptor
+
+    def __init__(self, *args, compressible=True, **kwargs):
+        self.compressible = compressible
+        super().__init__(*args, **kwargs)
+
+    def deconstruct(self):
+        # Compression is a runtime choice, not part of the schema
+        name, path, args, kwargs = super().deconstruct()
+        return name, 'django.db.models.TextField', args, kwargs
+
+    def encode(self, value):
+        """The stored form of a text value under the current setting"""
+        method = get_compression()
+        if method and self.compressible and isinstance(value, str) and not is_compressed(value) \
+                and len(value) >= MIN_COMPRESS_LENGTH:
+            compressed = compress_text(value, method)
+            if len(compressed) < len(value):
+                return compressed
+        return value
+
+    def get_db_prep_save(self, value, connection):
+        # Only writes are compressed; lookups such as icontains use the raw text
+        return super().get_db_prep_save(self.encode(value), connection)
+
+
+class TSVectorField(models.Field):
+    """
+    A ``tsvector`` column on PostgreSQL. Other databases get a text column
+    that stays empty, so the schema is the same everywhere and the app does
+    not need psycopg unless the PostgreSQL search backend is used.
+    """
+    description = 'PostgreSQL text search vector'
+
+    def db_type(self, connection):
+        return 'tsvector' if connection.vendor == 'postgresql' else 'text'
+
+
+@TSVectorField.register_lookup
+class TSVectorMatch(Lookup):
+    """``vector__matches=SearchQuery(...)`` compiles to ``vector @@ query``"""
+    lookup_name = 'matches'
+
+    def as_sql(self, compiler, connection):
+        lhs, lhs_params = self.process_lhs(compiler, connection)
+        rhs, rhs_params = self.process_rhs(compiler, connection)
+        return f'{lhs} @@ {rhs}', (*lhs_params, *rhs_params)
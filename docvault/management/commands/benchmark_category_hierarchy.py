@@ -0,0 +1,116 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext, override_settings
+from docvault.models import Document, DocumentCategory
+from docvault.tree import bump_generation
+
+
+class Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = 'Compare the materialized path and closure table hierarchy backends on deep and wide trees'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--depth',
+            type=int,
+            default=50,
+            help='Length of the chain used for the deep tree',
+        )
+        parser.add_argument(
+            '--width',
+            type=int,
+            default=50,
+            help='Children per root child in the wide tree (root -> width -> width)',
+        )
+        parser.add_argument(
+            '--iterations',
+            type=int,
+            default=50,
+            help='Number of times each query is repeated',
+        )
+
+    def handle(self, *args, **options):
+        self.iterations = options['iterations']
+
+        # Everything runs inside a transaction that is rolled back at the end
+        try:
+            with transaction.atomic():
+                self.stdout.write(f'Building deep tree ({options["depth"]} levels)...')
+                deep = self._build_deep(options['depth'])
+                self.stdout.write(f'Building wide tree ({options["width"]} x {options["width"]})...')
+                wide = self._build_wide(options['width'])
+
+                # Hierarchy methods prefer a loaded tree snapshot; drop it so the
+                # database backends are measured
+                bump_generation()
+
+                self._run('Deep tree', deep)
+                self._run('Wide tree', wide)
+                raise Rollback
+        except Rollback:
+            pass
+
+        self.stdout.write(self.style.SUCCESS('Benchmark finished, test data rolled back'))
+
+    def _build_deep(self, depth):
+        chain = [DocumentCategory.objects.create(name='Benchmark deep', slug='benchmark-deep')]
+        for level in range(1, depth):
+            chain.append(DocumentCategory.objects.create(name=f'Level {level}', slug=f'level-{level}', parent=chain[-1]))
+        self._add_documents([chain[0], chain[-1]])
+        return {'root': chain[0], 'leaf': chain[-1], 'middle': chain[len(chain) // 2]}
+
+    def _build_wide(self, width):
+        root = DocumentCategory.objects.create(name='Benchmark wide', slug='benchmark-wide')
+        leaf = middle = None
+        for index in range(width):
+            middle = DocumentCategory.objects.create(name=f'Branch {index}', slug=f'branch-{index}', parent=root)
+            for leaf_index in range(width):
+                leaf = DocumentCategory.objects.create(name=f'Leaf {leaf_index}', slug=f'leaf-{leaf_index}', parent=middle)
+        self._add_documents(DocumentCategory.objects.filter(path__startswith=f'{root.path}.'))
+        return {'root': root, 'leaf': leaf, 'middle': middle}
+
+    def _add_documents(self, categories):
+        Document.objects.bulk_create([
+            Document(title=f'Benchmark {category.pk}', slug=f'benchmark-{category.pk}', content='', category=category)
+            for category in categories
+        ])
+
+    def _run(self, label, nodes):
+        self.stdout.write('\n' + '=' * 70)
+        self.stdout.write(label)
+        self.stdout.write('=' * 70)
+        self.stdout.write(f'{"operation":<40}{"path":>15}{"closure":>15}')
+
+        operations = [
+            ('ancestors of leaf', lambda: list(nodes['leaf'].get_ancestors())),
+            ('descendants of root', lambda: list(nodes['root'].get_descendants())),
+            ('descendants of middle', lambda: list(nodes['middle'].get_descendants())),
+            ('all documents below root', lambda: list(nodes['root'].get_all_documents().values_list('id', flat=True))),
+        ]
+        for name, operation in operations:
+            timings = [self._measure(backend, operation) for backend in ('path', 'closure')]
+            self.stdout.write(f'{name:<40}' + ''.join(f'{timing:>15}' for timing in timings))
+
+        # A move touches every row below the moved node in both structures
+        middle = nodes['middle']
+        start_time = time.perf_counter()
+        with CaptureQueriesContext(connection) as queries:
+            middle.move_to(nodes['root'] if middle.parent_id != nodes['root'].pk else None)
+        elapsed = (time.perf_counter() - start_time) * 1000
+        self.stdout.write(f'move middle subtree (both backends): {elapsed:.2f} ms, {len(queries)} queries')
+
+    def _measure(self, backend, operation):
+        with override_settings(DOCVAULT_HIERARCHY_BACKEND=backend):
+            operation()  # warm up
+            with CaptureQueriesContext(connection) as queries:
+                start_time = time.perf_counter()
+                for _ in range(self.iterations):
+                    operation()
+                elapsed = time.perf_counter() - start_time
+        per_call = elapsed * 1000 / self.iterations
+        return f'{per_call:.3f} ms/{len(queries) // self.iterations}q'
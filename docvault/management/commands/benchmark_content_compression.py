@@ -0,0 +1,110 @@
+import random
+import time
+
+from django.contrib.auth.models import AnonymousUser
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Avg
+from django.db.models.functions import Length
+from django.test import RequestFactory
+from django.test.utils import override_settings
+from django.urls import resolve
+from docvault.models import Document, DocumentCategory, DocumentVersion
+
+
+class Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = 'Measure stored row size and page latency without compression and with zlib and lzma'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--versions',
+            type=int,
+            default=50,
+            help='Number of versions created for the benchmark document',
+        )
+        parser.add_argument(
+            '--paragraphs',
+            type=int,
+            default=300,
+            help='Number of HTML paragraphs in the benchmark document',
+        )
+        parser.add_argument(
+            '--requests',
+            type=int,
+            default=50,
+            help='Number of page renders per version page and detail page',
+        )
+
+    def handle(self, *args, **options):
+        self.options = options
+        results = []
+
+        # Everything runs inside a transaction that is rolled back at the end
+        try:
+            with transaction.atomic():
+                category = DocumentCategory.objects.create(name='Benchmark compression', slug='benchmark-compression')
+                for method in (None, 'zlib', 'lzma'):
+                    with override_settings(DOCVAULT_CONTENT_COMPRESSION=method):
+                        results.append((method or 'none', self._run(category, method or 'none')))
+                raise Rollback
+        except Rollback:
+            pass
+
+        self.stdout.write('\n' + '=' * 80)
+        self.stdout.write(f'{"":<32}' + ''.join(f'{method:>16}' for method, _ in results))
+        self.stdout.write('=' * 80)
+        for label, key in (
+            ('average version row (chars)', 'row_size'),
+            ('write per version (ms)', 'write_ms'),
+            ('version page (ms)', 'version_page_ms'),
+            ('document page (ms)', 'detail_page_ms'),
+        ):
+            self.stdout.write(f'{label:<32}' + ''.join(f'{result[key]:>16,.2f}' for _, result in results))
+        self.stdout.write(self.style.SUCCESS('Benchmark finished, test data rolled back'))
+
+    def _run(self, category, method):
+        rng = random.Random(7)
+        words = ['deploy', 'rollback', 'service', 'cluster', 'verify', 'restart', 'config', 'alert', 'runbook']
+        paragraphs = [
+            f'<p>{" ".join(rng.choice(words) for _ in range(30))}</p>\n'
+            for _ in range(self.options['paragraphs'])
+        ]
+
+        start_time = time.perf_counter()
+        document = Document.objects.create(
+            title=f'Benchmark {method}', slug=f'benchmark-{method}', content=''.join(paragraphs), category=category
+        )
+        for _ in range(self.options['versions'] - 1):
+            paragraphs[rng.randrange(len(paragraphs))] = f'<p>{" ".join(rng.choice(words) for _ in range(30))}</p>\n'
+            document.content = ''.join(paragraphs)
+            document.save()
+        write_ms = (time.perf_counter() - start_time) * 1000 / self.options['versions']
+
+        row_size = DocumentVersion.objects.filter(document=document)\
+            .aggregate(size=Avg(Length('content')))['size'] or 0
+
+        return {
+            'row_size': row_size,
+            'write_ms': write_ms,
+            'version_page_ms': self._time_page(document.get_version_url(1)),
+            'detail_page_ms': self._time_page(document.get_absolute_url()),
+        }
+
+    def _time_page(self, url):
+        """Average time to resolve and render a page through its view"""
+        match = resolve(url)
+        factory = RequestFactory()
+        timings = []
+        for _ in range(self.options['requests']):
+            request = factory.get(url)
+            request.user = AnonymousUser()
+            start_time = time.perf_counter()
+            response = match.func(request, *match.args, **match.kwargs)
+            if hasattr(response, 'render'):
+                response.render()
+            timings.append((time.perf_counter() - start_time) * 1000)
+        return sum(timings) / len(timings)
@@ -0,0 +1,78 @@
+import random
+import time
+import tracemalloc
+
+from django.core.management.base import BaseCommand
+from docvault.diff import diff_lines, stream_word_diff
+
+
+class Command(BaseCommand):
+    help = 'Measure line and HTML word diff time and peak memory on large generated documents'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--size',
+            type=int,
+            default=1_000_000,
+            help='Approximate document size in characters (default: 1 MB)',
+        )
+        parser.add_argument(
+            '--edits',
+            default='10,300,3000',
+            help='Comma-separated numbers of edited paragraphs to benchmark',
+        )
+
+    def handle(self, *args, **options):
+        rng = random.Random(11)
+        words = ['deploy', 'rollback', 'service', 'cluster', 'verify', 'restart', 'config', 'alert', 'runbook']
+        paragraphs = []
+        size = 0
+        while size < options['size']:
+            paragraph = f'<p>{" ".join(rng.choice(words) for _ in range(20))} <strong>{len(paragraphs)}</strong></p>\n'
+            paragraphs.append(paragraph)
+            size += len(paragraph)
+        old = ''.join(paragraphs)
+        self.stdout.write(f'Document: {len(old):,} characters, {len(paragraphs):,} paragraphs')
+
+        self.stdout.write('\n' + '=' * 86)
+        self.stdout.write(f'{"edits":>8}{"mode":>8}{"time (ms)":>14}{"first chunk (ms)":>20}{"peak (KB)":>14}{"output (KB)":>14}{"coarse":>8}')
+        self.stdout.write('=' * 86)
+        for edits in [int(value) for value in options['edits'].split(',') if value.strip()]:
+            edited = list(paragraphs)
+            for index in rng.sample(range(len(edited)), min(edits, len(edited))):
+                tokens = edited[index].split(' ')
+                tokens[rng.randrange(1, len(tokens) - 1)] = 'changed'
+                edited[index] = ' '.join(tokens)
+            new = ''.join(edited)
+
+            for mode in ('lines', 'words'):
+                elapsed, first_chunk, output, coarse = self._run(mode, old, new)
+                # Memory is measured in a second pass; tracing slows the diff down
+                tracemalloc.start()
+                self._run(mode, old, new)
+                peak = tracemalloc.get_traced_memory()[1]
+                tracemalloc.stop()
+                self.stdout.write(
+                    f'{edits:>8}{mode:>8}{elapsed:>14,.1f}{first_chunk:>20,.1f}'
+                    f'{peak / 1024:>14,.0f}{output / 1024:>14,.0f}{"yes" if coarse else "no":>8}'
+                )
+        self.stdout.write(self.style.SUCCESS('Benchmark finished'))
+
+    def _run(self, mode, old, new):
+        """Return (total ms, ms to the first chunk, output characters, coarse)"""
+        start_time = time.perf_counter()
+        if mode == 'lines':
+            result = diff_lines(old, new)
+            elapsed = (time.perf_counter() - start_time) * 1000
+            output = sum(len(line[3]) for hunk in result['hunks'] for line in hunk['lines'])
+            return elapsed, elapsed, output, result['coarse']
+
+        first_chunk = None
+        output = 0
+        coarse = False
+        for chunk in stream_word_diff(old, new):
+            if first_chunk is None:
+                first_chunk = (time.perf_counter() - start_time) * 1000
+                coarse = 'differ too much' in chunk
+            output += len(chunk)
+        return (time.perf_counter() - start_time) * 1000, first_chunk or 0, output, coarse
@@ -0,0 +1,133 @@
+import random
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from docvault.models import Document, DocumentCategory
+from docvault.search import BACKENDS
+
+
+class Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = (
+        'Compare search backends on generated documents: indexing time and the time to fetch '
+        'the first page of results and count all of them'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--documents',
+            type=int,
+            default=10000,
+            help='Number of generated documents',
+        )
+        parser.add_argument(
+            '--words',
+            type=int,
+            default=300,
+            help='Words per document',
+        )
+        parser.add_argument(
+            '--vocabulary',
+            type=int,
+            default=20000,
+            help='Number of distinct words; word frequencies follow a Zipf distribution',
+        )
+        parser.add_argument(
+            '--backend',
+            action='append',
+            dest='backends',
+            choices=list(BACKENDS),
+            help='Backend to measure (may be repeated; default: basic, index and the native one for this database)',
+        )
+        parser.add_argument(
+            '--repeat',
+            type=int,
+            default=5,
+            help='Times each query is run; the average is reported',
+        )
+
+    def handle(self, *args, **options):
+        self.options = options
+        backends = options['backends'] or ['basic', 'index']
+        if not options['backends'] and connection.vendor in ('sqlite', 'postgresql'):
+            backends.append('sqlite' if connection.vendor == 'sqlite' else 'postgres')
+        for name in backends:
+            if name in ('sqlite', 'postgres') and connection.vendor != {'sqlite': 'sqlite', 'postgres': 'postgresql'}[name]:
+                raise CommandError(f'The {name} backend cannot run on {connection.vendor}')
+
+        rng = random.Random(42)
+        vocabulary = [f'word{rank}' for rank in range(options['vocabulary'])]
+        weights = [1 / (rank + 1) for rank in range(options['vocabulary'])]
+        # A very common, a moderately common and a rare word, and a two-word query
+        self.queries = ['word0', 'word100', f'word{options["vocabulary"] // 2}', 'word10 word50']
+
+        # Everything runs inside a transaction that is rolled back at the end
+        try:
+            with transaction.atomic():
+                category = DocumentCategory.objects.create(name='Benchmark search', slug='benchmark-search')
+                start_time = time.monotonic()
+                Document.objects.bulk_create([
+                    Document(
+                        title=' '.join(rng.choices(vocabulary, weights, k=5)),
+                        slug=f'benchmark-{index}',
+                        content='<p>' + ' '.join(rng.choices(vocabulary, weights, k=options['words'])) + '</p>',
+                        category=category,
+                    )
+                    for index in range(options['documents'])
+                ], batch_size=1000)
+                self.stdout.write(f'Generated {options["documents"]} documents in {time.monotonic() - start_time:.1f}s')
+
+                results = {name: self._run(BACKENDS[name]()) for name in backends}
+                raise Rollback
+        except Rollback:
+            pass
+
+        width = 30 + 16 * len(backends)
+        self.stdout.write('\n' + '=' * width)
+        self.stdout.write(f'{"":<30}' + ''.join(f'{name:>16}' for name in backends))
+        self.stdout.write('=' * width)
+        self.stdout.write(f'{"indexing per document":<30}' + ''.join(
+            f'{results[name]["index_ms"]:>13.2f} ms' if results[name]['index_ms'] is not None else f'{"-":>16}'
+            for name in backends
+        ))
+        for query in self.queries:
+            # basic matches substrings, so its counts differ from the word-based backends
+            self.stdout.write(f'{query!r:<30}' + ''.join(f'{results[name]["matches"][query]:>8,} matches' for name in backends))
+            for label, key in (('  first page', 'page_ms'), ('  count', 'count_ms')):
+                self.stdout.write(f'{label:<30}' + ''.join(
+                    f'{results[name][key][query]:>13.2f} ms' for name in backends
+                ))
+        self.stdout.write(self.style.SUCCESS('Benchmark finished, test data rolled back'))
+
+    def _run(self, backend):
+        name = type(backend).__name__
+        self.stdout.write(f'Measuring {name}')
+        backend.clear()
+
+        index_ms = None
+        if not isinstance(backend, BACKENDS['basic']):
+            start_time = time.perf_counter()
+            documents = Document.objects.filter(slug__startswith='benchmark-').only('pk', 'title', 'content')
+            for document in documents.iterator(chunk_size=500):
+                backend.index_document(document)
+            backend.finish_rebuild()
+            index_ms = (time.perf_counter() - start_time) * 1000 / self.options['documents']
+
+        page_ms, count_ms, matches = {}, {}, {}
+        for query in self.queries:
+            results = backend.search(query)
+            page_times, count_times = [], []
+            for _ in range(self.options['repeat']):
+                start_time = time.perf_counter()
+                list(results.all()[:20])
+                page_times.append((time.perf_counter() - start_time) * 1000)
+                start_time = time.perf_counter()
+                matches[query] = results.count()
+                count_times.append((time.perf_counter() - start_time) * 1000)
+            page_ms[query] = sum(page_times) / len(page_times)
+            count_ms[query] = sum(count_times) / len(count_times)
+        return {'index_ms': index_ms, 'page_ms': page_ms, 'count_ms': count_ms, 'matches': matches}
@@ -0,0 +1,118 @@
+import random
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.db.models import Sum
+from django.db.models.functions import Length
+from django.test.utils import CaptureQueriesContext, override_settings
+from docvault.models import Document, DocumentCategory, DocumentVersion
+
+
+class Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = 'Compare full and reverse-delta version storage: stored size, write time and reconstruction latency'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--versions',
+            type=int,
+            default=200,
+            help='Number of edits made to the benchmark document',
+        )
+        parser.add_argument(
+            '--lines',
+            type=int,
+            default=500,
+            help='Number of lines in the benchmark document',
+        )
+        parser.add_argument(
+            '--edits',
+            type=int,
+            default=3,
+            help='Lines changed per edit',
+        )
+        parser.add_argument(
+            '--keyframe-interval',
+            type=int,
+            default=10,
+            help='Keyframe interval used for delta storage',
+        )
+        parser.add_argument(
+            '--samples',
+            type=int,
+            default=50,
+            help='Number of random versions read back per mode',
+        )
+
+    def handle(self, *args, **options):
+        self.options = options
+
+        # Everything runs inside a transaction that is rolled back at the end
+        try:
+            with transaction.atomic():
+                category = DocumentCategory.objects.create(name='Benchmark versions', slug='benchmark-versions')
+                results = [self._run(category, mode) for mode in ('full', 'delta')]
+                raise Rollback
+        except Rollback:
+            pass
+
+        self.stdout.write('\n' + '=' * 70)
+        self.stdout.write(f'{"":<30}{"full":>20}{"delta":>20}')
+        self.stdout.write('=' * 70)
+        for label, key, unit in (
+            ('stored characters', 'stored', ''),
+            ('write time per version', 'write_ms', ' ms'),
+            ('read latency (average)', 'read_avg_ms', ' ms'),
+            ('read latency (worst)', 'read_max_ms', ' ms'),
+            ('queries per read', 'read_queries', ''),
+        ):
+            values = [f'{result[key]:,.2f}{unit}' if isinstance(result[key], float) else f'{result[key]:,}{unit}'
+                      for result in results]
+            self.stdout.write(f'{label:<30}' + ''.join(f'{value:>20}' for value in values))
+
+        full, delta = results
+        if full['stored']:
+            self.stdout.write(f'\nDelta storage uses {delta["stored"] / full["stored"]:.1%} of the full-snapshot size')
+        self.stdout.write(self.style.SUCCESS('Benchmark finished, test data rolled back'))
+
+    def _run(self, category, mode):
+        rng = random.Random(42)
+        lines = [f'<p>Step {index}: {rng.randrange(10 ** 8)}</p>\n' for index in range(self.options['lines'])]
+
+        with override_settings(
+            DOCVAULT_VERSION_STORAGE=mode,
+            DOCVAULT_VERSION_KEYFRAME_INTERVAL=self.options['keyframe_interval'],
+        ):
+            start_time = time.perf_counter()
+            document = Document.objects.create(
+                title=f'Benchmark {mode}', slug=f'benchmark-{mode}', content=''.join(lines), category=category
+            )
+            for _ in range(self.options['versions']):
+                for _ in range(self.options['edits']):
+                    lines[rng.randrange(len(lines))] = f'<p>Edited: {rng.randrange(10 ** 8)}</p>\n'
+                document.content = ''.join(lines)
+                document.save()
+            write_ms = (time.perf_counter() - start_time) * 1000 / (self.options['versions'] + 1)
+
+            versions = DocumentVersion.objects.filter(document=document)
+            stored = versions.aggregate(size=Sum(Length('content')) + Sum(Length('delta')))['size'] or 0
+
+            numbers = list(versions.values_list('version_number', flat=True))
+            timings = []
+            with CaptureQueriesContext(connection) as queries:
+                for version_number in rng.sample(numbers, min(self.options['samples'], len(numbers))):
+                    start_time = time.perf_counter()
+                    versions.get(version_number=version_number).content
+                    timings.append((time.perf_counter() - start_time) * 1000)
+
+        return {
+            'stored': stored,
+            'write_ms': write_ms,
+            'read_avg_ms': sum(timings) / len(timings),
+            'read_max_ms': max(timings),
+            'read_queries': round(len(queries) / len(timings), 2),
+        }
@@ -0,0 +1,46 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Sum
+from docvault.models import ContentBlob
+
+
+class Command(BaseCommand):
+    help = 'Delete content blobs that no version references any more'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--recount',
+            action='store_true',
+            help='Recompute every reference count from the versions before collecting',
+        )
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Show what would be done without making changes',
+        )
+
+    def handle(self, *args, **options):
+        dry_run = options['dry_run']
+
+        if dry_run:
+            self.stdout.write(self.style.WARNING('DRY RUN MODE - No changes will be made'))
+
+        with transaction.atomic():
+            if options['recount']:
+                updated = ContentBlob.recount()
+                self.stdout.write(f'Recounted references of {updated} blobs')
+
+            # The reference check guards against counts that drifted low
+            garbage = ContentBlob.objects.filter(ref_count=0, versions__isnull=True)
+            stats = garbage.aggregate(size=Sum('size'))
+            count = garbage.count()
+
+            if not dry_run:
+                garbage.delete()
+
+            if dry_run:
+                transaction.set_rollback(True)
+
+        prefix = 'Would delete' if dry_run else 'Deleted'
+        self.stdout.write(f'{prefix} {count} unreferenced blobs ({stats["size"] or 0:,} characters)')
+        self.stdout.write(self.style.SUCCESS('Dry run completed' if dry_run else 'Successfully collected content blobs'))
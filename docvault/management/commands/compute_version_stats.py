@@ -0,0 +1,85 @@
+import time
+
+from django.core.management.base import BaseCommand
+from docvault.delta import apply_delta
+from docvault.fields import decompress_text
+from docvault.models import Document, DocumentVersion
+
+
+class Command(BaseCommand):
+    help = 'Compute size, hash and lines/words changed for versions that do not have them yet'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--all',
+            action='store_true',
+            help='Recompute statistics for every version, not only missing ones',
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=500,
+            help='Number of versions written per bulk_update',
+        )
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Show what would be done without making changes',
+        )
+
+    def handle(self, *args, **options):
+        recompute = options['all']
+        dry_run = options['dry_run']
+
+        if dry_run:
+            self.stdout.write(self.style.WARNING('DRY RUN MODE - No changes will be made'))
+
+        start_time = time.monotonic()
+        documents = Document.objects.order_by('pk')
+        if not recompute:
+            documents = documents.filter(versions__lines_added__isnull=True).distinct()
+        document_ids = list(documents.values_list('pk', flat=True))
+        self.stdout.write(f'Computing version statistics for {len(document_ids)} documents')
+
+        computed = 0
+        for index, document_id in enumerate(document_ids, 1):
+            changed = self._compute_document(document_id, recompute)
+            computed += len(changed)
+            if changed and not dry_run:
+                DocumentVersion.objects.bulk_update(changed, DocumentVersion.STATS_FIELDS, batch_size=options['batch_size'])
+
+            if index % 100 == 0 or index == len(document_ids):
+                self.stdout.write(f'  {index}/{len(document_ids)} documents, {computed} versions')
+
+        elapsed = time.monotonic() - start_time
+        prefix = 'Would compute' if dry_run else 'Computed'
+        self.stdout.write(f'{prefix} statistics for {computed} versions in {elapsed:.2f}s')
+        self.stdout.write(self.style.SUCCESS('Dry run completed' if dry_run else 'Successfully computed version statistics'))
+
+    def _compute_document(self, document_id, recompute):
+        """Statistics for one document's versions, rebuilding bodies newest first"""
+        rows = DocumentVersion.objects.filter(document_id=document_id).order_by('-version_number')\
+            .values_list('pk', 'version_number', 'storage', 'content', 'delta', 'blob__content', 'lines_added')
+
+        changed = []
+        # The newer version waits until its predecessor's body is known
+        pending = None
+        newer_content = None
+        for pk, version_number, storage, content, delta, blob_content, lines_added in rows.iterator(chunk_size=100):
+            if storage == DocumentVersion.STORAGE_BLOB:
+                content = decompress_text(blob_content)
+            elif storage == DocumentVersion.STORAGE_DELTA:
+                if newer_content is None:
+                    raise ValueError(f'Version {version_number} of document {document_id} has no full snapshot to rebuild from')
+                content = apply_delta(newer_content, delta)
+            else:
+                content = decompress_text(content)
+
+            if pending is not None:
+                changed.append(DocumentVersion(pk=pending[0], **DocumentVersion.measure(pending[1], content)))
+            pending = (pk, content) if recompute or lines_added is None else None
+            newer_content = content
+
+        if pending is not None:
+            changed.append(DocumentVersion(pk=pending[0], **DocumentVersion.measure(pending[1])))
+        return changed
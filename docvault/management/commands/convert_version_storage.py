@@ -0,0 +1,124 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from docvault.delta import make_delta, apply_delta
+from docvault.fields import decompress_text
+from docvault.models import ContentBlob, Document, DocumentVersion
+
+
+class Command(BaseCommand):
+    help = 'Convert existing version history between full snapshots and reverse-delta storage'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--to',
+            choices=['delta', 'full'],
+            default='delta',
+            help='Target storage mode (default: delta)',
+        )
+        parser.add_argument(
+            '--keyframe-interval',
+            type=int,
+            default=None,
+            help='Keep every Nth version as a full snapshot (default: DOCVAULT_VERSION_KEYFRAME_INTERVAL)',
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=500,
+            help='Number of versions written per bulk_update',
+        )
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Show what would be done without making changes',
+        )
+
+    def handle(self, *args, **options):
+        to_delta = options['to'] == 'delta'
+        interval = max(1, options['keyframe_interval'] or DocumentVersion.get_keyframe_interval())
+        batch_size = options['batch_size']
+        dry_run = options['dry_run']
+
+        if dry_run:
+            self.stdout.write(self.style.WARNING('DRY RUN MODE - No changes will be made'))
+
+        start_time = time.monotonic()
+        document_ids = list(Document.objects.order_by('pk').values_list('pk', flat=True))
+        self.stdout.write(f'Converting the history of {len(document_ids)} documents to {options["to"]} storage')
+
+        bytes_before = bytes_after = converted = 0
+        for index, document_id in enumerate(document_ids, 1):
+            before, after, changed = self._convert_document(document_id, to_delta, interval, batch_size, dry_run)
+            bytes_before += before
+            bytes_after += after
+            converted += changed
+
+            if index % 100 == 0 or index == len(document_ids):
+                self.stdout.write(f'  {index}/{len(document_ids)} documents, {converted} versions rewritten')
+
+        elapsed = time.monotonic() - start_time
+        ratio = bytes_after / bytes_before if bytes_before else 1
+        prefix = 'Would rewrite' if dry_run else 'Rewrote'
+        self.stdout.write(
+            f'{prefix} {converted} versions in {elapsed:.2f}s; stored history '
+            f'{bytes_before:,} -> {bytes_after:,} characters ({ratio:.1%})'
+        )
+        self.stdout.write(self.style.SUCCESS('Dry run completed' if dry_run else 'Successfully converted version storage'))
+
+    def _convert_document(self, document_id, to_delta, interval, batch_size, dry_run):
+        """Rewrite one document's versions; returns (size before, size after, rows changed)"""
+        rows = list(
+            DocumentVersion.objects.filter(document_id=document_id)
+            .order_by('-version_number')
+            .values_list('pk', 'version_number', 'storage', 'content', 'delta', 'blob_id', 'blob__content')
+        )
+
+        # Rebuild every body newest first; each delta applies to the next newer body
+        bodies = []
+        newer_content = None
+        for pk, version_number, storage, content, delta, blob_id, blob_content in rows:
+            if storage == DocumentVersion.STORAGE_BLOB:
+                content = decompress_text(blob_content)
+            elif storage == DocumentVersion.STORAGE_DELTA:
+                if newer_content is None:
+                    raise ValueError(f'Version {version_number} of document {document_id} has no full snapshot to rebuild from')
+                content = apply_delta(newer_content, delta)
+            else:
+                content = decompress_text(content)
+            bodies.append(content)
+            newer_content = content
+
+        changed = []
+        released_blob_ids = []
+        size_before = size_after = 0
+        for position, (pk, version_number, storage, content, delta, blob_id, _) in enumerate(rows):
+            body = bodies[position]
+            # Shared blobs are counted where they are stored, not per version
+            size_before += len(content) + len(delta)
+
+            # Snapshots already held in a blob stay there
+            if storage == DocumentVersion.STORAGE_BLOB:
+                target = (storage, '', '', blob_id)
+            else:
+                target = (DocumentVersion.STORAGE_FULL, body, '', None)
+            # The newest version and every keyframe stay whole
+            if to_delta and position > 0 and version_number % interval != 0:
+                new_delta = make_delta(bodies[position - 1], body)
+                if len(new_delta) < len(body):
+                    target = (DocumentVersion.STORAGE_DELTA, '', new_delta, None)
+
+            size_after += len(target[1]) + len(target[2])
+            if target != (storage, decompress_text(content), delta, blob_id):
+                changed.append(DocumentVersion(
+                    pk=pk, storage=target[0], content=target[1], delta=target[2], blob_id=target[3]
+                ))
+                if blob_id is not None and target[3] is None:
+                    released_blob_ids.append(blob_id)
+
+        if changed and not dry_run:
+            with transaction.atomic():
+                DocumentVersion.objects.bulk_update(changed, DocumentVersion.CONTENT_FIELDS, batch_size=batch_size)
+                ContentBlob.recount(ContentBlob.objects.filter(pk__in=released_blob_ids))
+        return size_before, size_after, len(changed)
@@ -0,0 +1,92 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from docvault.fields import decompress_text
+from docvault.models import ContentBlob, DocumentVersion
+
+
+class Command(BaseCommand):
+    help = 'Move full version snapshots into deduplicated, content-addressed blobs'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=500,
+            help='Number of versions processed per batch',
+        )
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Show what would be done without making changes',
+        )
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        dry_run = options['dry_run']
+
+        if dry_run:
+            self.stdout.write(self.style.WARNING('DRY RUN MODE - No changes will be made'))
+
+        start_time = time.monotonic()
+        version_ids = list(
+            DocumentVersion.objects.filter(storage=DocumentVersion.STORAGE_FULL)
+            .order_by('pk').values_list('pk', flat=True)
+        )
+        self.stdout.write(f'Found {len(version_ids)} versions stored inline')
+
+        moved = new_blobs = characters_before = characters_after = 0
+        seen_hashes = set()
+        for start in range(0, len(version_ids), batch_size):
+            rows = DocumentVersion.objects.filter(pk__in=version_ids[start:start + batch_size])\
+                .values_list('pk', 'content')
+            bodies = {pk: decompress_text(content) for pk, content in rows}
+            hashes = {pk: (ContentBlob.hash_content(content), content) for pk, content in bodies.items()}
+
+            # Only bodies not stored in a blob yet (or earlier in this run) take new space
+            existing = set(ContentBlob.objects.filter(
+                hash__in={content_hash for content_hash, _ in hashes.values()}
+            ).values_list('hash', flat=True))
+            for content_hash, content in hashes.values():
+                characters_before += len(content)
+                if content_hash not in existing and content_hash not in seen_hashes:
+                    seen_hashes.add(content_hash)
+                    characters_after += len(content)
+                    new_blobs += 1
+            moved += len(hashes)
+
+            if not dry_run:
+                self._move_batch(hashes)
+
+            self.stdout.write(f'  {min(start + batch_size, len(version_ids))}/{len(version_ids)} versions')
+
+        elapsed = time.monotonic() - start_time
+        prefix = 'Would move' if dry_run else 'Moved'
+        self.stdout.write(
+            f'{prefix} {moved} versions into {new_blobs} new blobs in {elapsed:.2f}s; '
+            f'{characters_before:,} -> {characters_after:,} characters'
+        )
+        self.stdout.write(self.style.SUCCESS('Dry run completed' if dry_run else 'Successfully deduplicated version content'))
+
+    def _move_batch(self, hashes):
+        with transaction.atomic():
+            ContentBlob.objects.bulk_create(
+                [
+                    ContentBlob(hash=content_hash, content=content, size=len(content))
+                    for content_hash, content in {value[0]: value[1] for value in hashes.values()}.items()
+                ],
+                ignore_conflicts=True,
+            )
+            blob_ids = dict(ContentBlob.objects.filter(
+                hash__in={content_hash for content_hash, _ in hashes.values()}
+            ).values_list('hash', 'pk'))
+
+            DocumentVersion.objects.bulk_update(
+                [
+                    DocumentVersion(pk=pk, storage=DocumentVersion.STORAGE_BLOB, content='', blob_id=blob_ids[content_hash])
+                    for pk, (content_hash, _) in hashes.items()
+                ],
+                ['storage', 'content', 'blob'],
+            )
+            ContentBlob.recount(ContentBlob.objects.filter(pk__in=blob_ids.values()))
@@ -0,0 +1,62 @@
+import time
+
+from django.core.management.base import BaseCommand
+from docvault.tasks import process_tasks, queue_stats
+
+
+class Command(BaseCommand):
+    help = 'Run queued post-save tasks (search indexing, version statistics, table of contents cache)'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--once',
+            action='store_true',
+            help='Run the tasks that are due now and exit instead of polling',
+        )
+        parser.add_argument(
+            '--interval',
+            type=float,
+            default=5,
+            help='Seconds to wait between polls when the queue is empty (default: 5)',
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=100,
+            help='Number of tasks claimed at a time',
+        )
+        parser.add_argument(
+            '--stats',
+            action='store_true',
+            help='Only print queue depth, lag and failing tasks',
+        )
+
+    def handle(self, *args, **options):
+        if options['stats']:
+            self._write_stats()
+            return
+
+        self._write_stats()
+        while True:
+            start_time = time.monotonic()
+            succeeded, failed = process_tasks(batch_size=options['batch_size'])
+            if succeeded or failed:
+                elapsed = time.monotonic() - start_time
+                self.stdout.write(f'Ran {succeeded + failed} tasks ({failed} failed) in {elapsed:.2f}s')
+            if options['once']:
+                break
+            time.sleep(options['interval'])
+
+        self._write_stats()
+        self.stdout.write(self.style.SUCCESS('Task queue drained'))
+
+    def _write_stats(self):
+        stats = queue_stats()
+        self.stdout.write(
+            f'Queue: {stats["depth"]} tasks, {stats["failing"]} failing, oldest waiting {stats["lag"]:.1f}s'
+        )
+        for kind, kind_stats in stats['kinds'].items():
+            self.stdout.write(
+                f'  {kind:<20}{kind_stats["depth"]:>8} tasks{kind_stats["failing"]:>6} failing'
+                f'{kind_stats["lag"]:>10.1f}s lag'
+            )
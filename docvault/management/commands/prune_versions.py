@@ -0,0 +1,227 @@
+from datetime import timedelta
+import gzip
+import json
+import lzma
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils import timezone
+from docvault.delta import make_delta, apply_delta
+from docvault.fields import decompress_text
+from docvault.models import Changelog, Document, DocumentVersion
+from docvault.signals import history_repair_disabled
+
+
+# Pruned versions deleted per statement; the delete signals load each row
+DELETE_BATCH_SIZE = 500
+
+
+def local_date(value):
+    return timezone.localtime(value).date() if timezone.is_aware(value) else value.date()
+
+
+class Command(BaseCommand):
+    help = (
+        'Prune old document versions: keep the newest ones, daily and weekly checkpoints and '
+        'versions linked from a changelog entry, and squash the rest into the next kept version'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--keep-last',
+            type=int,
+            default=getattr(settings, 'DOCVAULT_RETENTION_KEEP_LAST', 20),
+            help='Number of newest versions always kept (default: DOCVAULT_RETENTION_KEEP_LAST or 20)',
+        )
+        parser.add_argument(
+            '--keep-daily',
+            type=int,
+            default=getattr(settings, 'DOCVAULT_RETENTION_KEEP_DAILY', 30),
+            help='Keep the last version of each of the last N days (default: 30)',
+        )
+        parser.add_argument(
+            '--keep-weekly',
+            type=int,
+            default=getattr(settings, 'DOCVAULT_RETENTION_KEEP_WEEKLY', 52),
+            help='Keep the last version of each of the last N weeks (default: 52)',
+        )
+        parser.add_argument(
+            '--archive',
+            help='Append pruned version bodies as JSON lines to this gzip (or .xz) file',
+        )
+        parser.add_argument(
+            '--document',
+            type=int,
+            action='append',
+            dest='documents',
+            help='Only prune this document (may be repeated)',
+        )
+        parser.add_argument(
+            '--start-after',
+            type=int,
+            default=0,
+            help='Resume after this document id (printed as progress)',
+        )
+        parser.add_argument(
+            '--pause',
+            type=float,
+            default=0,
+            help='Seconds to sleep between documents to reduce load on a live database',
+        )
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Show what would be done without making changes',
+        )
+
+    def handle(self, *args, **options):
+        if options['keep_last'] < 1:
+            raise CommandError('--keep-last must be at least 1; the newest version is always kept')
+        self.options = options
+        dry_run = options['dry_run']
+
+        if dry_run:
+            self.stdout.write(self.style.WARNING('DRY RUN MODE - No changes will be made'))
+
+        start_time = time.monotonic()
+        documents = Document.objects.filter(pk__gt=options['start_after'])
+        if options['documents']:
+            documents = documents.filter(pk__in=options['documents'])
+        # Documents with no more versions than are always kept have nothing to prune
+        document_ids = list(
+            documents.filter(version_count__gt=options['keep_last']).order_by('pk').values_list('pk', flat=True)
+        )
+        self.stdout.write(f'Checking {len(document_ids)} documents')
+
+        archive = None
+        if options['archive'] and not dry_run:
+            opener = lzma.open if options['archive'].endswith('.xz') else gzip.open
+            archive = opener(options['archive'], 'at', encoding='utf-8')
+
+        pruned = characters = 0
+        try:
+            for index, document_id in enumerate(document_ids, 1):
+                # Each document is pruned in its own short transaction, so an
+                # interrupted run loses nothing and can simply be restarted
+                count, size = self._prune_document(document_id, archive, dry_run)
+                pruned += count
+                characters += size
+
+                if index % 100 == 0 or index == len(document_ids):
+                    self.stdout.write(
+                        f'  {index}/{len(document_ids)} documents, {pruned} versions pruned '
+                        f'(resume with --start-after {document_id})'
+                    )
+                if options['pause']:
+                    time.sleep(options['pause'])
+        finally:
+            if archive is not None:
+                archive.close()
+
+        elapsed = time.monotonic() - start_time
+        prefix = 'Would prune' if dry_run else 'Pruned'
+        self.stdout.write(f'{prefix} {pruned} versions ({characters:,} characters of content) in {elapsed:.2f}s')
+        self.stdout.write(self.style.SUCCESS('Dry run completed' if dry_run else 'Successfully pruned versions'))
+
+    def _kept_versions(self, document_id, versions):
+        """Ids of the versions the retention policy keeps; versions are newest first"""
+        keep = {pk for pk, _, _ in versions[:self.options['keep_last']]}
+        keep.update(
+            Changelog.objects.filter(document_id=document_id, version__isnull=False).values_list('version_id', flat=True)
+        )
+
+        today = local_date(timezone.now())
+        daily_since = today - timedelta(days=self.options['keep_daily'])
+        weekly_since = today - timedelta(weeks=self.options['keep_weekly'])
+        days = set()
+        weeks = set()
+        for pk, _, created_at in versions:
+            # The first version seen for a day or week is its last one
+            day = local_date(created_at)
+            if day > daily_since and day not in days:
+                days.add(day)
+                keep.add(pk)
+            week = day.isocalendar()[:2]
+            if day > weekly_since and week not in weeks:
+                weeks.add(week)
+                keep.add(pk)
+        return keep
+
+    def _prune_document(self, document_id, archive, dry_run):
+        """Prune one document; returns (versions pruned, characters pruned)"""
+        with transaction.atomic():
+            # Holds off new versions of this document until the history is consistent again
+            list(Document.objects.select_for_update().filter(pk=document_id).values_list('pk', flat=True))
+
+            versions = list(
+                DocumentVersion.objects.filter(document_id=document_id)
+                .order_by('-version_number').values_list('pk', 'version_number', 'created_at')
+            )
+            keep = self._kept_versions(document_id, versions)
+            if all(pk in keep for pk, _, _ in versions):
+                return 0, 0
+
+            rows = DocumentVersion.objects.filter(document_id=document_id).order_by('-version_number').values_list(
+                'pk', 'version_number', 'storage', 'content', 'delta', 'blob__content', 'created_at', 'created_by_id'
+            )
+            updates = []
+            delta_updates = []
+            pruned_ids = []
+            characters = 0
+            # Newest kept version seen so far and whether versions below it were pruned
+            kept = None
+            gap = False
+            newer_content = None
+            for pk, version_number, storage, content, delta, blob_content, created_at, created_by_id in rows.iterator(chunk_size=100):
+                if storage == DocumentVersion.STORAGE_BLOB:
+                    content = decompress_text(blob_content)
+                elif storage == DocumentVersion.STORAGE_DELTA:
+                    content = apply_delta(newer_content, delta)
+                else:
+                    content = decompress_text(content)
+                newer_content = content
+
+                if pk not in keep:
+                    pruned_ids.append(pk)
+                    characters += len(content)
+                    gap = True
+                    if archive is not None:
+                        archive.write(json.dumps({
+                            'document_id': document_id,
+                            'version_number': version_number,
+                            'created_at': created_at.isoformat(),
+                            'created_by_id': created_by_id,
+                            'content': content,
+                        }) + '\n')
+                    continue
+
+                if gap:
+                    # The newer kept version now squashes everything since this one
+                    updates.append(DocumentVersion(pk=kept[0], **DocumentVersion.measure(kept[1], content)))
+                    if storage == DocumentVersion.STORAGE_DELTA:
+                        # Its delta was made against a version that is going away
+                        delta_updates.append(DocumentVersion(pk=pk, delta=make_delta(kept[1], content)))
+                kept = (pk, content)
+                gap = False
+
+            if gap:
+                # The oldest versions were pruned; the oldest kept one now starts the history
+                updates.append(DocumentVersion(pk=kept[0], **DocumentVersion.measure(kept[1])))
+
+            if dry_run:
+                transaction.set_rollback(True)
+                return len(pruned_ids), characters
+
+            if archive is not None:
+                # Bodies are on disk before their rows are deleted
+                archive.flush()
+            DocumentVersion.objects.bulk_update(updates, DocumentVersion.STATS_FIELDS)
+            DocumentVersion.objects.bulk_update(delta_updates, ['delta'])
+            with history_repair_disabled():
+                for start in range(0, len(pruned_ids), DELETE_BATCH_SIZE):
+                    # Only the columns the post_delete handler reads, not the bodies
+                    DocumentVersion.objects.filter(pk__in=pruned_ids[start:start + DELETE_BATCH_SIZE])\
+                        .only('pk', 'document_id', 'blob_id').delete()
+        return len(pruned_ids), characters
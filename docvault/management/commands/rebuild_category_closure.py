@@ -0,0 +1,81 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from docvault.models import DocumentCategory, DocumentCategoryClosure
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the category closure table from the parent links'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Show what would be done without making changes',
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=1000,
+            help='Number of closure rows written or deleted per query',
+        )
+
+    def handle(self, *args, **options):
+        dry_run = options['dry_run']
+        batch_size = options['batch_size']
+
+        if dry_run:
+            self.stdout.write(self.style.WARNING('DRY RUN MODE - No changes will be made'))
+
+        start_time = time.monotonic()
+
+        parents = dict(DocumentCategory.objects.values_list('id', 'parent_id').iterator(chunk_size=batch_size))
+        self.stdout.write(f'Found {len(parents)} categories')
+
+        # Expected (ancestor, descendant) -> depth, walking up the parent links
+        expected = {}
+        cycles = []
+        for category_id in parents:
+            ancestor_id, depth, seen = category_id, 0, set()
+            while ancestor_id is not None:
+                if ancestor_id in seen:
+                    cycles.append(category_id)
+                    break
+                seen.add(ancestor_id)
+                expected[(ancestor_id, category_id)] = depth
+                ancestor_id, depth = parents.get(ancestor_id), depth + 1
+
+        stored = DocumentCategoryClosure.objects.values_list('id', 'ancestor_id', 'descendant_id', 'depth')
+        stale_ids = []
+        for link_id, ancestor_id, descendant_id, depth in stored.iterator(chunk_size=batch_size):
+            if expected.get((ancestor_id, descendant_id)) == depth:
+                del expected[(ancestor_id, descendant_id)]
+            else:
+                stale_ids.append(link_id)
+
+        if cycles:
+            self.stdout.write(self.style.ERROR(
+                f'{len(cycles)} categories are part of (or below) a parent cycle: ids {cycles[:10]}'
+            ))
+
+        if not dry_run:
+            with transaction.atomic():
+                for start in range(0, len(stale_ids), batch_size):
+                    DocumentCategoryClosure.objects.filter(id__in=stale_ids[start:start + batch_size]).delete()
+                # Rows with a wrong depth were deleted above, so recreating them cannot collide
+                DocumentCategoryClosure.objects.bulk_create(
+                    [
+                        DocumentCategoryClosure(ancestor_id=ancestor_id, descendant_id=descendant_id, depth=depth)
+                        for (ancestor_id, descendant_id), depth in expected.items()
+                    ],
+                    batch_size=batch_size,
+                )
+
+        elapsed = time.monotonic() - start_time
+        prefix = 'Would delete' if dry_run else 'Deleted'
+        self.stdout.write(
+            f'{prefix} {len(stale_ids)} stale rows and '
+            f'{"would create" if dry_run else "created"} {len(expected)} missing rows in {elapsed:.2f}s'
+        )
+        self.stdout.write(self.style.SUCCESS('Dry run completed' if dry_run else 'Successfully rebuilt the category closure table'))
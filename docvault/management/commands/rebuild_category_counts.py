@@ -0,0 +1,65 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count
+from docvault.counters import compute_category_counts
+from docvault.models import Document, DocumentCategory
+from docvault.tree import bump_generation
+
+
+class Command(BaseCommand):
+    help = 'Recompute the denormalized document and child counters of every category'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Show what would be done without making changes',
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=1000,
+            help='Number of categories written per bulk_update',
+        )
+
+    def handle(self, *args, **options):
+        dry_run = options['dry_run']
+        batch_size = options['batch_size']
+
+        if dry_run:
+            self.stdout.write(self.style.WARNING('DRY RUN MODE - No changes will be made'))
+
+        start_time = time.monotonic()
+
+        parents = dict(DocumentCategory.objects.values_list('id', 'parent_id').iterator(chunk_size=batch_size))
+        document_counts = dict(
+            Document.objects.order_by().values_list('category_id').annotate(count=Count('id'))
+        )
+        self.stdout.write(f'Found {len(parents)} categories and {sum(document_counts.values())} documents')
+
+        expected = compute_category_counts(parents, document_counts)
+
+        stored = DocumentCategory.objects.values_list('id', *DocumentCategory.COUNTER_FIELDS)
+        changed = []
+        for category_id, *counts in stored.iterator(chunk_size=batch_size):
+            if category_id in expected and tuple(counts) != expected[category_id]:
+                document_count, child_count, subtree_document_count = expected[category_id]
+                changed.append(DocumentCategory(
+                    id=category_id,
+                    document_count=document_count,
+                    child_count=child_count,
+                    subtree_document_count=subtree_document_count,
+                ))
+
+        if changed and not dry_run:
+            with transaction.atomic():
+                DocumentCategory.objects.bulk_update(changed, DocumentCategory.COUNTER_FIELDS, batch_size=batch_size)
+            # bulk_update sends no signals, so drop the cached tree explicitly
+            bump_generation()
+
+        elapsed = time.monotonic() - start_time
+        prefix = 'Would fix' if dry_run else 'Fixed'
+        self.stdout.write(f'{prefix} counters on {len(changed)} categories in {elapsed:.2f}s')
+        self.stdout.write(self.style.SUCCESS('Dry run completed' if dry_run else 'Successfully rebuilt category counters'))
@@ -1,6 +1,11 @@
+from array import array
+from bisect import bisect_left
+import time
+
 from django.core.management.base import BaseCommand
 from django.db import transaction
 from docvault.models import DocumentCategory
+from docvault.tree import bump_generation
 
 
 class Command(BaseCommand):
@@ -12,55 +17,211 @@ class Command(BaseCommand):
             action='store_true',
             help='Show what would be done without making changes',
         )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=1000,
+            help='Number of categories compared and written per bulk_update chunk',
+        )
 
     def handle(self, *args, **options):
         dry_run = options['dry_run']
-        
+        self.batch_size = options['batch_size']
+        self.verbosity = options['verbosity']
+
         if dry_run:
             self.stdout.write(self.style.WARNING('DRY RUN MODE - No changes will be made'))
-        
-        # Get all categories and sort by depth to ensure parents are processed first
-        categories = DocumentCategory.objects.all().order_by('depth', 'id')
-        
-        if not categories.exists():
+
+        start_time = time.monotonic()
+
+        # Load only (id, parent_id, slug) into compact arrays ordered by id.
+        # Parents are located with a binary search instead of an id -> row dict,
+        # which keeps memory bounded for very large forests.
+        ids = array('q')
+        parent_ids = array('q')
+        slugs = []
+
+        rows = DocumentCategory.objects.order_by('id').values_list('id', 'parent_id', 'slug')
+        for category_id, parent_id, slug in rows.iterator(chunk_size=self.batch_size):
+            ids.append(category_id)
+            parent_ids.append(parent_id if parent_id is not None else -1)
+            slugs.append(slug)
+
+        total = len(ids)
+        if not total:
             self.stdout.write(self.style.SUCCESS('No categories found'))
             return
-        
-        self.stdout.write(f'Found {categories.count()} categories')
-        
+
+        self.stdout.write(f'Found {total} categories')
+
+        # Resolve parent ids to row indexes; -1 marks roots, -2 marks orphans
+        parents = array('q', bytes(8 * total))
+        child_counts = array('q', bytes(8 * (total + 1)))
+        roots = []
+        orphans = []
+        for index in range(total):
+            parent_id = parent_ids[index]
+            if parent_id == -1:
+                parents[index] = -1
+                roots.append(index)
+                continue
+
+            parent_index = bisect_left(ids, parent_id)
+            if parent_index < total and ids[parent_index] == parent_id:
+                parents[index] = parent_index
+                child_counts[parent_index + 1] += 1
+            else:
+                parents[index] = -2
+                orphans.append(index)
+        del parent_ids
+
+        # Children as a compressed adjacency list: the children of row i are
+        # children[offsets[i]:offsets[i + 1]]
+        offsets = child_counts
+        for index in range(total):
+            offsets[index + 1] += offsets[index]
+        cursor = array('q', offsets)
+        children = array('q', bytes(8 * total))
+        for index in range(total):
+            parent_index = parents[index]
+            if parent_index >= 0:
+                children[cursor[parent_index]] = index
+                cursor[parent_index] += 1
+        del cursor
+
+        self.processed = 0
+        self.updated = 0
+        self.pending = []
+        self.dry_run = dry_run
+        self.start_time = start_time
+        self.total = total
+
         with transaction.atomic():
-            for category in categories:
-                old_path = category.path
-                old_depth = category.depth
-                
-                # Calculate new values
-                if category.parent:
-                    new_depth = category.parent.depth + 1
-                    new_path = f"{category.parent.path}.{category.id}"
-                else:
-                    new_depth = 0
-                    new_path = str(category.id)
-                
-                if old_path != new_path or old_depth != new_depth:
-                    if dry_run:
-                        self.stdout.write(
-                            f'Would update {category.name}: '
-                            f'path "{old_path}" -> "{new_path}", '
-                            f'depth {old_depth} -> {new_depth}'
-                        )
-                    else:
-                        category.path = new_path
-                        category.depth = new_depth
-                        category.save(update_fields=['path', 'depth'])
-                        self.stdout.write(
-                            f'Updated {category.name}: '
-                            f'path "{old_path}" -> "{new_path}", '
-                            f'depth {old_depth} -> {new_depth}'
-                        )
-                else:
-                    self.stdout.write(f'✓ {category.name} is correct')
-        
+            # Topological pass: depth-first from every root, keeping only the
+            # current branch in memory
+            visited = bytearray(total)
+            for root in roots:
+                self._walk(root, ids, slugs, offsets, children, visited)
+            self._flush()
+
+        # Rows never reached from a root either hang below an orphan or sit in a cycle
+        orphaned = 0
+        for orphan in orphans:
+            orphaned += self._mark_subtree(orphan, offsets, children, visited)
+        cycles = [ids[index] for index in range(total) if not visited[index]]
+
+        if orphans:
+            self.stdout.write(self.style.WARNING(
+                f'{len(orphans)} orphaned categories (missing parent) with {orphaned} rows in their '
+                f'subtrees were skipped: ids {self._sample([ids[index] for index in orphans])}'
+            ))
+        if cycles:
+            self.stdout.write(self.style.ERROR(
+                f'{len(cycles)} categories are part of (or below) a parent cycle and were skipped: '
+                f'ids {self._sample(cycles)}'
+            ))
+
+        elapsed = time.monotonic() - start_time
+        rate = self.processed / elapsed if elapsed else self.processed
+        action = 'Would update' if dry_run else 'Updated'
+        self.stdout.write(
+            f'{action} {self.updated} of {self.processed} categories '
+            f'in {elapsed:.2f}s ({rate:.0f} categories/s)'
+        )
+
         if not dry_run:
+            if self.updated:
+                # bulk_update bypasses signals, so drop the cached tree explicitly
+                bump_generation()
             self.stdout.write(self.style.SUCCESS('Successfully rebuilt all category paths'))
         else:
-            self.stdout.write(self.style.SUCCESS('Dry run completed')) 
\ No newline at end of file
+            self.stdout.write(self.style.SUCCESS('Dry run completed'))
+
+    def _walk(self, root, ids, slugs, offsets, children, visited):
+        """Iterative depth-first walk emitting (index, path, depth, url_path)"""
+        path, url_path = str(ids[root]), slugs[root]
+        visited[root] = 1
+        self._emit(ids[root], path, 0, url_path)
+
+        stack = [[root, offsets[root], path, url_path, 0]]
+        while stack:
+            frame = stack[-1]
+            node, position = frame[0], frame[1]
+            if position == offsets[node + 1]:
+                stack.pop()
+                continue
+            frame[1] += 1
+
+            child = children[position]
+            if visited[child]:
+                continue
+            visited[child] = 1
+
+            path = f"{frame[2]}.{ids[child]}"
+            url_path = f"{frame[3]}/{slugs[child]}"
+            depth = frame[4] + 1
+            self._emit(ids[child], path, depth, url_path)
+            stack.append([child, offsets[child], path, url_path, depth])
+
+    def _mark_subtree(self, root, offsets, children, visited):
+        """Mark every row below an orphan as visited and return how many there were"""
+        count = 0
+        stack = [root]
+        while stack:
+            node = stack.pop()
+            if visited[node]:
+                continue
+            visited[node] = 1
+            count += 1
+            stack.extend(children[offsets[node]:offsets[node + 1]])
+        return count
+
+    def _emit(self, category_id, path, depth, url_path):
+        self.pending.append((category_id, path, depth, url_path))
+        if len(self.pending) >= self.batch_size:
+            self._flush()
+
+    def _flush(self):
+        """Compare a chunk with the stored values and bulk_update the rows that differ"""
+        if not self.pending:
+            return
+
+        chunk = {category_id: values for category_id, *values in self.pending}
+        stored = DocumentCategory.objects.filter(id__in=chunk.keys())\
+            .values_list('id', 'name', 'path', 'depth', 'url_path')
+
+        changed = []
+        for category_id, name, old_path, old_depth, old_url_path in stored:
+            new_path, new_depth, new_url_path = chunk[category_id]
+            if (old_path, old_depth, old_url_path) == (new_path, new_depth, new_url_path):
+                if self.verbosity >= 2:
+                    self.stdout.write(f'✓ {name} is correct')
+                continue
+
+            if self.verbosity >= 2:
+                prefix = 'Would update' if self.dry_run else 'Updated'
+                self.stdout.write(
+                    f'{prefix} {name}: '
+                    f'path "{old_path}" -> "{new_path}", '
+                    f'depth {old_depth} -> {new_depth}, '
+                    f'url_path "{old_url_path}" -> "{new_url_path}"'
+                )
+            changed.append(DocumentCategory(id=category_id, path=new_path, depth=new_depth, url_path=new_url_path))
+
+        if changed and not self.dry_run:
+            DocumentCategory.objects.bulk_update(changed, ['path', 'depth', 'url_path'], batch_size=self.batch_size)
+
+        self.updated += len(changed)
+        self.processed += len(self.pending)
+        self.pending = []
+
+        elapsed = time.monotonic() - self.start_time
+        rate = self.processed / elapsed if elapsed else self.processed
+        self.stdout.write(
+            f'Processed {self.processed}/{self.total} '
+            f'({self.processed * 100 // self.total}%) - {rate:.0f} categories/s'
+        )
+
+    def _sample(self, values, limit=10):
+        sample = ', '.join(str(value) for value in values[:limit])
+        return f'{sample}, ...' if len(values) > limit else sample
@@ -0,0 +1,68 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from docvault.models import Document, SearchEntry
+from docvault.search import get_search_backend, source_hash
+
+
+class Command(BaseCommand):
+    help = (
+        'Index documents whose title or content changed since they were last indexed, '
+        'using the backend selected by DOCVAULT_SEARCH_BACKEND'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--clear',
+            action='store_true',
+            help='Drop the whole index first and index every document from scratch (needed after switching backends)',
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=200,
+            help='Number of documents loaded per query',
+        )
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Show what would be done without making changes',
+        )
+
+    def handle(self, *args, **options):
+        dry_run = options['dry_run']
+
+        if dry_run:
+            self.stdout.write(self.style.WARNING('DRY RUN MODE - No changes will be made'))
+
+        backend = get_search_backend()
+        self.stdout.write(f'Search backend: {type(backend).__name__}')
+
+        start_time = time.monotonic()
+        if options['clear'] and not dry_run:
+            with transaction.atomic():
+                backend.clear()
+            self.stdout.write('Cleared the search index')
+
+        indexed_hashes = {} if options['clear'] else dict(SearchEntry.objects.values_list('document_id', 'source_hash'))
+        total = Document.objects.count()
+        indexed = 0
+        documents = Document.objects.only('pk', 'title', 'content').order_by('pk')
+        for index, document in enumerate(documents.iterator(chunk_size=options['batch_size']), 1):
+            if dry_run:
+                indexed += indexed_hashes.get(document.pk) != source_hash(document.title, document.content)
+            else:
+                indexed += backend.index_document(document)
+
+            if index % 1000 == 0 or index == total:
+                self.stdout.write(f'  {index}/{total} documents, {indexed} indexed')
+
+        if not dry_run:
+            with transaction.atomic():
+                backend.finish_rebuild()
+
+        elapsed = time.monotonic() - start_time
+        prefix = 'Would index' if dry_run else 'Indexed'
+        self.stdout.write(f'{prefix} {indexed} of {total} documents in {elapsed:.2f}s')
+        self.stdout.write(self.style.SUCCESS('Dry run completed' if dry_run else 'Successfully rebuilt the search index'))
@@ -0,0 +1,79 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Sum
+from django.db.models.functions import Length
+from docvault.fields import decompress_text, get_compression
+from docvault.models import ContentBlob, Document, DocumentVersion
+
+
+class Command(BaseCommand):
+    help = (
+        'Rewrite stored content to match DOCVAULT_CONTENT_COMPRESSION: compress plain rows when it is set, '
+        'decompress compressed rows when it is not'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=500,
+            help='Number of rows read and written per chunk',
+        )
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Show what would be done without making changes',
+        )
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        dry_run = options['dry_run']
+
+        if dry_run:
+            self.stdout.write(self.style.WARNING('DRY RUN MODE - No changes will be made'))
+        self.stdout.write(f'Target compression: {get_compression() or "none"}')
+
+        for model in (Document, DocumentVersion, ContentBlob):
+            self._convert(model, batch_size, dry_run)
+
+        self.stdout.write(self.style.SUCCESS('Dry run completed' if dry_run else 'Successfully recompressed content'))
+
+    def _convert(self, model, batch_size, dry_run):
+        field = model._meta.get_field('content')
+        start_time = time.monotonic()
+        size_before = model.objects.aggregate(size=Sum(Length('content')))['size'] or 0
+
+        rewritten = size_after = last_pk = 0
+        while True:
+            # Keyset pagination keeps every chunk an indexed range scan
+            rows = list(
+                model.objects.filter(pk__gt=last_pk).order_by('pk')
+                .values_list('pk', 'content')[:batch_size]
+            )
+            if not rows:
+                break
+            last_pk = rows[-1][0]
+
+            changed = []
+            for pk, stored in rows:
+                text = decompress_text(stored)
+                encoded = field.encode(text)
+                size_after += len(encoded)
+                if encoded != stored:
+                    # The field encodes again on save, so hand it the plain text
+                    changed.append(model(pk=pk, content=text))
+
+            if changed and not dry_run:
+                with transaction.atomic():
+                    model.objects.bulk_update(changed, ['content'])
+            rewritten += len(changed)
+
+        elapsed = time.monotonic() - start_time
+        ratio = size_after / size_before if size_before else 1
+        prefix = 'would rewrite' if dry_run else 'rewrote'
+        self.stdout.write(
+            f'{model.__name__}: {prefix} {rewritten} rows in {elapsed:.2f}s; '
+            f'content {size_before:,} -> {size_after:,} characters ({ratio:.1%})'
+        )
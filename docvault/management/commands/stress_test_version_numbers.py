@@ -0,0 +1,116 @@
+from concurrent.futures import ThreadPoolExecutor
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import IntegrityError, OperationalError, connection, connections
+from docvault.models import Document, DocumentCategory, DocumentVersion
+
+
+class Command(BaseCommand):
+    help = (
+        'Save documents concurrently from a thread pool and check that version numbers are '
+        'allocated without gaps or unique_together violations. Intended for a file-backed '
+        'SQLite database (set OPTIONS["timeout"] so writers wait for the lock).'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--threads',
+            type=int,
+            default=8,
+            help='Number of concurrent editors',
+        )
+        parser.add_argument(
+            '--saves',
+            type=int,
+            default=50,
+            help='Number of content changes saved by each editor',
+        )
+        parser.add_argument(
+            '--documents',
+            type=int,
+            default=2,
+            help='Number of documents the editors share',
+        )
+        parser.add_argument(
+            '--keep',
+            action='store_true',
+            help='Keep the test documents instead of deleting them afterwards',
+        )
+
+    def handle(self, *args, **options):
+        if connection.vendor == 'sqlite' and connection.is_in_memory_db():
+            raise CommandError('An in-memory SQLite database cannot be shared between threads; use a file-backed one')
+
+        category = DocumentCategory.objects.create(name='Stress test', slug=f'stress-test-{time.time_ns()}')
+        documents = [
+            Document.objects.create(title=f'Stress {index}', slug=f'stress-{index}', content='start', category=category)
+            for index in range(options['documents'])
+        ]
+        document_ids = [document.pk for document in documents]
+
+        self.stdout.write(
+            f'{options["threads"]} threads x {options["saves"]} saves on {len(document_ids)} documents '
+            f'({connection.vendor})'
+        )
+        start_time = time.monotonic()
+        with ThreadPoolExecutor(max_workers=options['threads']) as pool:
+            results = list(pool.map(
+                lambda worker: self._edit(worker, document_ids, options['saves']),
+                range(options['threads']),
+            ))
+        elapsed = time.monotonic() - start_time
+
+        saved = sum(result['saved'] for result in results)
+        conflicts = sum(result['conflicts'] for result in results)
+        locked = sum(result['locked'] for result in results)
+        self.stdout.write(f'{saved} saves in {elapsed:.2f}s ({saved / elapsed:.0f}/s)')
+
+        problems = self._check(document_ids)
+        if conflicts:
+            problems.append(f'{conflicts} saves failed with a unique constraint violation')
+
+        if not options['keep']:
+            Document.objects.filter(pk__in=document_ids).delete()
+            category.delete()
+
+        if locked:
+            self.stdout.write(self.style.WARNING(f'{locked} saves gave up waiting for the database lock'))
+        if problems:
+            raise CommandError('\n'.join(problems))
+        self.stdout.write(self.style.SUCCESS('Version numbers are unique and contiguous'))
+
+    def _edit(self, worker, document_ids, saves):
+        """One editor: load a document, change its content, save, repeat"""
+        result = {'saved': 0, 'conflicts': 0, 'locked': 0}
+        try:
+            for index in range(saves):
+                document = Document.objects.get(pk=document_ids[(worker + index) % len(document_ids)])
+                document.content = f'worker {worker} edit {index}'
+                try:
+                    document.save()
+                    result['saved'] += 1
+                except IntegrityError:
+                    result['conflicts'] += 1
+                except OperationalError:
+                    result['locked'] += 1
+        finally:
+            # Each thread has its own connection
+            connections.close_all()
+        return result
+
+    def _check(self, document_ids):
+        problems = []
+        for document in Document.objects.filter(pk__in=document_ids):
+            numbers = sorted(DocumentVersion.objects.filter(document=document).values_list('version_number', flat=True))
+            if numbers != list(range(1, len(numbers) + 1)):
+                problems.append(f'Document {document.pk}: version numbers are not 1..{len(numbers)}')
+            if document.version_count != len(numbers) or document.last_version_number != len(numbers):
+                problems.append(
+                    f'Document {document.pk}: {len(numbers)} versions but version_count={document.version_count}, '
+                    f'last_version_number={document.last_version_number}'
+                )
+            latest = DocumentVersion.objects.filter(document=document).order_by('-version_number').first()
+            if latest is not None and document.latest_version_id != latest.pk:
+                problems.append(f'Document {document.pk}: latest_version does not point at v{latest.version_number}')
+        return problems
@@ -0,0 +1,79 @@
+from django.db import migrations, models
+
+
+def deduplicate_root_slugs(DocumentCategory):
+    """
+    unique_together (parent, slug) lets root categories share a slug, as
+    parent is NULL. Those roots could never be routed to, and their
+    url_paths would collide, so every one but the oldest gets "-<id>"
+    appended to its slug.
+    """
+    roots = DocumentCategory.objects.filter(parent__isnull=True)
+    taken = set(roots.values_list('slug', flat=True))
+    seen = set()
+    renamed = []
+    for category in roots.order_by('id').only('id', 'slug'):
+        if category.slug not in seen:
+            seen.add(category.slug)
+            continue
+        suffix, attempt = f"-{category.id}", 1
+        while f"{category.slug[:100 - len(suffix)]}{suffix}" in taken:
+            attempt += 1
+            suffix = f"-{category.id}-{attempt}"
+        category.slug = f"{category.slug[:100 - len(suffix)]}{suffix}"
+        taken.add(category.slug)
+        renamed.append(category)
+    DocumentCategory.objects.bulk_update(renamed, ['slug'], batch_size=500)
+
+
+def populate_url_paths(apps, schema_editor):
+    """Populate url_path from the slugs of each category and its ancestors"""
+    DocumentCategory = apps.get_model('docvault', 'DocumentCategory')
+    deduplicate_root_slugs(DocumentCategory)
+    
+    rows = {
+        category_id: (parent_id, slug)
+        for category_id, parent_id, slug in DocumentCategory.objects.values_list('id', 'parent_id', 'slug')
+    }
+    url_paths = {}
+    
+    def build(category_id):
+        if category_id not in url_paths:
+            parent_id, slug = rows[category_id]
+            url_paths[category_id] = f"{build(parent_id)}/{slug}" if parent_id else slug
+        return url_paths[category_id]
+    
+    categories = []
+    for category_id in rows:
+        categories.append(DocumentCategory(id=category_id, url_path=build(category_id)))
+    DocumentCategory.objects.bulk_update(categories, ['url_path'], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("docvault", "0008_rename_docvault_doc_path_idx_docvault_do_path_5fd166_idx_and_more"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="documentcategory",
+            name="url_path",
+            field=models.CharField(
+                default="",
+                help_text='Slug path used in URLs (e.g., "help-center/game/guides")',
+                max_length=500,
+            ),
+            preserve_default=False,
+        ),
+        migrations.RunPython(populate_url_paths, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name="documentcategory",
+            name="url_path",
+            field=models.CharField(
+                help_text='Slug path used in URLs (e.g., "help-center/game/guides")',
+                max_length=500,
+                unique=True,
+            ),
+        ),
+    ]
@@ -0,0 +1,47 @@
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def populate_closure(apps, schema_editor):
+    """Create the (ancestor, descendant, depth) rows from the parent links"""
+    DocumentCategory = apps.get_model('docvault', 'DocumentCategory')
+    DocumentCategoryClosure = apps.get_model('docvault', 'DocumentCategoryClosure')
+    
+    parents = dict(DocumentCategory.objects.values_list('id', 'parent_id'))
+    
+    links = []
+    for category_id in parents:
+        ancestor_id, depth, seen = category_id, 0, set()
+        while ancestor_id is not None and ancestor_id not in seen:
+            seen.add(ancestor_id)
+            links.append(DocumentCategoryClosure(ancestor_id=ancestor_id, descendant_id=category_id, depth=depth))
+            ancestor_id, depth = parents.get(ancestor_id), depth + 1
+        
+        if len(links) >= 1000:
+            DocumentCategoryClosure.objects.bulk_create(links)
+            links = []
+    DocumentCategoryClosure.objects.bulk_create(links)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("docvault", "0009_documentcategory_url_path"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="DocumentCategoryClosure",
+            fields=[
+                ("id", models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name="ID")),
+                ("depth", models.PositiveIntegerField(help_text="Distance from ancestor to descendant (0 for the category itself)")),
+                ("ancestor", models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name="descendant_links", to="docvault.documentcategory")),
+                ("descendant", models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name="ancestor_links", to="docvault.documentcategory")),
+            ],
+            options={
+                "indexes": [models.Index(fields=["descendant", "depth"], name="docvault_do_descend_2b1304_idx")],
+                "unique_together": {("ancestor", "descendant")},
+            },
+        ),
+        migrations.RunPython(populate_closure, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,56 @@
+from django.db import migrations, models
+
+
+def populate_counters(apps, schema_editor):
+    """Compute document, child and subtree document counts from the current rows"""
+    DocumentCategory = apps.get_model('docvault', 'DocumentCategory')
+    Document = apps.get_model('docvault', 'Document')
+    
+    parents = dict(DocumentCategory.objects.values_list('id', 'parent_id'))
+    document_counts = {}
+    for category_id in Document.objects.values_list('category_id', flat=True).iterator():
+        document_counts[category_id] = document_counts.get(category_id, 0) + 1
+    
+    counts = {category_id: [document_counts.get(category_id, 0), 0, 0] for category_id in parents}
+    for category_id, parent_id in parents.items():
+        if parent_id in counts:
+            counts[parent_id][1] += 1
+        ancestor_id, seen = category_id, set()
+        while ancestor_id in counts and ancestor_id not in seen:
+            seen.add(ancestor_id)
+            counts[ancestor_id][2] += counts[category_id][0]
+            ancestor_id = parents[ancestor_id]
+    
+    categories = [
+        DocumentCategory(id=category_id, document_count=documents, child_count=children, subtree_document_count=subtree)
+        for category_id, (documents, children, subtree) in counts.items()
+    ]
+    DocumentCategory.objects.bulk_update(
+        categories, ['document_count', 'child_count', 'subtree_document_count'], batch_size=500
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("docvault", "0010_documentcategoryclosure"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="documentcategory",
+            name="document_count",
+            field=models.PositiveIntegerField(default=0, editable=False, help_text="Documents directly in this category"),
+        ),
+        migrations.AddField(
+            model_name="documentcategory",
+            name="child_count",
+            field=models.PositiveIntegerField(default=0, editable=False, help_text="Direct child categories"),
+        ),
+        migrations.AddField(
+            model_name="documentcategory",
+            name="subtree_document_count",
+            field=models.PositiveIntegerField(default=0, editable=False, help_text="Documents in this category and all its descendants"),
+        ),
+        migrations.RunPython(populate_counters, migrations.RunPython.noop),
+    ]
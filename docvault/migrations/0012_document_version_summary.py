@@ -0,0 +1,47 @@
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def populate_version_summary(apps, schema_editor):
+    """Point every document at its newest version and store its version count"""
+    Document = apps.get_model('docvault', 'Document')
+    DocumentVersion = apps.get_model('docvault', 'DocumentVersion')
+    
+    versions = DocumentVersion.objects.filter(document=OuterRef('pk'))
+    Document.objects.update(
+        latest_version=Subquery(versions.order_by('-version_number').values('pk')[:1]),
+        version_count=Coalesce(
+            Subquery(versions.order_by().values('document').annotate(count=Count('pk')).values('count')[:1]),
+            0,
+        ),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("docvault", "0011_documentcategory_counters"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="document",
+            name="latest_version",
+            field=models.ForeignKey(
+                blank=True,
+                editable=False,
+                null=True,
+                on_delete=django.db.models.deletion.SET_NULL,
+                related_name="+",
+                to="docvault.documentversion",
+            ),
+        ),
+        migrations.AddField(
+            model_name="document",
+            name="version_count",
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(populate_version_summary, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,26 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("docvault", "0012_document_version_summary"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="documentversion",
+            name="storage",
+            field=models.CharField(
+                choices=[("full", "Full snapshot"), ("delta", "Delta against the next newer version")],
+                default="full",
+                editable=False,
+                max_length=5,
+            ),
+        ),
+        migrations.AddField(
+            model_name="documentversion",
+            name="delta",
+            field=models.TextField(blank=True, default="", editable=False),
+        ),
+    ]
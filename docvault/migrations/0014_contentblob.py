@@ -0,0 +1,71 @@
+import hashlib
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def populate_content_hashes(apps, schema_editor):
+    """Store the SHA-256 of every document's current content"""
+    Document = apps.get_model('docvault', 'Document')
+    
+    documents = []
+    for document_id, content in Document.objects.values_list('id', 'content').iterator(chunk_size=500):
+        content_hash = hashlib.sha256(content.encode('utf-8')).hexdigest()
+        documents.append(Document(id=document_id, content_hash=content_hash))
+        if len(documents) >= 500:
+            Document.objects.bulk_update(documents, ['content_hash'])
+            documents = []
+    Document.objects.bulk_update(documents, ['content_hash'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("docvault", "0013_documentversion_delta_storage"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="ContentBlob",
+            fields=[
+                ("id", models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name="ID")),
+                ("hash", models.CharField(help_text="SHA-256 of the content", max_length=64, unique=True)),
+                ("content", models.TextField()),
+                ("size", models.PositiveIntegerField(default=0, help_text="Length of the content in characters")),
+                ("ref_count", models.PositiveIntegerField(default=0, help_text="Number of versions referencing this blob")),
+                ("created_at", models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+        migrations.AddField(
+            model_name="documentversion",
+            name="blob",
+            field=models.ForeignKey(
+                blank=True,
+                editable=False,
+                null=True,
+                on_delete=django.db.models.deletion.PROTECT,
+                related_name="versions",
+                to="docvault.contentblob",
+            ),
+        ),
+        migrations.AlterField(
+            model_name="documentversion",
+            name="storage",
+            field=models.CharField(
+                choices=[
+                    ("full", "Full snapshot"),
+                    ("delta", "Delta against the next newer version"),
+                    ("blob", "Full snapshot in a shared content blob"),
+                ],
+                default="full",
+                editable=False,
+                max_length=5,
+            ),
+        ),
+        migrations.AddField(
+            model_name="document",
+            name="content_hash",
+            field=models.CharField(blank=True, editable=False, max_length=64),
+        ),
+        migrations.RunPython(populate_content_hashes, migrations.RunPython.noop),
+    ]
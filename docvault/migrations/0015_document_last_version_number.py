@@ -0,0 +1,29 @@
+from django.db import migrations, models
+from django.db.models import Max, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def populate_counters(apps, schema_editor):
+    """Start every counter at the highest stored version number"""
+    Document = apps.get_model('docvault', 'Document')
+    DocumentVersion = apps.get_model('docvault', 'DocumentVersion')
+    
+    highest = DocumentVersion.objects.filter(document=OuterRef('pk')).order_by()\
+        .values('document').annotate(highest=Max('version_number')).values('highest')
+    Document.objects.update(last_version_number=Coalesce(Subquery(highest), 0))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("docvault", "0014_contentblob"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="document",
+            name="last_version_number",
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(populate_counters, migrations.RunPython.noop),
+    ]
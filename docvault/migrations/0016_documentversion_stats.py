@@ -0,0 +1,41 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("docvault", "0015_document_last_version_number"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="documentversion",
+            name="content_hash",
+            field=models.CharField(blank=True, editable=False, help_text="SHA-256 of the content", max_length=64),
+        ),
+        migrations.AddField(
+            model_name="documentversion",
+            name="size",
+            field=models.PositiveIntegerField(default=0, editable=False, help_text="Content size in bytes"),
+        ),
+        migrations.AddField(
+            model_name="documentversion",
+            name="lines_added",
+            field=models.PositiveIntegerField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name="documentversion",
+            name="lines_removed",
+            field=models.PositiveIntegerField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name="documentversion",
+            name="words_added",
+            field=models.PositiveIntegerField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name="documentversion",
+            name="words_removed",
+            field=models.PositiveIntegerField(blank=True, editable=False, null=True),
+        ),
+    ]
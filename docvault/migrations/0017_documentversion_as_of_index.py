@@ -0,0 +1,15 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("docvault", "0016_documentversion_stats"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="documentversion",
+            index=models.Index(fields=["document", "created_at"], name="docvault_do_documen_f70b29_idx"),
+        ),
+    ]
@@ -0,0 +1,73 @@
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("docvault", "0017_documentversion_as_of_index"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="SearchTerm",
+            fields=[
+                ("id", models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name="ID")),
+                ("term", models.CharField(max_length=64, unique=True)),
+                (
+                    "document_count",
+                    models.PositiveIntegerField(default=0, help_text="Number of indexed documents containing the term"),
+                ),
+            ],
+        ),
+        migrations.CreateModel(
+            name="SearchEntry",
+            fields=[
+                (
+                    "document",
+                    models.OneToOneField(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        primary_key=True,
+                        related_name="search_entry",
+                        serialize=False,
+                        to="docvault.document",
+                    ),
+                ),
+                (
+                    "length",
+                    models.PositiveIntegerField(
+                        default=0, help_text="Weighted number of tokens, for BM25 length normalization"
+                    ),
+                ),
+                ("source_hash", models.CharField(help_text="SHA-256 of the indexed title and content", max_length=64)),
+                ("indexed_at", models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name="SearchPosting",
+            fields=[
+                ("id", models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name="ID")),
+                ("frequency", models.PositiveIntegerField(help_text="Occurrences, with title occurrences weighted")),
+                (
+                    "document",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="search_postings",
+                        to="docvault.document",
+                    ),
+                ),
+                (
+                    "term",
+                    models.ForeignKey(
+                        db_index=False,
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="postings",
+                        to="docvault.searchterm",
+                    ),
+                ),
+            ],
+            options={
+                "unique_together": {("term", "document")},
+            },
+        ),
+    ]
@@ -0,0 +1,47 @@
+from django.db import migrations
+from django.db.utils import OperationalError
+
+import docvault.fields
+
+
+def create_backend_indexes(apps, schema_editor):
+    """FTS5 table on SQLite, GIN index on the search vector on PostgreSQL"""
+    vendor = schema_editor.connection.vendor
+    if vendor == 'sqlite':
+        try:
+            schema_editor.execute(
+                "CREATE VIRTUAL TABLE IF NOT EXISTS docvault_search_fts "
+                "USING fts5(title, body, tokenize = 'unicode61 remove_diacritics 2')"
+            )
+        except OperationalError:
+            # SQLite built without FTS5; only the 'sqlite' search backend needs it
+            pass
+    elif vendor == 'postgresql':
+        schema_editor.execute(
+            "CREATE INDEX IF NOT EXISTS docvault_searchentry_vector_gin "
+            "ON docvault_searchentry USING gin (search_vector)"
+        )
+
+
+def drop_backend_indexes(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'sqlite':
+        schema_editor.execute("DROP TABLE IF EXISTS docvault_search_fts")
+    elif vendor == 'postgresql':
+        schema_editor.execute("DROP INDEX IF EXISTS docvault_searchentry_vector_gin")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("docvault", "0018_search_index"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="searchentry",
+            name="search_vector",
+            field=docvault.fields.TSVectorField(editable=False, null=True),
+        ),
+        migrations.RunPython(create_backend_indexes, drop_backend_indexes),
+    ]
@@ -0,0 +1,61 @@
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("docvault", "0019_search_backends"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="QueuedTask",
+            fields=[
+                ("id", models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name="ID")),
+                (
+                    "kind",
+                    models.CharField(
+                        choices=[
+                            ("search_index", "Update the search index"),
+                            ("version_stats", "Compute version statistics"),
+                            ("table_of_contents", "Cache the table of contents"),
+                        ],
+                        max_length=32,
+                    ),
+                ),
+                (
+                    "created_at",
+                    models.DateTimeField(
+                        default=django.utils.timezone.now, help_text="When the oldest pending request was made"
+                    ),
+                ),
+                (
+                    "enqueued_at",
+                    models.DateTimeField(default=django.utils.timezone.now, help_text="When the latest request was made"),
+                ),
+                (
+                    "available_at",
+                    models.DateTimeField(
+                        default=django.utils.timezone.now,
+                        help_text="Not run before this time (worker lease or retry delay)",
+                    ),
+                ),
+                ("attempts", models.PositiveIntegerField(default=0)),
+                ("last_error", models.TextField(blank=True)),
+                (
+                    "document",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="queued_tasks",
+                        to="docvault.document",
+                    ),
+                ),
+            ],
+            options={
+                "unique_together": {("kind", "document")},
+                "indexes": [models.Index(fields=["available_at"], name="docvault_qu_availab_d8a88e_idx")],
+            },
+        ),
+    ]
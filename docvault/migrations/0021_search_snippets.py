@@ -0,0 +1,30 @@
+from django.db import migrations, models
+
+
+def mark_entries_stale(apps, schema_editor):
+    """Existing entries have no text or offsets; rebuild_search_index re-indexes them"""
+    SearchEntry = apps.get_model('docvault', 'SearchEntry')
+    SearchEntry.objects.update(source_hash='')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("docvault", "0020_queuedtask"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="searchentry",
+            name="text",
+            field=models.TextField(blank=True, help_text="Plain text of the content, for search snippets"),
+        ),
+        migrations.AddField(
+            model_name="searchposting",
+            name="offsets",
+            field=models.TextField(
+                blank=True, help_text="Comma-separated offsets of the first occurrences in the text"
+            ),
+        ),
+        migrations.RunPython(mark_entries_stale, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,20 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("docvault", "0021_search_snippets"),
+    ]
+
+    operations = [
+        migrations.AddConstraint(
+            model_name="documentcategory",
+            constraint=models.UniqueConstraint(
+                condition=models.Q(("parent__isnull", True)),
+                fields=("slug",),
+                name="docvault_unique_root_slug",
+                violation_error_message="A root category with this slug already exists.",
+            ),
+        ),
+    ]
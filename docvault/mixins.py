@@ -1,47 +1,39 @@
-from django.db.models import Count
-from .models import DocumentCategory
+from .tree import get_category_tree, attach_url_paths
+from .sidebar import get_sidebar_html
+from .utils import get_recent_history_prefetches
 
 
 class CategoryContextMixin:
     """Mixin to provide category context with cached URL paths"""
     
+    def get_category_tree(self):
+        """Get the category tree snapshot, resolved once per request"""
+        if not hasattr(self.request, '_category_tree'):
+            self.request._category_tree = get_category_tree()
+        return self.request._category_tree
+    
+    def get_sidebar_html(self):
+        """Rendered sidebar navigation, cached per tree generation"""
+        if not hasattr(self.request, '_sidebar_html'):
+            self.request._sidebar_html = get_sidebar_html(self.get_category_tree())
+        return self.request._sidebar_html
+    
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        # Passed uncalled so templates that override the sidebar never render it
+        context['sidebar_html'] = self.get_sidebar_html
+        return context
+    
     def get_categories_with_url_paths(self):
         """Get all root categories with computed URL paths"""
-        # Use pre-fetched data if available (from SmartRouterView)
-        if hasattr(self.request, '_prefetched_data'):
-            # Use the pre-fetched categories that already have cached_url_path computed
-            return [cat for cat in self.request._prefetched_data['all_categories'] if cat.parent is None]
-        
-        # Fallback: fetch and compute URL paths
-        categories = DocumentCategory.objects.filter(parent=None)\
-            .prefetch_related('children', 'children__documents')\
-            .annotate(
-                document_count=Count('documents'),
-                child_count=Count('children')
-            )
-        
-        self._compute_url_paths(categories)
-        return categories
+        return self.get_category_tree().get_root_categories()
     
     def _compute_url_paths(self, categories):
         """Compute cached_url_path for categories and their children"""
+        tree = self.get_category_tree()
         for category in categories:
-            # Build path from the already-fetched parent data
-            path_parts = []
-            current = category
-            while current:
-                path_parts.insert(0, current.slug)
-                current = getattr(current, 'parent', None)
-            category.cached_url_path = '/'.join(path_parts)
-            
-            # Do the same for children
-            for subcategory in category.children.all():
-                path_parts = []
-                current = subcategory
-                while current:
-                    path_parts.insert(0, current.slug)
-                    current = getattr(current, 'parent', None)
-                subcategory.cached_url_path = '/'.join(path_parts)
+            attach_url_paths([category], tree)
+            attach_url_paths(category.children.all(), tree)
 
 
 class DocumentContextMixin:
@@ -49,15 +41,12 @@ class DocumentContextMixin:
     
     def get_document_from_cache(self, category_path, document_slug):
         """Get document using cached data if available"""
-        # Use pre-fetched data if available (from SmartRouterView)
-        if hasattr(self.request, '_prefetched_data') and hasattr(self.request, '_document_cache'):
+        # Use the document resolved by SmartRouterView if available
+        if hasattr(self.request, '_document_cache'):
             cached_document = self.request._document_cache
             if cached_document.slug == document_slug:
-                # Document was already found and cached, but we need to add the prefetches
-                from .models import Document
-                return Document.objects.select_related('category', 'category__parent', 'created_by')\
-                    .prefetch_related('versions', 'changelogs')\
-                    .get(id=cached_document.id)
+                # Document was already loaded with its prefetches by the router
+                return cached_document
         
         # Use cached category if available (from SmartRouterView)
         if hasattr(self.request, '_category_cache'):
@@ -65,17 +54,24 @@ class DocumentContextMixin:
             if category:
                 from .models import Document
                 try:
-                    return Document.objects.select_related('category', 'category__parent', 'created_by')\
-                        .prefetch_related('versions', 'changelogs')\
+                    document = Document.objects.select_related('created_by')\
+                        .prefetch_related(*get_recent_history_prefetches())\
                         .get(category=category, slug=document_slug)
                 except Document.DoesNotExist:
                     from django.http import Http404
                     raise Http404("Document not found")
+                
+                document.category = category
+                return document
         
         return None
     
     def get_category_from_cache(self, category_path):
         """Get category using cached data if available"""
         if hasattr(self.request, '_category_cache'):
-            return self.request._category_cache.get(category_path)
-        return None 
\ No newline at end of file
+            category = self.request._category_cache.get(category_path)
+            if category:
+                return category
+        
+        # Fall back to the shared category tree snapshot
+        return get_category_tree().get_category_by_path(category_path, with_children=False) 
\ No newline at end of file
@@ -1,4 +1,9 @@
-from django.db import models
+import hashlib
+
+from django.db import IntegrityError, connections, models, router, transaction
+from django.db.models import Count, Exists, F, Max, OuterRef, Subquery, Value, Window
+from django.db.models.functions import Coalesce, Concat, Greatest, RowNumber, Substr
+from django.db.models.query import ModelIterable
 from django.contrib.auth.models import User
 from django.urls import reverse
 from django.utils.text import slugify
@@ -6,12 +11,17 @@ from django.utils import timezone
 from django.conf import settings
 from django.core.cache import cache
 
-# Conditionally import TinyMCE based on settings
-if getattr(settings, 'DOCVAULT_EDITOR', 'text') == 'tinymce':
-    from tinymce.models import HTMLField
-    ContentField = HTMLField
-else:
-    ContentField = models.TextField
+from .delta import make_delta, apply_delta
+from .diff import diff_stats
+
+from .fields import CompressedContentField, CompressedContentDescriptor, TSVectorField, decompress_text
+
+# TextField or TinyMCE's HTMLField, compressed when DOCVAULT_CONTENT_COMPRESSION is set
+ContentField = CompressedContentField
+
+# Tables of contents are cached by content hash, so entries never go stale
+TOC_KEY = 'docvault:toc:{}'
+TOC_TIMEOUT = getattr(settings, 'DOCVAULT_TOC_CACHE_TIMEOUT', 60 * 60 * 24 * 7)
 
 class DocumentCategory(models.Model):
     """Categories for documents with materialized path for optimal performance"""
@@ -24,9 +34,24 @@ class DocumentCategory(models.Model):
     path = models.CharField(max_length=255, db_index=True, blank=True, help_text='Materialized path for hierarchy (e.g., "1.5.12")')
     depth = models.PositiveIntegerField(default=0, db_index=True, help_text='Depth in the tree (0 for root)')
     
+    # Denormalized slug path so URL lookups and generation never walk parents
+    url_path = models.CharField(max_length=500, unique=True, help_text='Slug path used in URLs (e.g., "help-center/game/guides")')
+    
+    # Denormalized counters, maintained by signals (see counters.py)
+    document_count = models.PositiveIntegerField(default=0, editable=False, help_text='Documents directly in this category')
+    child_count = models.PositiveIntegerField(default=0, editable=False, help_text='Direct child categories')
+    subtree_document_count = models.PositiveIntegerField(default=0, editable=False, help_text='Documents in this category and all its descendants')
+    
     class Meta:
         verbose_name_plural = "Document Categories"
         unique_together = [['parent', 'slug']]  # Slug must be unique within parent
+        constraints = [
+            # unique_together cannot see root categories, whose parent is NULL
+            models.UniqueConstraint(
+                fields=['slug'], condition=models.Q(parent__isnull=True), name='docvault_unique_root_slug',
+                violation_error_message='A root category with this slug already exists.',
+            ),
+        ]
         indexes = [
             models.Index(fields=['path']),
             models.Index(fields=['depth']),
@@ -42,8 +67,33 @@ class DocumentCategory(models.Model):
             return f"{self.parent.name} > {self.name}"
         return self.name
 
+    @staticmethod
+    def uses_closure_table():
+        """True when hierarchy queries should use the closure table instead of the path"""
+        return getattr(settings, 'DOCVAULT_HIERARCHY_BACKEND', 'path') == 'closure'
+
+    def _get_tree(self):
+        """The loaded category tree snapshot, if it contains this category"""
+        from .tree import get_loaded_category_tree
+        tree = get_loaded_category_tree()
+        if tree is not None and self.pk in tree:
+            return tree
+        return None
+
     def get_ancestors(self, include_self=False):
         """Get all ancestors in a single query"""
+        # Answered in memory when a tree snapshot is loaded
+        tree = self._get_tree()
+        if tree is not None:
+            return tree.get_queryset(tree.get_ancestor_ids(self.pk, include_self=include_self), 'depth')
+        
+        if self.uses_closure_table() and self.pk:
+            # One filter() call so both conditions apply to the same closure row
+            min_depth = 0 if include_self else 1
+            return self.__class__.objects.filter(
+                descendant_links__descendant_id=self.pk, descendant_links__depth__gte=min_depth
+            ).order_by('depth')
+        
         if not self.path:
             # Fallback: collect parent IDs first, then single query
             parent_ids = []
@@ -54,7 +104,7 @@ class DocumentCategory(models.Model):
                 current = current.parent
             
             if not parent_ids:
-                return []
+                return self.__class__.objects.none()
             
             # Single query to get all ancestors
             return self.__class__.objects.filter(id__in=parent_ids).order_by('depth')
@@ -64,7 +114,7 @@ class DocumentCategory(models.Model):
             path_parts = path_parts[:-1]  # Exclude self
         
         if not path_parts:
-            return []
+            return self.__class__.objects.none()
         
         # Use the current queryset if available (for optimization)
         qs = getattr(self, '_prefetched_objects_cache', {}).get('ancestors', self.__class__.objects)
@@ -72,21 +122,35 @@ class DocumentCategory(models.Model):
 
     def get_descendants(self, include_self=False):
         """Get all descendants in a single query"""
+        # Answered in memory when a tree snapshot is loaded
+        tree = self._get_tree()
+        if tree is not None:
+            return tree.get_queryset(tree.get_descendant_ids(self.pk, include_self=include_self), 'path')
+        
+        if self.uses_closure_table() and self.pk:
+            min_depth = 0 if include_self else 1
+            return self.__class__.objects.filter(
+                ancestor_links__ancestor_id=self.pk, ancestor_links__depth__gte=min_depth
+            ).order_by('path')
+        
         if not self.path:
             return self.__class__.objects.none()
         
-        queryset = self.__class__.objects.filter(path__startswith=self.path)
-        if not include_self:
-            queryset = queryset.exclude(pk=self.pk)
+        # Match on "<path>." so that "1.5" does not also match "1.55"
+        queryset = self.__class__.objects.filter(path__startswith=f"{self.path}.")
+        if include_self:
+            queryset = queryset | self.__class__.objects.filter(pk=self.pk)
         
         return queryset.order_by('path')
 
     def get_siblings(self, include_self=False):
         """Get all siblings (same parent)"""
-        if not self.parent:
-            return self.__class__.objects.filter(parent=None)
+        # Answered in memory when a tree snapshot is loaded
+        tree = self._get_tree()
+        if tree is not None:
+            return tree.get_queryset(tree.get_sibling_ids(self.pk, include_self=include_self))
         
-        queryset = self.__class__.objects.filter(parent=self.parent)
+        queryset = self.__class__.objects.filter(parent_id=self.parent_id)
         if not include_self:
             queryset = queryset.exclude(pk=self.pk)
         
@@ -98,6 +162,10 @@ class DocumentCategory(models.Model):
         if hasattr(self, 'cached_url_path'):
             return self.cached_url_path
         
+        # Use the denormalized column when it has been populated
+        if self.url_path:
+            return self.url_path
+        
         # Build path by traversing up the hierarchy
         path_parts = []
         current = self
@@ -113,8 +181,7 @@ class DocumentCategory(models.Model):
 
     def get_all_documents(self):
         """Returns all documents in this category and its descendants"""
-        descendant_ids = self.get_descendants(include_self=True).values_list('id', flat=True)
-        return Document.objects.filter(category_id__in=descendant_ids)
+        return Document.objects.filter(category__in=self.get_descendants(include_self=True).values('id'))
 
     @classmethod
     def get_by_path(cls, category_path, queryset=None):
@@ -132,7 +199,12 @@ class DocumentCategory(models.Model):
         # Use provided queryset or default
         qs = queryset or cls.objects
         
-        # OPTIMIZATION: Single query approach for nested paths
+        # Single equality lookup on the unique url_path index
+        category = qs.select_related('parent').filter(url_path='/'.join(slugs)).first()
+        if category:
+            return category
+        
+        # Fallback for rows whose url_path has not been populated yet
         if len(slugs) > 1:
             # Build a more efficient query that gets all categories in the path at once
             # This avoids the N+1 problem of looking up each level separately
@@ -180,6 +252,9 @@ class DocumentCategory(models.Model):
     @property
     def is_parent(self):
         """Returns True if this category has children"""
+        tree = self._get_tree()
+        if tree is not None:
+            return tree.has_children(self.pk)
         return self.children.exists()
 
     @property
@@ -192,58 +267,276 @@ class DocumentCategory(models.Model):
         """Returns True if this is a root category"""
         return self.parent is None
 
+    TREE_FIELDS = ('parent_id', 'path', 'depth', 'url_path')
+    COUNTER_FIELDS = ('document_count', 'child_count', 'subtree_document_count')
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._remember_tree_state()
+        return instance
+
+    def refresh_from_db(self, *args, **kwargs):
+        super().refresh_from_db(*args, **kwargs)
+        self._remember_tree_state()
+
+    def _remember_tree_state(self):
+        """Remember the stored hierarchy fields so save() can tell if the node moved"""
+        if all(field in self.__dict__ for field in self.TREE_FIELDS):
+            self._loaded_tree_state = tuple(self.__dict__[field] for field in self.TREE_FIELDS)
+        else:
+            self._loaded_tree_state = None
+
+    def _get_stored_tree_state(self):
+        """Hierarchy fields as stored in the database (one query if not loaded), or None without a row"""
+        state = getattr(self, '_loaded_tree_state', None)
+        if state is None:
+            state = self.__class__.objects.filter(pk=self.pk).values_list(*self.TREE_FIELDS).first()
+        return state
+
     def save(self, *args, **kwargs):
-        # Set depth based on parent
+        # Set depth and URL path based on parent
         if self.parent:
             self.depth = self.parent.depth + 1
+            self.url_path = f"{self.parent.url_path or self.parent.get_url_path()}/{self.slug}"
         else:
             self.depth = 0
+            self.url_path = self.slug
         
-        # Save first to get the ID
-        super().save(*args, **kwargs)
+        with transaction.atomic(using=kwargs.get('using')):
+            if self.pk is None:
+                # The path contains the ID, so new rows need a second write
+                super().save(*args, **kwargs)
+                self.path = self._build_path()
+                self.__class__.objects.filter(pk=self.pk).update(path=self.path)
+                self._insert_closure_links()
+            else:
+                stored_state = self._get_stored_tree_state()
+                old_parent_id, old_path, old_depth, old_url_path = stored_state or (None, None, None, None)
+                self.path = self._build_path()
+                
+                moved = (old_path, old_depth, old_url_path) != (self.path, self.depth, self.url_path)
+                update_fields = kwargs.get('update_fields')
+                if update_fields is None and stored_state is not None:
+                    # Counters are updated in place by signals; never write back stale
+                    # values, including from instances built with the pk of an existing row
+                    update_fields = [
+                        field.name for field in self._meta.concrete_fields
+                        if not field.primary_key and field.name not in self.COUNTER_FIELDS
+                    ]
+                if update_fields is not None:
+                    if moved:
+                        update_fields = {*update_fields, 'path', 'depth', 'url_path'}
+                    kwargs['update_fields'] = update_fields
+                
+                # Read by the counter signals to move subtree totals between ancestors
+                self._previous_tree_state = (old_parent_id, old_path)
+                
+                # Common case: nothing structural changed, a single write
+                super().save(*args, **kwargs)
+                
+                if moved and old_path:
+                    self._update_descendant_paths(old_path, old_depth, old_url_path)
+                if old_parent_id != self.parent_id:
+                    self._move_closure_links()
         
-        # Update path based on parent
+        self._remember_tree_state()
+
+    def _build_path(self):
         if self.parent:
-            self.path = f"{self.parent.path}.{self.id}"
-        else:
-            self.path = str(self.id)
+            return f"{self.parent.path}.{self.id}"
+        return str(self.id)
+
+    def _update_descendant_paths(self, old_path, old_depth, old_url_path):
+        """Re-path the whole subtree with one set-based UPDATE"""
+        self.__class__.objects.filter(path__startswith=f"{old_path}.").update(
+            path=Concat(Value(self.path), Substr('path', len(old_path) + 1)),
+            url_path=Concat(Value(self.url_path), Substr('url_path', len(old_url_path) + 1)),
+            depth=F('depth') + (self.depth - old_depth),
+        )
+
+    def _insert_closure_links(self):
+        """Link a new category to itself and to every ancestor of its parent"""
+        links = [DocumentCategoryClosure(ancestor_id=self.pk, descendant_id=self.pk, depth=0)]
+        if self.parent_id:
+            parent_links = DocumentCategoryClosure.objects.filter(descendant_id=self.parent_id)
+            for ancestor_id, depth in parent_links.values_list('ancestor_id', 'depth'):
+                links.append(DocumentCategoryClosure(ancestor_id=ancestor_id, descendant_id=self.pk, depth=depth + 1))
+        DocumentCategoryClosure.objects.bulk_create(links)
+
+    def _move_closure_links(self):
+        """Detach the subtree from its old ancestors and link it below the new parent"""
+        subtree = DocumentCategoryClosure.objects.filter(ancestor_id=self.pk)
+        subtree_ids = subtree.values('descendant_id')
+        DocumentCategoryClosure.objects.filter(descendant_id__in=subtree_ids)\
+            .exclude(ancestor_id__in=subtree_ids).delete()
         
-        # Save again with updated path
-        super().save(update_fields=['path'])
+        if not self.parent_id:
+            return
         
-        # Update all descendants' paths
-        self._update_descendant_paths()
-
-    def _update_descendant_paths(self):
-        """Update paths for all descendants when this category's path changes"""
-        descendants = self.children.all()
-        for descendant in descendants:
-            descendant.path = f"{self.path}.{descendant.id}"
-            descendant.depth = self.depth + 1
-            descendant.save(update_fields=['path', 'depth'])
-            descendant._update_descendant_paths()
+        ancestors = list(
+            DocumentCategoryClosure.objects.filter(descendant_id=self.parent_id).values_list('ancestor_id', 'depth')
+        )
+        links = [
+            DocumentCategoryClosure(ancestor_id=ancestor_id, descendant_id=descendant_id, depth=ancestor_depth + depth + 1)
+            for descendant_id, depth in subtree.values_list('descendant_id', 'depth')
+            for ancestor_id, ancestor_depth in ancestors
+        ]
+        DocumentCategoryClosure.objects.bulk_create(links, batch_size=1000)
 
     def move_to(self, new_parent):
         """Move this category to a new parent"""
         if new_parent == self.parent:
             return  # No change needed
         
-        # Prevent circular references
-        if new_parent and new_parent in self.get_descendants():
+        # Prevent circular references (the materialized path answers this without a query)
+        if new_parent and self.pk and (
+            new_parent.pk == self.pk or new_parent.path.startswith(f"{self.path}.")
+        ):
             raise ValueError("Cannot move category to its own descendant")
         
         self.parent = new_parent
         self.save()
 
+class DocumentCategoryClosure(models.Model):
+    """
+    Closure table for the category hierarchy: one row for every
+    (ancestor, descendant) pair, including each category paired with itself.
+    Maintained by DocumentCategory.save() and used for hierarchy queries when
+    DOCVAULT_HIERARCHY_BACKEND = 'closure'.
+    """
+    ancestor = models.ForeignKey(DocumentCategory, on_delete=models.CASCADE, related_name='descendant_links')
+    descendant = models.ForeignKey(DocumentCategory, on_delete=models.CASCADE, related_name='ancestor_links')
+    depth = models.PositiveIntegerField(help_text='Distance from ancestor to descendant (0 for the category itself)')
+
+    class Meta:
+        unique_together = [['ancestor', 'descendant']]
+        indexes = [
+            models.Index(fields=['descendant', 'depth']),  # Ancestor lookups
+        ]
+
+    def __str__(self):
+        return f"{self.ancestor_id} -> {self.descendant_id} ({self.depth})"
+
+class ContentBlob(models.Model):
+    """
+    Content-addressed version body. Identical bodies, whether from reverts
+    or from boilerplate shared across documents, are stored once and
+    reference counted by the versions that point at them.
+    """
+    hash = models.CharField(max_length=64, unique=True, help_text='SHA-256 of the content')
+    content = ContentField()
+    size = models.PositiveIntegerField(default=0, help_text='Length of the content in characters')
+    ref_count = models.PositiveIntegerField(default=0, help_text='Number of versions referencing this blob')
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"{self.hash[:12]} ({self.ref_count} refs)"
+
+    @staticmethod
+    def hash_content(content):
+        return hashlib.sha256(content.encode('utf-8')).hexdigest()
+
+    @classmethod
+    def acquire(cls, content, content_hash=None):
+        """Return the blob holding content, creating it if needed, and add a reference"""
+        content_hash = content_hash or cls.hash_content(content)
+        blob, _ = cls.objects.get_or_create(hash=content_hash, defaults={'content': content, 'size': len(content)})
+        cls.objects.filter(pk=blob.pk).update(ref_count=F('ref_count') + 1)
+        return blob
+
+    @classmethod
+    def release(cls, blob_id):
+        """Drop a reference; unreferenced blobs are removed by collect_content_blobs"""
+        if blob_id is not None:
+            cls.objects.filter(pk=blob_id, ref_count__gt=0).update(ref_count=F('ref_count') - 1)
+
+    @classmethod
+    def recount(cls, queryset=None):
+        """Recompute ref_count from the versions that actually reference each blob"""
+        references = DocumentVersion.objects.filter(blob=OuterRef('pk')).order_by()\
+            .values('blob').annotate(count=Count('pk')).values('count')
+        return (queryset if queryset is not None else cls.objects.all()).update(
+            ref_count=Coalesce(Subquery(references), 0)
+        )
+
+
+class AsOfIterable(ModelIterable):
+    """Yields documents rewound to the queryset's as_of timestamp"""
+
+    def __iter__(self):
+        yield from rewind_documents(list(super().__iter__()), self.queryset._as_of)
+
+
+class DocumentQuerySet(models.QuerySet):
+    _as_of = None
+
+    def _clone(self):
+        clone = super()._clone()
+        clone._as_of = self._as_of
+        return clone
+
+    def as_of(self, timestamp):
+        """
+        Documents as they were at timestamp: only documents created by then,
+        each with the content of its version current at that time. The
+        versions of all fetched documents are resolved in one query, so this
+        works for whole categories. Titles and categories are not versioned
+        and show their current values.
+
+        Documents without a version by then are filtered out in SQL, so
+        counts and slices match the documents iteration yields. Only model
+        instances are rewound; values() and values_list() raise TypeError.
+        """
+        clone = self.filter(
+            Exists(DocumentVersion.objects.filter(document=OuterRef('pk'), created_at__lte=timestamp)),
+            created_at__lte=timestamp,
+        )
+        clone._as_of = timestamp
+        clone._iterable_class = AsOfIterable
+        return clone
+
+    def _check_not_as_of(self, method):
+        if self._as_of is not None:
+            raise TypeError(f"{method}() would return current content; it is not supported after as_of()")
+
+    def values(self, *fields, **expressions):
+        self._check_not_as_of('values')
+        return super().values(*fields, **expressions)
+
+    def values_list(self, *fields, flat=False, named=False):
+        self._check_not_as_of('values_list')
+        return super().values_list(*fields, flat=flat, named=named)
+
+
 class Document(models.Model):
     """Main document model with content and version tracking"""
     title = models.CharField(max_length=200, help_text='The title of the document')
     slug = models.SlugField(max_length=200, help_text='URL-friendly version of the title')
-    content = ContentField(help_text='The main content of the document')
+    # Kept plain unless DOCVAULT_COMPRESS_DOCUMENT_CONTENT is set: search and the admin query it in SQL
+    content = ContentField(
+        help_text='The main content of the document',
+        compressible=getattr(settings, 'DOCVAULT_COMPRESS_DOCUMENT_CONTENT', False),
+    )
     category = models.ForeignKey(DocumentCategory, on_delete=models.PROTECT, related_name='documents')
     created_at = models.DateTimeField(default=timezone.now, help_text='Date/time the document was created')
     updated_at = models.DateTimeField(auto_now=True)
     created_by = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True, related_name='created_documents')
+    
+    # Denormalized version summary, maintained when versions are created or deleted
+    latest_version = models.ForeignKey(
+        'DocumentVersion', on_delete=models.SET_NULL, null=True, blank=True, editable=False, related_name='+'
+    )
+    version_count = models.PositiveIntegerField(default=0, editable=False)
+    # Counter that allocates version numbers; only ever incremented in the database
+    last_version_number = models.PositiveIntegerField(default=0, editable=False)
+    
+    # SHA-256 of content; the same key as the ContentBlob of the latest version
+    content_hash = models.CharField(max_length=64, blank=True, editable=False)
+
+    VERSION_SUMMARY_FIELDS = ('latest_version', 'version_count', 'last_version_number')
+
+    objects = DocumentQuerySet.as_manager()
 
     class Meta:
         indexes = [
@@ -257,6 +550,23 @@ class Document(models.Model):
     def __str__(self):
         return self.title
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Lets the counter signals notice when a document changes category
+        instance._counted_category_id = instance.__dict__.get('category_id')
+        instance._remember_content_hash()
+        return instance
+
+    def refresh_from_db(self, *args, **kwargs):
+        super().refresh_from_db(*args, **kwargs)
+        self._remember_content_hash()
+
+    def _remember_content_hash(self):
+        """Remember the stored content hash and title so save() can detect edits without a query"""
+        self._loaded_content_hash = self.__dict__.get('content_hash')
+        self._loaded_title = self.__dict__.get('title')
+
     def get_absolute_url(self):
         """Returns the URL to access a particular document"""
         return reverse('docvault:smart_router', kwargs={
@@ -320,64 +630,445 @@ class Document(models.Model):
 
         return headings
 
+    def get_table_of_contents(self):
+        """generate_toc(), cached by content hash; the cache is warmed after saves"""
+        if not self.content_hash:
+            return self.generate_toc()
+        key = TOC_KEY.format(self.content_hash)
+        toc = cache.get(key)
+        if toc is None:
+            toc = self.generate_toc()
+            cache.set(key, toc, TOC_TIMEOUT)
+        return toc
+
+    def add_version(self, content, created_by=None, retries=3, **fields):
+        """
+        Create the next version of this document.
+
+        Numbers come from the document's counter, so concurrent editors never
+        collide. If rows were inserted behind the counter's back (imports,
+        raw SQL) the unique constraint fails; the counter is then resynced
+        from the stored versions and the insert retried.
+        """
+        for attempt in range(retries):
+            try:
+                with transaction.atomic():
+                    return DocumentVersion.objects.create(
+                        document=self, content=content, created_by=created_by, **fields
+                    )
+            except IntegrityError:
+                if attempt == retries - 1:
+                    raise
+                self.sync_version_counter()
+
+    def sync_version_counter(self):
+        """Move the counter past every stored version number"""
+        highest = DocumentVersion.objects.filter(document=OuterRef('pk')).order_by()\
+            .values('document').annotate(highest=Max('version_number')).values('highest')
+        Document.objects.filter(pk=self.pk).update(
+            last_version_number=Greatest(F('last_version_number'), Coalesce(Subquery(highest), 0))
+        )
+
     def save(self, *args, **kwargs):
+        if getattr(self, 'as_of_version', None) is not None:
+            raise ValueError("A document loaded with as_of() holds old content and cannot be saved")
+
         # Only set created_at if this is a new object and not already set
         is_new = not self.pk
         if is_new and not self.created_at:
             self.created_at = timezone.now()
 
-        # Check if this is an update to an existing document
-        if self.pk:
-            # Get the original document before changes
-            original = Document.objects.get(pk=self.pk)
+        # The version summary is updated in place when versions change; never write back stale values
+        if self.pk and not self._state.adding and kwargs.get('update_fields') is None:
+            kwargs['update_fields'] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key and field.name not in self.VERSION_SUMMARY_FIELDS
+            ]
 
-            # If content changed, create a new version
-            if original.content != self.content:
-                super().save(*args, **kwargs)
+        if self.pk and not self._state.adding and 'content' not in self.__dict__:
+            # Content was never loaded (deferred), so it cannot have changed
+            stored_hash = self.content_hash
+            update_fields = kwargs.get('update_fields')
+            if update_fields is not None:
+                kwargs['update_fields'] = [
+                    field for field in update_fields if field not in ('content', 'content_hash')
+                ]
+        else:
+            stored_hash = getattr(self, '_loaded_content_hash', None)
+            if stored_hash is None and self.pk:
+                # Not loaded from the database (or the hash was deferred): one indexed lookup
+                stored_hash = Document.objects.filter(pk=self.pk).values_list('content_hash', flat=True).first()
+            self.content_hash = ContentBlob.hash_content(self.content)
+            update_fields = kwargs.get('update_fields')
+            if update_fields is not None and 'content' in update_fields:
+                kwargs['update_fields'] = {*update_fields, 'content_hash'}
 
-                # Create a new version
-                version = DocumentVersion.objects.create(
-                    document=self,
-                    content=self.content,
-                    created_by=self.created_by
-                )
-
-                return
-
-        # If it's a new document or no content changed
-        super().save(*args, **kwargs)
-
-        # If this is a new document, create the first version with created_at matching the document
-        if is_new:
-            DocumentVersion.objects.create(
-                document=self,
-                content=self.content,
-                created_by=self.created_by,
-                created_at=self.created_at  # Force v1 to match document's created_at
+        # The row and its new version are written together, so a failed
+        # version insert cannot leave a content change without a version
+        with transaction.atomic(using=kwargs.get('using')):
+            content_changed = self.pk and stored_hash != self.content_hash
+            # Read by the post_save handler that queues re-indexing; a title
+            # that was deferred cannot have changed, one never loaded may have
+            self._content_changed = bool(is_new or content_changed)
+            self._title_changed = 'title' in self.__dict__ and (
+                getattr(self, '_loaded_title', None) is None or self._loaded_title != self.title
             )
+            super().save(*args, **kwargs)
+
+            if is_new:
+                # The first version's created_at matches the document's
+                self.add_version(self.content, created_by=self.created_by, created_at=self.created_at)
+            elif content_changed:
+                self.add_version(self.content, created_by=self.created_by)
+
+        self._remember_content_hash()
+
+class VersionContentDescriptor(CompressedContentDescriptor):
+    """Loads blob-stored and rebuilds delta-stored version content the first time it is read"""
+
+    def __get__(self, instance, cls=None):
+        if instance is None:
+            return self
+        if self.field.attname not in instance.__dict__ and instance.pk is not None:
+            if instance.storage == DocumentVersion.STORAGE_DELTA:
+                instance.__dict__[self.field.attname] = instance._reconstruct_content()
+            elif instance.storage == DocumentVersion.STORAGE_BLOB:
+                instance.__dict__[self.field.attname] = instance.blob.content
+        return super().__get__(instance, cls)
+
 
 class DocumentVersion(models.Model):
     """Stores each version of a document's content"""
+    STORAGE_FULL = 'full'
+    STORAGE_DELTA = 'delta'
+    STORAGE_BLOB = 'blob'
+    STORAGE_CHOICES = [
+        (STORAGE_FULL, 'Full snapshot'),
+        (STORAGE_DELTA, 'Delta against the next newer version'),
+        (STORAGE_BLOB, 'Full snapshot in a shared content blob'),
+    ]
+    SNAPSHOT_STORAGES = (STORAGE_FULL, STORAGE_BLOB)
+    CONTENT_FIELDS = ('content', 'delta', 'storage', 'blob')
+    STATS_FIELDS = ('content_hash', 'size', 'lines_added', 'lines_removed', 'words_added', 'words_removed')
+
     document = models.ForeignKey(Document, on_delete=models.CASCADE, related_name='versions')
     content = ContentField(help_text='The content for this version')
     version_number = models.PositiveIntegerField(help_text='Automatically incremented version number')
     created_by = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
+    
+    # Reverse-delta storage: older versions may hold a delta instead of their content
+    storage = models.CharField(max_length=5, choices=STORAGE_CHOICES, default=STORAGE_FULL, editable=False)
+    delta = models.TextField(blank=True, default='', editable=False)
+    
+    # Content-addressed storage: the body lives in a shared, deduplicated blob
+    blob = models.ForeignKey(ContentBlob, on_delete=models.PROTECT, null=True, blank=True, editable=False, related_name='versions')
+    
+    # Change statistics, so history pages never need the content; the diff
+    # counts are relative to the previous version and None until computed
+    content_hash = models.CharField(max_length=64, blank=True, editable=False, help_text='SHA-256 of the content')
+    size = models.PositiveIntegerField(default=0, editable=False, help_text='Content size in bytes')
+    lines_added = models.PositiveIntegerField(null=True, blank=True, editable=False)
+    lines_removed = models.PositiveIntegerField(null=True, blank=True, editable=False)
+    words_added = models.PositiveIntegerField(null=True, blank=True, editable=False)
+    words_removed = models.PositiveIntegerField(null=True, blank=True, editable=False)
 
     class Meta:
         ordering = ['-version_number']
         unique_together = ('document', 'version_number')
+        indexes = [
+            models.Index(fields=['document', 'created_at']),  # For as-of lookups
+        ]
 
     def __str__(self):
         return f"{self.document.title} - v{self.version_number}"
 
+    @staticmethod
+    def uses_delta_storage():
+        """True when older versions should be stored as deltas"""
+        return getattr(settings, 'DOCVAULT_VERSION_STORAGE', 'full') == 'delta'
+
+    @staticmethod
+    def uses_blob_storage():
+        """True when full snapshots should be stored in deduplicated content blobs"""
+        return getattr(settings, 'DOCVAULT_VERSION_DEDUPLICATION', False)
+
+    @staticmethod
+    def computes_stats_on_save():
+        """True computes diff statistics in save(); by default the background task queue does"""
+        return getattr(settings, 'DOCVAULT_VERSION_STATS_ON_SAVE', False)
+
+    @staticmethod
+    def measure(content, previous_content=''):
+        """Values of STATS_FIELDS for content following previous_content"""
+        return {
+            'content_hash': ContentBlob.hash_content(content),
+            'size': len(content.encode('utf-8')),
+            **diff_stats(previous_content, content),
+        }
+
+    @classmethod
+    def compute_missing_stats(cls, document_id):
+        """Measure a document's versions whose statistics were left empty; returns how many"""
+        versions = list(cls.objects.filter(document_id=document_id, lines_added__isnull=True).select_related('blob'))
+        for version in versions:
+            previous = version._get_previous()
+            for field, value in cls.measure(version.content, previous.content if previous is not None else '').items():
+                setattr(version, field, value)
+        cls.objects.bulk_update(versions, cls.STATS_FIELDS)
+        return len(versions)
+
+    @staticmethod
+    def get_keyframe_interval():
+        """Every Nth version is kept as a full snapshot to bound reconstruction"""
+        return max(1, getattr(settings, 'DOCVAULT_VERSION_KEYFRAME_INTERVAL', 10))
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        if instance.__dict__.get('storage', cls.STORAGE_FULL) != cls.STORAGE_FULL:
+            # The content column is empty; the descriptor loads or rebuilds it on access
+            instance.__dict__.pop('content', None)
+        return instance
+
+    def _reconstruct_content(self):
+        """Apply deltas from the nearest newer full snapshot back to this version"""
+        deltas = [self.delta]
+        newer = DocumentVersion.objects.filter(
+            document_id=self.document_id, version_number__gt=self.version_number
+        ).order_by('version_number').values_list('storage', 'content', 'delta', 'blob__content')
+        
+        for storage, content, delta, blob_content in newer.iterator(chunk_size=self.get_keyframe_interval()):
+            if storage in self.SNAPSHOT_STORAGES:
+                content = decompress_text(blob_content if storage == self.STORAGE_BLOB else content)
+                break
+            deltas.append(delta)
+        else:
+            raise ValueError(f"Version {self.version_number} of document {self.document_id} has no full snapshot to rebuild from")
+        
+        for delta in reversed(deltas):
+            content = apply_delta(content, delta)
+        return content
+
     def save(self, *args, **kwargs):
-        # Auto-increment version number
-        if not self.version_number:
-            latest = DocumentVersion.objects.filter(document=self.document).order_by('-version_number').first()
-            self.version_number = 1 if latest is None else latest.version_number + 1
+        is_new = self._state.adding
+        content_changed = is_new or self._prepare_history_update(kwargs)
+        
+        with transaction.atomic(using=kwargs.get('using')):
+            previous = None
+            if is_new:
+                # First statement of the transaction, so the document row is
+                # locked before anything is read
+                self._allocate_version_number(kwargs.get('using'))
+                if self.computes_stats_on_save() or self.uses_delta_storage():
+                    previous = self._get_previous()
+            if content_changed:
+                self._record_stats(previous, is_new)
+                replaced_blob_id = None if is_new else self.blob_id
+                content = self._store_snapshot()
+            try:
+                super().save(*args, **kwargs)
+            finally:
+                if content_changed:
+                    self.__dict__['content'] = content
+            
+            if is_new:
+                self._record_on_document()
+                if self.uses_delta_storage():
+                    self._encode_previous_as_delta(previous)
+            elif content_changed:
+                if replaced_blob_id != self.blob_id:
+                    ContentBlob.release(replaced_blob_id)
+                # The next version's counts were relative to the old content
+                next_pk = DocumentVersion.objects.filter(
+                    document_id=self.document_id, version_number__gt=self.version_number
+                ).order_by('version_number').values_list('pk', flat=True).first()
+                if next_pk is not None:
+                    DocumentVersion.objects.filter(pk=next_pk).update(
+                        lines_added=None, lines_removed=None, words_added=None, words_removed=None
+                    )
+
+    def _get_previous(self):
+        """The next older version; its content is loaded with it unless it is delta-stored"""
+        return DocumentVersion.objects.filter(
+            document_id=self.document_id, version_number__lt=self.version_number
+        ).select_related('blob').order_by('-version_number').first()
 
-        super().save(*args, **kwargs)
+    def _record_stats(self, previous, is_new):
+        """Fill STATS_FIELDS for the content being saved"""
+        if is_new and self.computes_stats_on_save():
+            stats = self.measure(self.content, previous.content if previous is not None else '')
+        else:
+            # Counted later by the version_stats task, see tasks.py
+            stats = {
+                'content_hash': ContentBlob.hash_content(self.content),
+                'size': len(self.content.encode('utf-8')),
+                'lines_added': None, 'lines_removed': None, 'words_added': None, 'words_removed': None,
+            }
+        for field, value in stats.items():
+            setattr(self, field, value)
+
+    def _store_snapshot(self):
+        """Store the body whole, in a shared blob when deduplication is on; returns the body"""
+        content = self.content
+        self.delta = ''
+        if self.uses_blob_storage():
+            self.storage = self.STORAGE_BLOB
+            self.blob = ContentBlob.acquire(content, self.content_hash or None)
+            self.content = ''
+        else:
+            self.storage = self.STORAGE_FULL
+            self.blob = None
+        return content
+
+    def _prepare_history_update(self, kwargs):
+        """Keep delta chains valid when an existing version is saved again; True if the body changed"""
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and 'content' not in update_fields:
+            return False
+        
+        if 'content' in self.__dict__:
+            stored = DocumentVersion.objects.get(pk=self.pk)
+            if stored.content != self.content:
+                # Older deltas were made against the old content
+                self._materialize_previous()
+                if update_fields is not None:
+                    kwargs['update_fields'] = {*update_fields, *self.CONTENT_FIELDS, *self.STATS_FIELDS}
+                return True
+        
+        # Unchanged content: leave the stored representation and its statistics alone
+        if update_fields is None:
+            update_fields = [field.name for field in self._meta.concrete_fields if not field.primary_key]
+        kwargs['update_fields'] = [
+            field for field in update_fields if field not in (*self.CONTENT_FIELDS, *self.STATS_FIELDS)
+        ]
+        return False
+
+    def _encode_previous_as_delta(self, previous):
+        """Replace the previous full snapshot with a delta against this version"""
+        if previous is None:
+            return
+        if previous.storage not in self.SNAPSHOT_STORAGES or previous.version_number % self.get_keyframe_interval() == 0:
+            return  # Already a delta, or a keyframe that stays whole
+        content = previous.content
+        
+        delta = make_delta(self.content, content)
+        if len(delta) < len(content):
+            DocumentVersion.objects.filter(pk=previous.pk).update(
+                storage=self.STORAGE_DELTA, delta=delta, content='', blob=None
+            )
+            ContentBlob.release(previous.blob_id)
+
+    def _materialize_previous(self):
+        """Store the next older version in full before this one changes or goes away"""
+        previous = DocumentVersion.objects.filter(
+            document_id=self.document_id, version_number__lt=self.version_number
+        ).order_by('-version_number').first()
+        if previous is not None and previous.storage == self.STORAGE_DELTA:
+            previous._store_snapshot()
+            DocumentVersion.objects.filter(pk=previous.pk).update(
+                storage=previous.storage, content=previous.content, delta='', blob=previous.blob
+            )
+
+    def _allocate_version_number(self, using=None):
+        """Take the next number from the document's counter with one atomic UPDATE"""
+        using = using or router.db_for_write(Document)
+        if self.version_number:
+            # Explicit numbers (imports) just move the counter past them
+            Document.objects.using(using).filter(pk=self.document_id).update(
+                last_version_number=Greatest(F('last_version_number'), self.version_number),
+                version_count=F('version_count') + 1,
+            )
+        else:
+            self.version_number = increment_version_counter(self.document_id, using)
+        
+        # Keep an already loaded document in step without reloading it
+        if DocumentVersion.document.is_cached(self):
+            document = self.document
+            document.last_version_number = max(document.last_version_number, self.version_number)
+            document.version_count += 1
+
+    def _record_on_document(self):
+        """Point the document at its newest version"""
+        Document.objects.filter(pk=self.document_id).update(latest_version=latest_version_subquery())
+        if DocumentVersion.document.is_cached(self) and self.version_number == self.document.last_version_number:
+            self.document.latest_version = self
+
+
+DocumentVersion.content = VersionContentDescriptor(DocumentVersion._meta.get_field('content'))
+
+
+def increment_version_counter(document_id, using):
+    """
+    Atomically increment last_version_number (and version_count) of a
+    document and return the new number.
+
+    Backends that support UPDATE ... RETURNING do it in one statement; others
+    read the value back while the UPDATE still holds the row lock.
+    """
+    connection = connections[using]
+    if connection.vendor == 'postgresql' or (
+        connection.vendor == 'sqlite' and connection.Database.sqlite_version_info >= (3, 35)
+    ):
+        quote = connection.ops.quote_name
+        counter, count = quote('last_version_number'), quote('version_count')
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"UPDATE {quote(Document._meta.db_table)} SET {counter} = {counter} + 1, {count} = {count} + 1 "
+                f"WHERE {quote(Document._meta.pk.column)} = %s RETURNING {counter}",
+                [document_id],
+            )
+            row = cursor.fetchone()
+    else:
+        documents = Document.objects.using(using).filter(pk=document_id)
+        documents.update(last_version_number=F('last_version_number') + 1, version_count=F('version_count') + 1)
+        row = documents.values_list('last_version_number').first()
+    if row is None:
+        raise Document.DoesNotExist("Cannot allocate a version number for a missing document")
+    return row[0]
+
+
+def rewind_documents(documents, timestamp):
+    """
+    Give each document the content of its newest version created at or
+    before timestamp, resolved for all documents with one window-function
+    query. Documents without such a version are left out. Delta-stored
+    versions still need one query each to rebuild their content.
+    """
+    if not documents:
+        return []
+    versions = DocumentVersion.objects.filter(
+        document_id__in={document.pk for document in documents}, created_at__lte=timestamp
+    ).annotate(
+        as_of_rank=Window(
+            RowNumber(),
+            partition_by=[F('document_id')],
+            order_by=[F('created_at').desc(), F('version_number').desc()],
+        )
+    ).filter(as_of_rank=1).select_related('blob')
+    by_document = {version.document_id: version for version in versions}
+
+    rewound = []
+    for document in documents:
+        version = by_document.get(document.pk)
+        if version is None:
+            continue
+        version.document = document
+        document.content = version.content
+        document.content_hash = version.content_hash
+        document.as_of = timestamp
+        document.as_of_version = version
+        rewound.append(document)
+    return rewound
+
+
+def latest_version_subquery():
+    """Subquery selecting the highest-numbered version of the outer document"""
+    return Subquery(
+        DocumentVersion.objects.filter(document=OuterRef('pk'))
+        .order_by('-version_number')
+        .values('pk')[:1]
+    )
 
 class Changelog(models.Model):
     """Records changes made to documents with descriptions"""
@@ -408,3 +1099,76 @@ class Changelog(models.Model):
 
     def __str__(self):
         return f"Change to {self.document.title} on {self.created_at.strftime('%Y-%m-%d')}"
+
+
+class SearchTerm(models.Model):
+    """A distinct token in the search index"""
+    term = models.CharField(max_length=64, unique=True)
+    document_count = models.PositiveIntegerField(default=0, help_text='Number of indexed documents containing the term')
+
+    def __str__(self):
+        return f"{self.term} ({self.document_count} documents)"
+
+
+class SearchEntry(models.Model):
+    """What each search backend has indexed for a document"""
+    document = models.OneToOneField(Document, on_delete=models.CASCADE, primary_key=True, related_name='search_entry')
+    length = models.PositiveIntegerField(default=0, help_text='Weighted number of tokens, for BM25 length normalization')
+    source_hash = models.CharField(max_length=64, help_text='SHA-256 of the indexed title and content')
+    text = models.TextField(blank=True, help_text='Plain text of the content, for search snippets')
+    indexed_at = models.DateTimeField(auto_now=True)
+    # Only filled by the PostgreSQL backend, which also adds a GIN index on it
+    search_vector = TSVectorField(null=True, editable=False)
+
+    def __str__(self):
+        return f"Search entry for document {self.document_id}"
+
+
+class SearchPosting(models.Model):
+    """Occurrences of one term in one document"""
+    # The unique index below starts with term and serves the lookups by term
+    term = models.ForeignKey(SearchTerm, on_delete=models.CASCADE, related_name='postings', db_index=False)
+    document = models.ForeignKey(Document, on_delete=models.CASCADE, related_name='search_postings')
+    frequency = models.PositiveIntegerField(help_text='Occurrences, with title occurrences weighted')
+    offsets = models.TextField(blank=True, help_text='Comma-separated offsets of the first occurrences in the text')
+
+    class Meta:
+        unique_together = ('term', 'document')
+
+    def __str__(self):
+        return f"{self.term_id} in {self.document_id} x{self.frequency}"
+
+
+class QueuedTask(models.Model):
+    """
+    Post-save work for a document, waiting to be run by the task queue.
+    There is at most one row per kind and document, so repeated saves
+    collapse into a single run.
+    """
+    KIND_SEARCH_INDEX = 'search_index'
+    KIND_VERSION_STATS = 'version_stats'
+    KIND_TABLE_OF_CONTENTS = 'table_of_contents'
+    KIND_CHOICES = [
+        (KIND_SEARCH_INDEX, 'Update the search index'),
+        (KIND_VERSION_STATS, 'Compute version statistics'),
+        (KIND_TABLE_OF_CONTENTS, 'Cache the table of contents'),
+    ]
+
+    kind = models.CharField(max_length=32, choices=KIND_CHOICES)
+    document = models.ForeignKey(Document, on_delete=models.CASCADE, related_name='queued_tasks')
+    created_at = models.DateTimeField(default=timezone.now, help_text='When the oldest pending request was made')
+    enqueued_at = models.DateTimeField(default=timezone.now, help_text='When the latest request was made')
+    available_at = models.DateTimeField(
+        default=timezone.now, help_text='Not run before this time (worker lease or retry delay)'
+    )
+    attempts = models.PositiveIntegerField(default=0)
+    last_error = models.TextField(blank=True)
+
+    class Meta:
+        unique_together = ('kind', 'document')
+        indexes = [
+            models.Index(fields=['available_at']),  # For claiming due tasks
+        ]
+
+    def __str__(self):
+        return f"{self.kind} for document {self.document_id}"
@@ -0,0 +1,550 @@
+"""
+Full-text search with pluggable backends.
+
+DOCVAULT_SEARCH_BACKEND selects how documents are indexed and queried:
+
+``'index'`` (default)
+    An inverted index stored in regular tables. Documents are reduced to
+    plain text (tags stripped, entities decoded), split into lowercase word
+    tokens and stored as postings: one row per term and document holding
+    the number of occurrences, with title occurrences weighted by
+    DOCVAULT_SEARCH_TITLE_WEIGHT. Each term row keeps the number of
+    documents containing it, which gives BM25 its inverse document
+    frequency without counting postings at query time. Works on every
+    database.
+``'sqlite'``
+    An FTS5 virtual table ranked with FTS5's built-in bm25().
+``'postgres'``
+    A tsvector column on SearchEntry with a GIN index, queried with
+    plainto_tsquery and ranked with ts_rank.
+``'basic'``
+    Case-insensitive substring matching on title and content. Needs no
+    index, but scans every document.
+
+A dotted path to a SearchBackend subclass is accepted as well. Every
+backend returns a queryset of documents ordered best first, with the score
+in ``search_score``, so results paginate in the database. The signal
+handlers in signals.py re-index a document when its title or content
+changes and drop it from the index when it is deleted; SearchEntry records
+what was indexed so unchanged documents are skipped. ``rebuild_search_index``
+indexes existing documents, e.g. after switching backends.
+
+Snippets are made for one page of results at a time. The index backend
+keeps each document's plain text and the character offsets of the first
+occurrences of every term, picks the window holding the most query terms
+from the offsets alone and reads just that window with SUBSTR. FTS5's
+snippet() and PostgreSQL's ts_headline() serve the other two.
+
+Results can be narrowed to a category subtree with in_category(), a
+materialized path prefix filter applied in the same SQL query, and counted
+per top-level category with category_facets().
+"""
+from collections import Counter
+import hashlib
+from html import unescape
+import math
+import re
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.exceptions import ImproperlyConfigured
+from django.db import connections, router, transaction
+from django.db.models import Avg, Case, Count, F, FilteredRelation, FloatField, OuterRef, Q, Subquery, Value, When
+from django.db.models.functions import Cast, Coalesce, StrIndex, Substr
+from django.utils.html import escape, strip_tags
+from django.utils.safestring import mark_safe
+from django.utils.module_loading import import_string
+
+from .models import Document, SearchEntry, SearchPosting, SearchTerm
+
+
+TOKEN_RE = re.compile(r'\w+')
+LEADING_WORD_RE = re.compile(r'^\w+')
+TRAILING_WORD_RE = re.compile(r'\w+$')
+MAX_TERM_LENGTH = 64
+
+TITLE_WEIGHT = getattr(settings, 'DOCVAULT_SEARCH_TITLE_WEIGHT', 5)
+BM25_K1 = getattr(settings, 'DOCVAULT_SEARCH_BM25_K1', 1.2)
+BM25_B = getattr(settings, 'DOCVAULT_SEARCH_BM25_B', 0.75)
+
+# Document count and average length change slowly, so they are cached briefly
+STATS_KEY = 'docvault:search:stats'
+STATS_TIMEOUT = getattr(settings, 'DOCVAULT_SEARCH_STATS_TIMEOUT', 300)
+
+# Terms per query when looking up or creating term rows
+TERM_BATCH_SIZE = 500
+
+# Characters of text shown per result, and offsets kept per term and document
+SNIPPET_LENGTH = getattr(settings, 'DOCVAULT_SEARCH_SNIPPET_LENGTH', 200)
+MAX_OFFSETS = 16
+# Backends wrap matches in these before the snippet is escaped
+MATCH_START = '\x02'
+MATCH_END = '\x03'
+
+FTS_TABLE = 'docvault_search_fts'
+POSTGRES_CONFIG = getattr(settings, 'DOCVAULT_SEARCH_POSTGRES_CONFIG', 'english')
+
+
+def extract_text(html):
+    """Plain text of HTML content"""
+    return unescape(strip_tags(html))
+
+
+def tokenize_with_offsets(text):
+    """Lowercase word tokens of plain text with their character offsets; overlong tokens are dropped"""
+    for match in TOKEN_RE.finditer(text):
+        token = match.group().casefold()
+        if len(token) <= MAX_TERM_LENGTH:
+            yield token, match.start()
+
+
+def tokenize(text):
+    return [token for token, _ in tokenize_with_offsets(text)]
+
+
+def source_hash(title, content):
+    return hashlib.sha256(f'{title}\0{content}'.encode('utf-8')).hexdigest()
+
+
+def render_snippet(fragment, at_start=True, at_end=True):
+    """Escape a fragment with marked matches as HTML; cut-off ends get an ellipsis"""
+    html = escape(fragment.strip()).replace(MATCH_START, '<mark>').replace(MATCH_END, '</mark>')
+    return mark_safe(f"{'' if at_start else '&hellip; '}{html}{'' if at_end else ' &hellip;'}")
+
+
+def highlight(fragment, terms, at_start=True, at_end=True):
+    """Snippet of a window of plain text, with the tokens in terms marked"""
+    # Drop words the window cuts through
+    if not at_start:
+        fragment = LEADING_WORD_RE.sub('', fragment)
+    if not at_end:
+        fragment = TRAILING_WORD_RE.sub('', fragment)
+    marked = []
+    position = 0
+    for match in TOKEN_RE.finditer(fragment):
+        if match.group().casefold() in terms:
+            marked.append(fragment[position:match.start()] + MATCH_START + match.group() + MATCH_END)
+            position = match.end()
+    marked.append(fragment[position:])
+    return render_snippet(''.join(marked), at_start, at_end)
+
+
+class SearchBackend:
+    """
+    Base class of search backends. Subclasses store documents in their
+    index in write_document() and answer queries in search(); the
+    bookkeeping in SearchEntry is shared.
+    """
+    # Whether SearchEntry keeps the plain text, for backends that read snippets from it
+    stores_text = True
+
+    def search(self, query, queryset=None):
+        """Documents matching query, best first, with ``search_score`` annotated"""
+        raise NotImplementedError
+
+    def write_document(self, document, text):
+        """Store a document and its plain text in the index; its SearchEntry row already exists"""
+        raise NotImplementedError
+
+    def delete_document(self, document_id):
+        """Remove a document from the index, before its SearchEntry is deleted"""
+        raise NotImplementedError
+
+    def snippets(self, documents, query):
+        """Highlighted snippets of a page of results, by document id"""
+        return {}
+
+    def index_document(self, document, force=False):
+        """
+        Index a document. Returns False without touching the index when the
+        title and content are unchanged since the last indexing.
+        """
+        digest = source_hash(document.title, document.content)
+        if not force and SearchEntry.objects.filter(document_id=document.pk, source_hash=digest).exists():
+            return False
+
+        text = extract_text(document.content)
+        with transaction.atomic():
+            SearchEntry.objects.update_or_create(
+                document_id=document.pk, defaults={'source_hash': digest, 'text': text if self.stores_text else ''}
+            )
+            self.write_document(document, text)
+        return True
+
+    def remove_document(self, document_id):
+        with transaction.atomic():
+            self.delete_document(document_id)
+            SearchEntry.objects.filter(document_id=document_id).delete()
+
+    def clear(self):
+        """Empty the index so every document is indexed again"""
+        SearchEntry.objects.all().delete()
+
+    def finish_rebuild(self):
+        """Housekeeping after rebuild_search_index has indexed every document"""
+
+
+class IndexBackend(SearchBackend):
+    """Inverted index in the SearchTerm and SearchPosting tables, ranked with BM25"""
+
+    def _term_ids(self, terms):
+        """Map terms to their row ids, creating missing rows"""
+        ids = {}
+        terms = sorted(terms)
+        for start in range(0, len(terms), TERM_BATCH_SIZE):
+            batch = terms[start:start + TERM_BATCH_SIZE]
+            ids.update(SearchTerm.objects.filter(term__in=batch).values_list('term', 'pk'))
+            missing = [term for term in batch if term not in ids]
+            if missing:
+                # Rows created concurrently by another indexer are simply reused
+                SearchTerm.objects.bulk_create([SearchTerm(term=term) for term in missing], ignore_conflicts=True)
+                ids.update(SearchTerm.objects.filter(term__in=missing).values_list('term', 'pk'))
+        return ids
+
+    def _adjust_term_counts(self, document_id, delta):
+        """Add delta to the document count of every term the document has postings for"""
+        SearchTerm.objects.filter(
+            pk__in=SearchPosting.objects.filter(document_id=document_id).values('term_id')
+        ).update(document_count=F('document_count') + delta)
+
+    def write_document(self, document, text):
+        frequencies = Counter()
+        offsets = {}
+        for token, offset in tokenize_with_offsets(text):
+            frequencies[token] += 1
+            token_offsets = offsets.setdefault(token, [])
+            if len(token_offsets) < MAX_OFFSETS:
+                token_offsets.append(offset)
+        for token in tokenize(document.title):
+            frequencies[token] += TITLE_WEIGHT
+
+        self.delete_document(document.pk)
+        term_ids = self._term_ids(frequencies)
+        SearchPosting.objects.bulk_create(
+            [
+                SearchPosting(
+                    term_id=term_ids[term], document_id=document.pk, frequency=frequency,
+                    offsets=','.join(map(str, offsets.get(term, ()))),
+                )
+                for term, frequency in frequencies.items()
+            ],
+            batch_size=1000,
+        )
+        self._adjust_term_counts(document.pk, 1)
+        SearchEntry.objects.filter(document_id=document.pk).update(length=sum(frequencies.values()))
+
+    def delete_document(self, document_id):
+        self._adjust_term_counts(document_id, -1)
+        SearchPosting.objects.filter(document_id=document_id).delete()
+
+    def clear(self):
+        SearchPosting.objects.all().delete()
+        SearchTerm.objects.all().delete()
+        super().clear()
+
+    def finish_rebuild(self):
+        # Counts adjusted incrementally can drift if a save was interrupted
+        postings = SearchPosting.objects.filter(term=OuterRef('pk')).order_by()\
+            .values('term').annotate(count=Count('pk')).values('count')
+        SearchTerm.objects.update(document_count=Coalesce(Subquery(postings), 0))
+        SearchTerm.objects.filter(document_count=0).delete()
+        cache.delete(STATS_KEY)
+
+    def get_stats(self):
+        """(number of indexed documents, average weighted length)"""
+        stats = cache.get(STATS_KEY)
+        if stats is None:
+            totals = SearchEntry.objects.aggregate(count=Count('pk'), length=Avg('length'))
+            stats = (totals['count'], totals['length'] or 0)
+            cache.set(STATS_KEY, stats, STATS_TIMEOUT)
+        return stats
+
+    def search(self, query, queryset=None):
+        """Documents containing every term of query"""
+        documents = queryset if queryset is not None else Document.objects.all()
+        terms = set(tokenize(query))
+        if not terms:
+            return documents.none()
+
+        document_counts = dict(
+            SearchTerm.objects.filter(term__in=terms, document_count__gt=0).values_list('pk', 'document_count')
+        )
+        if len(document_counts) < len(terms):
+            # Some term occurs nowhere, so no document can contain them all
+            return documents.none()
+
+        total, average_length = self.get_stats()
+        # Stats may be a little stale; keep the idf and length weights positive
+        total = max(total, max(document_counts.values()))
+        average_length = max(average_length, 1)
+
+        # One join per term, rarest first: the database walks the shortest
+        # postings list and probes the (term, document) index for the others,
+        # and nothing has to be grouped by document
+        length = Cast('search_entry__length', FloatField())
+        scores = []
+        for index, (term_id, count) in enumerate(sorted(document_counts.items(), key=lambda item: item[1])):
+            postings = f'search_term_{index}'
+            documents = documents.alias(
+                **{postings: FilteredRelation('search_postings', condition=Q(search_postings__term_id=term_id))}
+            ).filter(**{f'{postings}__isnull': False})
+            idf = math.log(1 + (total - count + 0.5) / (count + 0.5))
+            frequency = Cast(f'{postings}__frequency', FloatField())
+            scores.append(idf * frequency * (BM25_K1 + 1) / (
+                frequency + BM25_K1 * (1 - BM25_B) + (BM25_K1 * BM25_B / average_length) * length
+            ))
+
+        return documents.annotate(search_score=sum(scores[1:], scores[0]))\
+            .order_by('-search_score', '-updated_at')
+
+    def snippets(self, documents, query):
+        """
+        The window of SNIPPET_LENGTH characters holding the most distinct
+        query terms, found from the stored offsets. Two queries per page:
+        one for the postings, one for the windows.
+        """
+        document_ids = [document.pk for document in documents]
+        terms = set(tokenize(query))
+        if not document_ids or not terms:
+            return {}
+
+        occurrences = {document_id: [] for document_id in document_ids}
+        postings = SearchPosting.objects.filter(document_id__in=document_ids, term__term__in=terms)\
+            .exclude(offsets='').values_list('document_id', 'term_id', 'offsets')
+        for document_id, term_id, offsets in postings:
+            occurrences[document_id].extend((int(offset), term_id) for offset in offsets.split(','))
+
+        starts = {}
+        for document_id, found in occurrences.items():
+            found.sort()
+            best = (0, 0)
+            for index, (offset, _) in enumerate(found):
+                in_window = set()
+                for other, term_id in found[index:]:
+                    if other >= offset + SNIPPET_LENGTH:
+                        break
+                    in_window.add(term_id)
+                if len(in_window) > best[0]:
+                    best = (len(in_window), offset)
+            # Start a little before the first match, for context
+            starts[document_id] = max(0, best[1] - SNIPPET_LENGTH // 4)
+
+        fragments = SearchEntry.objects.filter(document_id__in=document_ids).annotate(
+            fragment=Case(
+                *[When(document_id=document_id, then=Substr('text', start + 1, SNIPPET_LENGTH + 1))
+                  for document_id, start in starts.items()],
+                default=Value(''),
+            )
+        ).values_list('document_id', 'fragment')
+        # One character more than shown tells whether the text goes on
+        return {
+            document_id: highlight(
+                fragment[:SNIPPET_LENGTH], terms, starts[document_id] == 0, len(fragment) <= SNIPPET_LENGTH
+            )
+            for document_id, fragment in fragments
+        }
+
+
+class SQLiteBackend(SearchBackend):
+    """SQLite FTS5 virtual table keyed by document id"""
+
+    # FTS5 keeps its own copy of the text
+    stores_text = False
+
+    def _execute(self, sql, params=()):
+        with connections[router.db_for_write(Document)].cursor() as cursor:
+            cursor.execute(sql, params)
+
+    def create_table(self):
+        # Also created by migration 0019 where FTS5 is available
+        self._execute(
+            f"CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} "
+            f"USING fts5(title, body, tokenize = 'unicode61 remove_diacritics 2')"
+        )
+
+    def write_document(self, document, text):
+        self.delete_document(document.pk)
+        self._execute(
+            f'INSERT INTO {FTS_TABLE} (rowid, title, body) VALUES (%s, %s, %s)',
+            (document.pk, document.title, text),
+        )
+
+    def delete_document(self, document_id):
+        self._execute(f'DELETE FROM {FTS_TABLE} WHERE rowid = %s', (document_id,))
+
+    def clear(self):
+        self.create_table()
+        self._execute(f'DELETE FROM {FTS_TABLE}')
+        super().clear()
+
+    def _match(self, query):
+        # Quoted tokens cannot be read as FTS5 operators or column filters
+        return ' '.join(f'"{term}"' for term in dict.fromkeys(tokenize(query)))
+
+    def search(self, query, queryset=None):
+        """Documents containing every term of query"""
+        documents = queryset if queryset is not None else Document.objects.all()
+        match = self._match(query)
+        if not match:
+            return documents.none()
+
+        document_id = f'"{Document._meta.db_table}"."{Document._meta.pk.column}"'
+        # Joined once, so the MATCH runs a single time and drives the query;
+        # a correlated subquery per row would repeat it for every hit.
+        # bm25() is lower for better matches.
+        return documents.extra(
+            tables=[FTS_TABLE],
+            where=[f'{FTS_TABLE}.rowid = {document_id}', f'{FTS_TABLE} MATCH %s'],
+            params=[match],
+            select={'search_score': f'-bm25({FTS_TABLE}, %s, 1.0)'},
+            select_params=[float(TITLE_WEIGHT)],
+        ).order_by('-search_score', '-updated_at')
+
+    def snippets(self, documents, query):
+        document_ids = [document.pk for document in documents]
+        match = self._match(query)
+        if not document_ids or not match:
+            return {}
+        placeholders = ', '.join(['%s'] * len(document_ids))
+        # About a sixth of SNIPPET_LENGTH characters are one token
+        with connections[router.db_for_read(Document)].cursor() as cursor:
+            cursor.execute(
+                f'SELECT rowid, snippet({FTS_TABLE}, 1, %s, %s, %s, %s) FROM {FTS_TABLE} '
+                f'WHERE {FTS_TABLE} MATCH %s AND rowid IN ({placeholders})',
+                (MATCH_START, MATCH_END, '\x04', min(64, max(1, SNIPPET_LENGTH // 6)), match, *document_ids),
+            )
+            rows = cursor.fetchall()
+        return {
+            document_id: render_snippet(
+                fragment.strip('\x04'), not fragment.startswith('\x04'), not fragment.endswith('\x04')
+            )
+            for document_id, fragment in rows
+        }
+
+
+class PostgresBackend(SearchBackend):
+    """tsvector column on SearchEntry with a GIN index"""
+
+    def write_document(self, document, text):
+        from django.contrib.postgres.search import SearchVector
+
+        SearchEntry.objects.filter(document_id=document.pk).update(
+            search_vector=SearchVector(Value(document.title), weight='A', config=POSTGRES_CONFIG)
+            + SearchVector('text', weight='B', config=POSTGRES_CONFIG)
+        )
+
+    def delete_document(self, document_id):
+        # The vector is deleted with the SearchEntry row
+        pass
+
+    def search(self, query, queryset=None):
+        """Documents matching every term of query after stemming"""
+        from django.contrib.postgres.search import SearchQuery, SearchRank
+
+        documents = queryset if queryset is not None else Document.objects.all()
+        if not tokenize(query):
+            return documents.none()
+
+        search_query = SearchQuery(query, config=POSTGRES_CONFIG)
+        return documents.filter(search_entry__search_vector__matches=search_query)\
+            .annotate(search_score=SearchRank(F('search_entry__search_vector'), search_query))\
+            .order_by('-search_score', '-updated_at')
+
+    def snippets(self, documents, query):
+        from django.contrib.postgres.search import SearchHeadline, SearchQuery
+
+        document_ids = [document.pk for document in documents]
+        if not document_ids or not tokenize(query):
+            return {}
+        # ts_headline counts words; about six characters make a word
+        words = max(2, SNIPPET_LENGTH // 6)
+        headlines = SearchEntry.objects.filter(document_id__in=document_ids).annotate(
+            headline=SearchHeadline(
+                'text', SearchQuery(query, config=POSTGRES_CONFIG), config=POSTGRES_CONFIG,
+                start_sel=MATCH_START, stop_sel=MATCH_END, max_words=words, min_words=words // 2,
+            )
+        ).values_list('document_id', 'headline')
+        return {document_id: render_snippet(headline) for document_id, headline in headlines}
+
+
+class BasicBackend(SearchBackend):
+    """Substring matching on title and content, without an index"""
+
+    def index_document(self, document, force=False):
+        return False
+
+    def snippets(self, documents, query):
+        """The text around the first match, read from the documents themselves"""
+        document_ids = [document.pk for document in documents]
+        needle = query.strip().casefold()
+        if not document_ids or not needle:
+            return {}
+        terms = set(tokenize(query))
+        snippets = {}
+        for document_id, content in Document.objects.filter(pk__in=document_ids).values_list('pk', 'content'):
+            text = extract_text(content)
+            start = max(0, text.casefold().find(needle) - SNIPPET_LENGTH // 4)
+            fragment = text[start:start + SNIPPET_LENGTH]
+            snippets[document_id] = highlight(fragment, terms, start == 0, start + SNIPPET_LENGTH >= len(text))
+        return snippets
+
+    def remove_document(self, document_id):
+        pass
+
+    def search(self, query, queryset=None):
+        documents = queryset if queryset is not None else Document.objects.all()
+        if not query.strip():
+            return documents.none()
+        return documents.filter(Q(title__icontains=query) | Q(content__icontains=query))\
+            .annotate(search_score=Value(0.0, output_field=FloatField()))\
+            .order_by('-updated_at')
+
+
+BACKENDS = {
+    'index': IndexBackend,
+    'sqlite': SQLiteBackend,
+    'postgres': PostgresBackend,
+    'basic': BasicBackend,
+}
+
+
+def get_search_backend():
+    """An instance of the backend selected by DOCVAULT_SEARCH_BACKEND"""
+    name = getattr(settings, 'DOCVAULT_SEARCH_BACKEND', 'index')
+    if name in BACKENDS:
+        return BACKENDS[name]()
+    try:
+        backend_class = import_string(name)
+    except ImportError:
+        raise ImproperlyConfigured(
+            f"DOCVAULT_SEARCH_BACKEND must be one of {', '.join(BACKENDS)} or a dotted path, not {name!r}"
+        )
+    return backend_class()
+
+
+def search_documents(query, queryset=None):
+    """Search with the configured backend"""
+    return get_search_backend().search(query, queryset)
+
+
+def in_category(documents, category):
+    """Documents in category or any of its descendants, by materialized path prefix"""
+    if not category.path:
+        return documents.filter(category=category)
+    return documents.filter(Q(category__path=category.path) | Q(category__path__startswith=f'{category.path}.'))
+
+
+def category_facets(results):
+    """Number of results per top-level category, as {root category id: count}, in one query"""
+    # The root's id is the first component of the path
+    root = Case(
+        When(
+            category__path__contains='.',
+            then=Substr('category__path', 1, StrIndex('category__path', Value('.')) - 1),
+        ),
+        default=F('category__path'),
+    )
+    counts = Document.objects.filter(pk__in=results.order_by().values('pk'))\
+        .annotate(root=root).values('root').annotate(count=Count('pk')).order_by()\
+        .values_list('root', 'count')
+    return {int(root_id): count for root_id, count in counts if root_id}
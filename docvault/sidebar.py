@@ -0,0 +1,68 @@
+"""
+Rendered-HTML cache for the category navigation sidebar.
+
+The fragment is keyed on the tree generation, so any category or document
+change makes the next request render it again. Only the worker holding the
+rebuild lock renders; the others keep serving the previous fragment (or wait
+briefly for the new one when there is none yet).
+"""
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.template.loader import render_to_string
+from django.utils.safestring import mark_safe
+
+from .tree import get_generation, get_category_tree
+
+
+SIDEBAR_KEY = 'docvault:sidebar:{}'
+SIDEBAR_LATEST_KEY = 'docvault:sidebar:latest'
+SIDEBAR_LOCK_KEY = 'docvault:sidebar:lock:{}'
+SIDEBAR_TEMPLATE = 'docvault/includes/sidebar_categories.html'
+SIDEBAR_TIMEOUT = getattr(settings, 'DOCVAULT_SIDEBAR_CACHE_TIMEOUT', 60 * 60 * 24)
+
+# A crashed worker must not hold the rebuild lock forever
+LOCK_TIMEOUT = 30
+LOCK_WAIT = 2.0
+LOCK_POLL_INTERVAL = 0.05
+
+
+def render_sidebar(tree=None):
+    """Render the sidebar fragment from the tree snapshot"""
+    tree = tree or get_category_tree()
+    return render_to_string(SIDEBAR_TEMPLATE, {'categories': tree.get_root_categories()})
+
+
+def get_sidebar_html(tree=None):
+    """Return the rendered sidebar for the current tree generation"""
+    generation = get_generation()
+    key = SIDEBAR_KEY.format(generation)
+
+    html = cache.get(key)
+    if html is not None:
+        return mark_safe(html)
+
+    lock_key = SIDEBAR_LOCK_KEY.format(generation)
+    if cache.add(lock_key, True, LOCK_TIMEOUT):
+        try:
+            html = render_sidebar(tree)
+            cache.set_many({key: html, SIDEBAR_LATEST_KEY: html}, SIDEBAR_TIMEOUT)
+        finally:
+            cache.delete(lock_key)
+        return mark_safe(html)
+
+    # Another worker is rebuilding: serve the previous fragment if there is one
+    html = cache.get(SIDEBAR_LATEST_KEY)
+    if html is not None:
+        return mark_safe(html)
+
+    deadline = time.monotonic() + LOCK_WAIT
+    while time.monotonic() < deadline:
+        time.sleep(LOCK_POLL_INTERVAL)
+        html = cache.get(key)
+        if html is not None:
+            return mark_safe(html)
+
+    # The rebuilding worker is slow or gone; render without caching
+    return mark_safe(render_sidebar(tree))
@@ -0,0 +1,141 @@
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.db import transaction
+from django.db.models import F
+from django.db.models.signals import pre_save, post_save, pre_delete, post_delete
+from django.dispatch import receiver
+
+from .models import DocumentCategory, Document, DocumentVersion, ContentBlob, QueuedTask, latest_version_subquery
+from .counters import adjust_document_count, adjust_child_count, move_category_counts
+from .search import get_search_backend
+from .tasks import enqueue
+from .tree import bump_generation
+
+
+# Cleared while a caller deletes versions and repairs the delta chains itself
+_repair_history = ContextVar('docvault_repair_history', default=True)
+
+
+@contextmanager
+def history_repair_disabled():
+    """Delete versions without materializing their older neighbours one by one"""
+    token = _repair_history.set(False)
+    try:
+        yield
+    finally:
+        _repair_history.reset(token)
+
+
+@receiver(post_save, sender=DocumentCategory)
+@receiver(post_delete, sender=DocumentCategory)
+@receiver(post_save, sender=Document)
+@receiver(post_delete, sender=Document)
+def invalidate_category_tree(sender, **kwargs):
+    """Drop the cached category tree whenever categories or documents change"""
+    # Bump now so this process never serves a stale tree, and again after
+    # commit so other workers cannot cache a snapshot of uncommitted state
+    bump_generation()
+    transaction.on_commit(bump_generation)
+
+
+@receiver(pre_save, sender=Document)
+def remember_document_category(sender, instance, raw=False, **kwargs):
+    """Look up the stored category of documents that were not loaded from the database"""
+    if raw or instance._state.adding or hasattr(instance, '_counted_category_id'):
+        return
+    instance._counted_category_id = Document.objects.filter(pk=instance.pk)\
+        .values_list('category_id', flat=True).first()
+
+
+@receiver(post_save, sender=Document)
+def update_document_counts(sender, instance, created, raw=False, **kwargs):
+    """Keep category document counters in step with document creates and moves"""
+    if raw:
+        return
+    
+    if created:
+        adjust_document_count(instance.category_id, 1)
+    else:
+        previous_category_id = getattr(instance, '_counted_category_id', None)
+        if previous_category_id != instance.category_id:
+            if previous_category_id is not None:
+                adjust_document_count(previous_category_id, -1)
+            adjust_document_count(instance.category_id, 1)
+    instance._counted_category_id = instance.category_id
+
+
+@receiver(post_delete, sender=Document)
+def decrement_document_counts(sender, instance, **kwargs):
+    adjust_document_count(instance.category_id, -1)
+
+
+@receiver(post_save, sender=Document)
+def queue_document_tasks(sender, instance, raw=False, update_fields=None, **kwargs):
+    """Re-index and re-cache documents whose title or content changed, after the save"""
+    if raw:
+        return
+    # Document.save() records what changed; saves from elsewhere are assumed to change both
+    written = set(update_fields) if update_fields is not None else {'title', 'content'}
+    content_changed = 'content' in written and getattr(instance, '_content_changed', True)
+    title_changed = 'title' in written and getattr(instance, '_title_changed', True)
+    if content_changed or title_changed:
+        enqueue(QueuedTask.KIND_SEARCH_INDEX, instance.pk)
+    if content_changed:
+        enqueue(QueuedTask.KIND_TABLE_OF_CONTENTS, instance.pk)
+
+
+@receiver(pre_delete, sender=Document)
+def remove_from_search_index(sender, instance, **kwargs):
+    # Before the postings cascade away, so their terms can be counted down;
+    # rows in an FTS5 table are not cascaded at all
+    get_search_backend().remove_document(instance.pk)
+
+
+@receiver(post_save, sender=DocumentCategory)
+def update_category_counts(sender, instance, created, raw=False, **kwargs):
+    """Keep child counts and subtree totals in step with category creates and moves"""
+    if raw:
+        return
+    
+    if created:
+        if instance.parent_id:
+            adjust_child_count(instance.parent_id, 1)
+        return
+    
+    old_parent_id, old_path = getattr(instance, '_previous_tree_state', (instance.parent_id, None))
+    if old_parent_id != instance.parent_id:
+        move_category_counts(instance, old_parent_id, old_path)
+
+
+@receiver(post_delete, sender=DocumentCategory)
+def decrement_child_count(sender, instance, **kwargs):
+    # Documents protect their category, so a deleted category holds none
+    if instance.parent_id:
+        adjust_child_count(instance.parent_id, -1)
+
+
+@receiver(pre_delete, sender=DocumentVersion)
+def materialize_dependent_version(sender, instance, origin=None, **kwargs):
+    """An older delta-stored version must not lose the version it was diffed against"""
+    if isinstance(origin, Document) or not _repair_history.get():
+        return  # The whole history is going away, or the caller repairs it
+    instance._materialize_previous()
+
+
+@receiver(post_save, sender=DocumentVersion)
+def queue_version_stats(sender, instance, created, raw=False, **kwargs):
+    """Statistics not computed on save, or invalidated by an edited version, are computed in the background"""
+    if raw or (created and instance.lines_added is not None):
+        return
+    enqueue(QueuedTask.KIND_VERSION_STATS, instance.document_id)
+
+
+@receiver(post_delete, sender=DocumentVersion)
+def update_version_summary(sender, instance, **kwargs):
+    """Re-point the document at its newest remaining version and release its blob"""
+    Document.objects.filter(pk=instance.document_id).update(
+        latest_version=latest_version_subquery(),
+        version_count=F('version_count') - 1,
+    )
+    ContentBlob.release(instance.blob_id)
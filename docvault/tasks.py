@@ -0,0 +1,252 @@
+"""
+Database-backed queue for work that follows a document save.
+
+Search indexing, version statistics and the table of contents cache are
+not needed to finish a save, so the signal handlers in signals.py only
+record a QueuedTask row. Rows are unique per kind and document: saving a
+document ten times before the queue catches up still runs each task once.
+Because the queue is a table, pending work survives restarts.
+
+DOCVAULT_TASK_RUNNER decides who drains the queue:
+
+``'thread'`` (default, except on SQLite)
+    A small in-process thread pool, woken after each commit that queued work.
+``'worker'``
+    Only ``python manage.py process_tasks``, typically as a separate service.
+``'inline'`` (default on SQLite)
+    The saving request itself, right after commit. Handy for tests and
+    scripts that need the results immediately. SQLite allows one writer at a
+    time, and pool threads writing alongside requests fail with "database
+    is locked", so this is the default there.
+
+Running ``process_tasks`` alongside the thread pool is safe. A worker
+claims due rows by moving their ``available_at`` forward for a lease period,
+so a crashed worker's tasks become due again. Failed tasks are retried with
+exponential backoff; with the thread and inline runners a timer wakes the
+thread pool when the next retry falls due.
+"""
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+import logging
+import threading
+import traceback
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import IntegrityError, connections, router, transaction
+from django.db.models import Count, Min, Q
+from django.utils import timezone
+
+from .models import TOC_KEY, TOC_TIMEOUT, Document, DocumentVersion, QueuedTask
+from .search import get_search_backend
+
+
+logger = logging.getLogger(__name__)
+
+# How long a claimed task is reserved for the worker that claimed it
+LEASE = timedelta(seconds=getattr(settings, 'DOCVAULT_TASK_LEASE', 300))
+# First retry delay; doubled on every further failure up to a day
+RETRY_DELAY = timedelta(seconds=getattr(settings, 'DOCVAULT_TASK_RETRY_DELAY', 30))
+MAX_RETRY_DELAY = timedelta(days=1)
+THREADS = getattr(settings, 'DOCVAULT_TASK_THREADS', 2)
+# Shortest wait before waking the pool again, so a locked database is not polled in a loop
+MIN_WAKE_DELAY = timedelta(seconds=1)
+
+
+def get_task_runner():
+    runner = getattr(settings, 'DOCVAULT_TASK_RUNNER', None)
+    if runner is None:
+        vendor = connections[router.db_for_write(QueuedTask)].vendor
+        runner = 'inline' if vendor == 'sqlite' else 'thread'
+    return runner
+
+
+def update_search_index(document_id):
+    document = Document.objects.filter(pk=document_id).only('pk', 'title', 'content').first()
+    if document is not None:
+        get_search_backend().index_document(document)
+
+
+def compute_version_stats(document_id):
+    DocumentVersion.compute_missing_stats(document_id)
+
+
+def cache_table_of_contents(document_id):
+    document = Document.objects.filter(pk=document_id).only('pk', 'content', 'content_hash').first()
+    if document is not None and document.content_hash:
+        key = TOC_KEY.format(document.content_hash)
+        if cache.get(key) is None:
+            cache.set(key, document.generate_toc(), TOC_TIMEOUT)
+
+
+TASKS = {
+    QueuedTask.KIND_SEARCH_INDEX: update_search_index,
+    QueuedTask.KIND_VERSION_STATS: compute_version_stats,
+    QueuedTask.KIND_TABLE_OF_CONTENTS: cache_table_of_contents,
+}
+
+
+def enqueue(kind, document_id):
+    """
+    Queue a task for a document, merging with one already pending. The
+    runner is woken once the surrounding transaction commits.
+    """
+    now = timezone.now()
+    # A pending task only has enqueued_at moved, so a worker running it
+    # right now sees the new request and schedules another run. Update
+    # first and insert on a miss: bulk_create(update_conflicts=True) is
+    # not supported on MySQL.
+    pending = QueuedTask.objects.filter(kind=kind, document_id=document_id)
+    if not pending.update(enqueued_at=now):
+        try:
+            with transaction.atomic():
+                QueuedTask.objects.create(
+                    kind=kind, document_id=document_id, created_at=now, enqueued_at=now, available_at=now
+                )
+        except IntegrityError:
+            # Queued concurrently by another save
+            pending.update(enqueued_at=now)
+
+    runner = get_task_runner()
+    if runner == 'inline':
+        transaction.on_commit(
+            lambda: _run_inline(QueuedTask.objects.filter(kind=kind, document_id=document_id))
+        )
+    elif runner == 'thread':
+        transaction.on_commit(wake_thread_pool)
+
+
+def claim_tasks(batch_size, queryset=None):
+    """Reserve up to batch_size due tasks for this worker"""
+    queryset = queryset if queryset is not None else QueuedTask.objects.all()
+    now = timezone.now()
+    claimed = []
+    with transaction.atomic():
+        # Rows another worker is claiming right now are skipped, not waited for
+        candidates = queryset.filter(available_at__lte=now).order_by('available_at')\
+            .select_for_update(skip_locked=True)[:batch_size]
+        for task in candidates:
+            # Compare and set, for databases without row locks such as SQLite
+            if QueuedTask.objects.filter(pk=task.pk, available_at=task.available_at).update(available_at=now + LEASE):
+                claimed.append(task)
+    return claimed
+
+
+def run_task(task):
+    """Run one claimed task; returns True if it succeeded"""
+    try:
+        TASKS[task.kind](task.document_id)
+    except Exception:
+        attempts = task.attempts + 1
+        delay = min(RETRY_DELAY * 2 ** (attempts - 1), MAX_RETRY_DELAY)
+        logger.exception('Task %s failed (attempt %d), retrying in %s', task, attempts, delay)
+        QueuedTask.objects.filter(pk=task.pk).update(
+            attempts=attempts, last_error=traceback.format_exc(), available_at=timezone.now() + delay
+        )
+        return False
+
+    deleted, _ = QueuedTask.objects.filter(pk=task.pk, enqueued_at=task.enqueued_at).delete()
+    if not deleted:
+        # Requested again while running; the new request gets a fresh run
+        QueuedTask.objects.filter(pk=task.pk).update(
+            created_at=task.enqueued_at, available_at=timezone.now(), attempts=0, last_error=''
+        )
+    return True
+
+
+def process_tasks(batch_size=100, queryset=None):
+    """Run due tasks until none are left; returns (succeeded, failed)"""
+    succeeded = failed = 0
+    while True:
+        tasks = claim_tasks(batch_size, queryset)
+        if not tasks:
+            return succeeded, failed
+        for task in tasks:
+            if run_task(task):
+                succeeded += 1
+            else:
+                failed += 1
+
+
+def _run_inline(queryset):
+    _, failed = process_tasks(queryset=queryset)
+    if failed:
+        schedule_wake()
+
+
+_executor = None
+_scheduled = 0
+_timer = None
+_timer_due = None
+_lock = threading.Lock()
+
+
+def wake_thread_pool():
+    """Make sure a pool thread is (or will be) draining the queue"""
+    global _executor, _scheduled
+    with _lock:
+        if _scheduled >= THREADS:
+            return  # Every thread is already draining and will see the new task
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=THREADS, thread_name_prefix='docvault-tasks')
+        _scheduled += 1
+    _executor.submit(_drain_in_thread)
+
+
+def _drain_in_thread():
+    global _scheduled
+    try:
+        process_tasks()
+    except Exception:
+        logger.exception('Draining the task queue failed')
+    finally:
+        with _lock:
+            _scheduled -= 1
+    try:
+        # Tasks left behind are waiting for a retry or another worker's lease
+        schedule_wake()
+    except Exception:
+        logger.exception('Scheduling the next task queue run failed')
+    finally:
+        # Threads outside the request cycle must close their own connections
+        connections.close_all()
+
+
+def schedule_wake():
+    """Wake the thread pool when the next pending task falls due"""
+    global _timer, _timer_due
+    due = QueuedTask.objects.aggregate(due=Min('available_at'))['due']
+    if due is None:
+        return
+    due = max(due, timezone.now() + MIN_WAKE_DELAY)
+    with _lock:
+        if _timer is not None and _timer.is_alive() and _timer_due <= due:
+            return  # An earlier wake-up will schedule the next one
+        if _timer is not None:
+            _timer.cancel()
+        _timer = threading.Timer((due - timezone.now()).total_seconds(), wake_thread_pool)
+        _timer.daemon = True
+        _timer_due = due
+        _timer.start()
+
+
+def queue_stats():
+    """Queue depth, lag and failing tasks, in total and per kind"""
+    now = timezone.now()
+    kinds = {}
+    for row in QueuedTask.objects.values('kind').order_by('kind').annotate(
+        depth=Count('pk'),
+        oldest=Min('created_at'),
+        failing=Count('pk', filter=Q(attempts__gt=0)),
+    ):
+        kinds[row['kind']] = {
+            'depth': row['depth'],
+            'failing': row['failing'],
+            'lag': (now - row['oldest']).total_seconds(),
+        }
+    return {
+        'depth': sum(kind['depth'] for kind in kinds.values()),
+        'failing': sum(kind['failing'] for kind in kinds.values()),
+        'lag': max((kind['lag'] for kind in kinds.values()), default=0),
+        'kinds': kinds,
+    }
@@ -0,0 +1,46 @@
+from datetime import timedelta
+
+from django.core.paginator import Paginator
+from django.test import TestCase
+from django.utils import timezone
+
+from docvault.models import Document, DocumentCategory, DocumentVersion
+
+
+class AsOfTests(TestCase):
+    def setUp(self):
+        self.category = DocumentCategory.objects.create(name='Guides', slug='guides')
+        self.cutoff = timezone.now() - timedelta(days=1)
+        earlier = self.cutoff - timedelta(days=1)
+
+        self.edited = Document.objects.create(
+            title='Edited', slug='edited', content='old', category=self.category, created_at=earlier
+        )
+        DocumentVersion.objects.filter(document=self.edited).update(created_at=earlier)
+        self.edited.content = 'new'
+        self.edited.save()
+
+        # Created before the cutoff, but its only version is newer (e.g. imported history)
+        self.unversioned = Document.objects.create(
+            title='Unversioned', slug='unversioned', content='text', category=self.category, created_at=earlier
+        )
+        DocumentVersion.objects.filter(document=self.unversioned).update(created_at=timezone.now())
+
+        Document.objects.create(title='New', slug='new', content='text', category=self.category)
+
+    def test_rewinds_content(self):
+        documents = list(Document.objects.as_of(self.cutoff))
+        self.assertEqual([document.pk for document in documents], [self.edited.pk])
+        self.assertEqual(documents[0].content, 'old')
+
+    def test_count_matches_pages(self):
+        queryset = Document.objects.as_of(self.cutoff).order_by('pk')
+        paginator = Paginator(queryset, 1)
+        self.assertEqual(paginator.count, 1)
+        self.assertEqual(len(paginator.page(1).object_list), 1)
+
+    def test_values_are_rejected(self):
+        with self.assertRaises(TypeError):
+            Document.objects.as_of(self.cutoff).values('content')
+        with self.assertRaises(TypeError):
+            Document.objects.as_of(self.cutoff).values_list('content', flat=True)
@@ -0,0 +1,57 @@
+from django.core.exceptions import ValidationError
+from django.db import IntegrityError, transaction
+from django.db.models import QuerySet
+from django.test import TestCase
+
+from docvault import tree
+from docvault.models import DocumentCategory
+
+
+class RootSlugTests(TestCase):
+    def setUp(self):
+        self.root = DocumentCategory.objects.create(name='Guides', slug='guides')
+
+    def test_duplicate_root_slug_fails_validation(self):
+        with self.assertRaises(ValidationError):
+            DocumentCategory(name='Other guides', slug='guides').full_clean()
+
+    def test_duplicate_root_slug_is_rejected_by_the_database(self):
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            DocumentCategory.objects.create(name='Other guides', slug='guides')
+
+    def test_child_may_reuse_a_root_slug(self):
+        child = DocumentCategory.objects.create(name='Guides', slug='guides', parent=self.root)
+        self.assertEqual(child.url_path, 'guides/guides')
+
+
+class HierarchyQuerySetTests(TestCase):
+    def setUp(self):
+        self.root = DocumentCategory.objects.create(name='Guides', slug='guides')
+        self.child = DocumentCategory.objects.create(name='Setup', slug='setup', parent=self.root)
+        self.sibling = DocumentCategory.objects.create(name='Usage', slug='usage', parent=self.root)
+        self.leaf = DocumentCategory.objects.create(name='Linux', slug='linux', parent=self.child)
+        tree.bump_generation()
+
+    def assertHierarchy(self):
+        ancestors = self.leaf.get_ancestors(include_self=True)
+        descendants = self.root.get_descendants()
+        siblings = self.child.get_siblings()
+        for queryset in (ancestors, descendants, siblings):
+            self.assertIsInstance(queryset, QuerySet)
+        self.assertEqual(list(ancestors), [self.root, self.child, self.leaf])
+        self.assertEqual(list(descendants), [self.child, self.leaf, self.sibling])
+        self.assertEqual(list(siblings), [self.sibling])
+        # Chained calls still go to the database with the same ids
+        self.assertEqual(list(descendants.filter(depth=1).values_list('slug', flat=True)), ['setup', 'usage'])
+        self.assertEqual(list(self.root.get_all_documents()), [])
+
+    def test_without_snapshot(self):
+        self.assertIsNone(tree.get_loaded_category_tree())
+        self.assertHierarchy()
+
+    def test_with_snapshot(self):
+        tree.get_category_tree()
+        with self.assertNumQueries(0):
+            list(self.leaf.get_ancestors(include_self=True))
+            list(self.root.get_descendants())
+        self.assertHierarchy()
@@ -0,0 +1,49 @@
+from django.test import TestCase
+
+from docvault.models import Document, DocumentCategory
+
+
+class CategoryCounterTests(TestCase):
+    def setUp(self):
+        self.root = DocumentCategory.objects.create(name='Root', slug='root')
+        self.guides = DocumentCategory.objects.create(name='Guides', slug='guides', parent=self.root)
+        self.other = DocumentCategory.objects.create(name='Other', slug='other')
+
+    def assertCounts(self, category, document_count, subtree_document_count):
+        category.refresh_from_db()
+        self.assertEqual(
+            (category.document_count, category.subtree_document_count),
+            (document_count, subtree_document_count),
+        )
+
+    def test_create_move_and_delete_document(self):
+        document = Document.objects.create(title='Intro', slug='intro', content='<p>Hi</p>', category=self.guides)
+        self.assertCounts(self.guides, 1, 1)
+        self.assertCounts(self.root, 0, 1)
+        self.assertCounts(self.other, 0, 0)
+
+        document.category = self.other
+        document.save()
+        self.assertCounts(self.guides, 0, 0)
+        self.assertCounts(self.root, 0, 0)
+        self.assertCounts(self.other, 1, 1)
+
+        document.delete()
+        self.assertCounts(self.other, 0, 0)
+
+    def test_move_category_carries_subtree_total(self):
+        Document.objects.create(title='Intro', slug='intro', content='', category=self.guides)
+        self.guides.move_to(self.other)
+        self.assertCounts(self.root, 0, 0)
+        self.assertCounts(self.other, 0, 1)
+        self.root.refresh_from_db()
+        self.other.refresh_from_db()
+        self.assertEqual((self.root.child_count, self.other.child_count), (0, 1))
+
+    def test_saving_unloaded_instance_keeps_counters(self):
+        Document.objects.create(title='Intro', slug='intro', content='', category=self.guides)
+        DocumentCategory(pk=self.guides.pk, name='Renamed', slug='guides', parent=self.root).save()
+        self.assertCounts(self.guides, 1, 1)
+        self.assertCounts(self.root, 0, 1)
+        self.root.refresh_from_db()
+        self.assertEqual(self.root.child_count, 1)
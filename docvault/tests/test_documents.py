@@ -0,0 +1,41 @@
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+
+from docvault.models import Document, DocumentCategory, QueuedTask
+
+
+class DocumentSaveTests(TestCase):
+    def setUp(self):
+        category = DocumentCategory.objects.create(name='Guides', slug='guides')
+        Document.objects.create(title='Intro', slug='intro', content='<h2>Start</h2>', category=category)
+        QueuedTask.objects.all().delete()
+        self.document = Document.objects.get(slug='intro')
+
+    def queued_kinds(self):
+        return set(QueuedTask.objects.values_list('kind', flat=True))
+
+    def test_unchanged_save_is_a_single_update(self):
+        with CaptureQueriesContext(connection) as queries:
+            self.document.save()
+        statements = [query['sql'] for query in queries if not query['sql'].startswith(('SAVEPOINT', 'RELEASE'))]
+        self.assertEqual(len(statements), 1, statements)
+        self.assertEqual(self.queued_kinds(), set())
+
+    def test_title_change_queues_indexing_only(self):
+        self.document.title = 'Introduction'
+        self.document.save()
+        self.assertEqual(self.queued_kinds(), {QueuedTask.KIND_SEARCH_INDEX})
+
+    def test_content_change_queues_indexing_table_of_contents_and_statistics(self):
+        self.document.content = '<h2>Begin</h2>'
+        self.document.save()
+        self.assertEqual(self.queued_kinds(), {
+            QueuedTask.KIND_SEARCH_INDEX, QueuedTask.KIND_TABLE_OF_CONTENTS, QueuedTask.KIND_VERSION_STATS,
+        })
+
+    def test_repeated_saves_merge_into_one_pending_task(self):
+        for content in ('<h2>One</h2>', '<h2>Two</h2>'):
+            self.document.content = content
+            self.document.save()
+        self.assertEqual(QueuedTask.objects.filter(kind=QueuedTask.KIND_SEARCH_INDEX).count(), 1)
@@ -0,0 +1,53 @@
+from datetime import timedelta
+from io import StringIO
+
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from docvault.models import Changelog, Document, DocumentCategory, DocumentVersion
+
+
+@override_settings(DOCVAULT_VERSION_STORAGE='delta')
+class PruneVersionsTests(TestCase):
+    def setUp(self):
+        category = DocumentCategory.objects.create(name='Guides', slug='guides')
+        body = ''.join(f'<p>Paragraph {number}</p>\n' for number in range(50))
+        self.contents = [body + ''.join(f'<p>Edit {number}</p>\n' for number in range(edits)) for edits in range(1, 7)]
+        self.document = Document.objects.create(title='Intro', slug='intro', content=self.contents[0], category=category)
+        for content in self.contents[1:]:
+            self.document.content = content
+            self.document.save()
+        # Old enough to fall outside the daily and weekly checkpoints
+        DocumentVersion.objects.filter(document=self.document).update(created_at=timezone.now() - timedelta(days=1000))
+
+    def prune(self, **options):
+        call_command('prune_versions', keep_last=1, keep_daily=0, keep_weekly=0, stdout=StringIO(), **options)
+
+    def test_kept_delta_version_behind_a_pruned_gap_still_reconstructs(self):
+        kept = DocumentVersion.objects.get(document=self.document, version_number=2)
+        self.assertEqual(kept.storage, DocumentVersion.STORAGE_DELTA)
+        Changelog.objects.create(document=self.document, description='Keep v2', version=kept)
+
+        self.prune()
+
+        versions = DocumentVersion.objects.filter(document=self.document).order_by('version_number')
+        self.assertEqual([version.version_number for version in versions], [2, 6])
+        self.assertEqual(DocumentVersion.objects.get(pk=kept.pk).content, self.contents[1])
+        newest = versions.last()
+        self.assertEqual(newest.content, self.contents[5])
+        # v6 now squashes v3 to v5 and counts its changes against v2
+        self.assertEqual(newest.lines_added, 4)
+
+        self.document.refresh_from_db()
+        self.assertEqual(self.document.version_count, 2)
+        self.assertEqual(self.document.latest_version_id, newest.pk)
+
+    def test_pruned_rows_are_deleted_without_their_bodies(self):
+        with CaptureQueriesContext(connection) as queries:
+            self.prune()
+        selects = [query['sql'] for query in queries if query['sql'].startswith('SELECT') and '"delta"' in query['sql']]
+        # Only the command's own walk over the history reads the bodies
+        self.assertEqual(len(selects), 1)
@@ -0,0 +1,45 @@
+from unittest import skipUnless
+
+from django.db import connection
+from django.test import TestCase
+
+from docvault.models import Document, DocumentCategory
+from docvault.search import IndexBackend, SQLiteBackend, category_facets, in_category
+
+
+class IndexBackendTests(TestCase):
+    backend_class = IndexBackend
+
+    def setUp(self):
+        self.backend = self.backend_class()
+        self.backend.clear()
+        self.guides = DocumentCategory.objects.create(name='Guides', slug='guides')
+        self.other = DocumentCategory.objects.create(name='Other', slug='other')
+        self.often = Document.objects.create(
+            title='Restart', slug='often', content='<p>restart the server, restart the worker</p>', category=self.guides
+        )
+        self.once = Document.objects.create(
+            title='Servers', slug='once', content='<p>how to restart a server</p>', category=self.other
+        )
+        Document.objects.create(title='Unrelated', slug='unrelated', content='<p>nothing here</p>', category=self.other)
+        for document in Document.objects.all():
+            self.backend.index_document(document)
+
+    def test_ranks_matches_best_first(self):
+        results = self.backend.search('restart')
+        self.assertEqual([document.pk for document in results], [self.often.pk, self.once.pk])
+        self.assertGreater(results[0].search_score, results[1].search_score)
+        self.assertEqual(results.count(), 2)
+
+    def test_every_term_must_match(self):
+        self.assertEqual([document.pk for document in self.backend.search('restart worker')], [self.often.pk])
+
+    def test_composes_with_category_scoping_and_facets(self):
+        results = self.backend.search('restart')
+        self.assertEqual([document.pk for document in in_category(results, self.other)], [self.once.pk])
+        self.assertEqual(category_facets(results), {self.guides.pk: 1, self.other.pk: 1})
+
+
+@skipUnless(connection.vendor == 'sqlite', 'FTS5 needs SQLite')
+class SQLiteBackendTests(IndexBackendTests):
+    backend_class = SQLiteBackend
@@ -0,0 +1,71 @@
+from datetime import timedelta
+import time
+from unittest import mock, skipIf
+
+from django.db import connection
+from django.test import TransactionTestCase, override_settings
+
+from docvault import tasks
+from docvault.models import Document, DocumentCategory, QueuedTask, SearchEntry
+
+
+# SQLite makes pool threads fail with "database is locked" now and then; retry quickly
+fast_retries = mock.patch.multiple(
+    tasks, RETRY_DELAY=timedelta(milliseconds=100), MIN_WAKE_DELAY=timedelta(milliseconds=100)
+)
+
+
+class TaskQueueTestCase(TransactionTestCase):
+    def setUp(self):
+        self.category = DocumentCategory.objects.create(name='Guides', slug='guides')
+
+    def wait_for_queue(self, timeout=10):
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            if not QueuedTask.objects.exists() and not tasks._scheduled:
+                return
+            time.sleep(0.05)
+        self.fail(f'{QueuedTask.objects.count()} tasks still queued')
+
+    def create_documents(self, count=5):
+        return [
+            Document.objects.create(title=f'Guide {number}', slug=f'guide-{number}', content='<p>Text</p>', category=self.category)
+            for number in range(count)
+        ]
+
+
+class DefaultRunnerTests(TaskQueueTestCase):
+    def test_indexes_every_document(self):
+        documents = self.create_documents()
+        self.wait_for_queue()
+        self.assertEqual(SearchEntry.objects.filter(document__in=documents).count(), len(documents))
+
+
+@skipIf(
+    connection.vendor == 'sqlite' and connection.is_in_memory_db(),
+    'Threads cannot write to a shared in-memory SQLite database alongside the test',
+)
+@override_settings(DOCVAULT_TASK_RUNNER='thread')
+class ThreadRunnerTests(TaskQueueTestCase):
+    @fast_retries
+    def test_indexes_every_document(self):
+        documents = self.create_documents()
+        self.wait_for_queue()
+        self.assertEqual(SearchEntry.objects.filter(document__in=documents).count(), len(documents))
+
+    @fast_retries
+    def test_failed_task_is_retried_after_the_backoff(self):
+        calls = []
+
+        def flaky(document_id):
+            calls.append(document_id)
+            if len(calls) == 1:
+                raise RuntimeError('Temporary failure')
+            tasks.update_search_index(document_id)
+
+        with mock.patch.dict(tasks.TASKS, {QueuedTask.KIND_SEARCH_INDEX: flaky}):
+            document, = self.create_documents(1)
+            self.wait_for_queue()
+
+        self.assertGreaterEqual(len(calls), 2)
+        self.assertTrue(SearchEntry.objects.filter(document=document).exists())
@@ -0,0 +1,56 @@
+from unittest import mock
+
+from django.db import IntegrityError
+from django.test import TestCase
+
+from docvault import tasks
+from docvault.diff import get_version_diff
+from docvault.models import Document, DocumentCategory, QueuedTask
+
+
+class DocumentVersionTests(TestCase):
+    def setUp(self):
+        self.category = DocumentCategory.objects.create(name='Guides', slug='guides')
+        self.document = Document.objects.create(title='Intro', slug='intro', content='one', category=self.category)
+
+    def test_content_changes_get_consecutive_versions(self):
+        for content in ('two', 'three'):
+            self.document.content = content
+            self.document.save()
+        self.document.title = 'Introduction'
+        self.document.save()
+
+        self.assertEqual(list(self.document.versions.order_by('version_number').values_list('version_number', flat=True)), [1, 2, 3])
+        self.document.refresh_from_db()
+        self.assertEqual((self.document.version_count, self.document.last_version_number), (3, 3))
+
+    def test_failed_version_insert_rolls_back_the_content_change(self):
+        self.document.content = 'two'
+        with mock.patch.object(Document, 'add_version', side_effect=IntegrityError), self.assertRaises(IntegrityError):
+            self.document.save()
+
+        stored = Document.objects.get(pk=self.document.pk)
+        self.assertEqual(stored.content, 'one')
+        self.assertEqual(stored.versions.count(), 1)
+
+    def test_statistics_are_computed_by_the_queue(self):
+        self.document.content = 'one\ntwo'
+        self.document.save()
+        version = self.document.versions.get(version_number=2)
+        self.assertIsNone(version.lines_added)
+        self.assertTrue(QueuedTask.objects.filter(kind=QueuedTask.KIND_VERSION_STATS, document=self.document).exists())
+
+        tasks.compute_version_stats(self.document.pk)
+        version.refresh_from_db()
+        self.assertEqual((version.lines_added, version.lines_removed), (1, 0))
+
+    def test_editing_a_version_does_not_serve_a_stale_diff(self):
+        self.document.content = 'one\ntwo'
+        self.document.save()
+        version1, version2 = self.document.versions.defer('content').order_by('version_number')
+        self.assertEqual(get_version_diff(version1, version2)['added'], 1)
+
+        version2.content = 'one\ntwo\nthree'
+        version2.save()
+        version2 = self.document.versions.defer('content').get(pk=version2.pk)
+        self.assertEqual(get_version_diff(version1, version2)['added'], 2)
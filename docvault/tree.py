@@ -0,0 +1,317 @@
+"""
+Process-wide snapshot of the category tree.
+
+Building the category lookups (URL paths, slug/parent pairs, counters)
+used to happen on every request. The snapshot is built once, shared by every
+request in the process and mirrored into Django's cache so other workers can
+reuse it. A generation counter stored in the cache versions the snapshot and
+is bumped by signals whenever a category or document changes.
+"""
+from array import array
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+
+from .models import DocumentCategory
+
+
+GENERATION_KEY = 'docvault:tree:generation'
+SNAPSHOT_KEY = 'docvault:tree:snapshot:{}'
+SNAPSHOT_TIMEOUT = getattr(settings, 'DOCVAULT_TREE_CACHE_TIMEOUT', 60 * 60 * 24)
+
+CATEGORY_FIELDS = (
+    'id', 'name', 'slug', 'description', 'parent_id', 'path', 'depth', 'url_path',
+    'document_count', 'child_count', 'subtree_document_count',
+)
+
+_process_snapshot = None
+_build_lock = threading.Lock()
+
+
+class CategoryTree:
+    """
+    Read-only, picklable snapshot of all categories.
+
+    Categories are laid out in depth-first (pre-order) positions and stored in
+    parallel arrays indexed by position. Each category's subtree occupies the
+    contiguous Euler-tour interval ``[enter, exit]``, so ancestor checks,
+    descendant listings and subtree sizes need no database access.
+    """
+
+    def __init__(self, generation, rows):
+        self.generation = generation
+
+        rows = list(rows)
+        known_ids = {row[0] for row in rows}
+        children = {}
+        for row_index, row in enumerate(rows):
+            # Rows whose parent is missing are treated as roots
+            parent_id = row[4] if row[4] in known_ids else None
+            children.setdefault(parent_id, []).append(row_index)
+
+        self.positions = {}
+        self.rows = []
+        self.ids = array('q')
+        self.parents = array('q')
+        self.depths = array('q')
+        self.exits = array('q')
+        self.url_paths = []
+        self.by_url_path = {}
+
+        # Iterative pre-order walk; a node's exit is known once its subtree is done
+        stack = [(row_index, -1, False) for row_index in reversed(children.get(None, ()))]
+        while stack:
+            row_index, parent_position, done = stack.pop()
+            if done:
+                self.exits[parent_position] = len(self.ids) - 1
+                continue
+
+            row = rows[row_index]
+            position = len(self.ids)
+            self.positions[row[0]] = position
+            self.rows.append(row)
+            self.ids.append(row[0])
+            self.parents.append(parent_position)
+            self.depths.append(self.depths[parent_position] + 1 if parent_position >= 0 else 0)
+            self.exits.append(position)
+
+            url_path = row[7]
+            if not url_path:
+                # Rows saved before url_path existed are resolved from their parent
+                parent_path = self.url_paths[parent_position] if parent_position >= 0 else None
+                url_path = f"{parent_path}/{row[2]}" if parent_path else row[2]
+            self.url_paths.append(url_path)
+            self.by_url_path[url_path] = row[0]
+
+            stack.append((position, position, True))
+            for child_index in reversed(children.get(row[0], ())):
+                stack.append((child_index, position, False))
+
+    def __contains__(self, category_id):
+        return category_id in self.positions
+
+    def __len__(self):
+        return len(self.ids)
+
+    def get_url_path(self, category_id):
+        position = self.positions.get(category_id)
+        return self.url_paths[position] if position is not None else None
+
+    # Structural queries (ids only, no model instances)
+
+    def get_parent_id(self, category_id):
+        parent = self.parents[self.positions[category_id]]
+        return self.ids[parent] if parent >= 0 else None
+
+    def get_child_ids(self, category_id):
+        position = self.positions[category_id]
+        return self._child_ids(position)
+
+    def _child_ids(self, position):
+        """Direct children are found by hopping from one subtree to the next"""
+        child_ids = []
+        child = position + 1
+        last = self.exits[position] if position >= 0 else len(self.ids) - 1
+        while child <= last:
+            child_ids.append(self.ids[child])
+            child = self.exits[child] + 1
+        return child_ids
+
+    def get_root_ids(self):
+        return self._child_ids(-1)
+
+    def get_ancestor_ids(self, category_id, include_self=False):
+        """Ancestor ids ordered from the root down"""
+        position = self.positions[category_id]
+        ancestor_ids = [category_id] if include_self else []
+        parent = self.parents[position]
+        while parent >= 0:
+            ancestor_ids.append(self.ids[parent])
+            parent = self.parents[parent]
+        ancestor_ids.reverse()
+        return ancestor_ids
+
+    def get_descendant_ids(self, category_id, include_self=False):
+        """Descendant ids in pre-order; a single slice of the Euler interval"""
+        position = self.positions[category_id]
+        start = position if include_self else position + 1
+        return list(self.ids[start:self.exits[position] + 1])
+
+    def get_sibling_ids(self, category_id, include_self=False):
+        position = self.positions[category_id]
+        sibling_ids = self._child_ids(self.parents[position])
+        if not include_self:
+            sibling_ids.remove(category_id)
+        return sibling_ids
+
+    def get_subtree_size(self, category_id):
+        """Number of categories in the subtree, including the category itself"""
+        position = self.positions[category_id]
+        return self.exits[position] - position + 1
+
+    def has_children(self, category_id):
+        position = self.positions[category_id]
+        return self.exits[position] > position
+
+    def is_ancestor(self, ancestor_id, category_id):
+        """True if ancestor_id is a proper ancestor of category_id"""
+        ancestor = self.positions[ancestor_id]
+        position = self.positions[category_id]
+        return ancestor < position <= self.exits[ancestor]
+
+    # Model instances
+
+    def get_category(self, category_id, with_children=False, materialized=None):
+        """
+        Materialize a category instance without touching the database.
+
+        ``materialized`` is an optional id -> instance dict shared between calls
+        so that categories listed together reuse the same parent instances.
+        """
+        if materialized is not None and category_id in materialized and not with_children:
+            return materialized[category_id]
+
+        position = self.positions.get(category_id)
+        if position is None:
+            return None
+
+        category = DocumentCategory.from_db(DocumentCategory.objects.db, CATEGORY_FIELDS, self.rows[position])
+        category.cached_url_path = self.url_paths[position]
+
+        parent = self.parents[position]
+        if parent >= 0:
+            category.parent = self.get_category(self.ids[parent], materialized=materialized)
+
+        if with_children:
+            children = []
+            for child_id in self._child_ids(position):
+                child = self.get_category(child_id)
+                child.parent = category
+                children.append(child)
+            _set_prefetched_children(category, children)
+
+        if materialized is not None:
+            materialized[category_id] = category
+        return category
+
+    def get_categories(self, category_ids):
+        materialized = {}
+        return [self.get_category(category_id, materialized=materialized) for category_id in category_ids]
+
+    def get_queryset(self, category_ids, *ordering):
+        """
+        A queryset over ``category_ids`` whose results come from the snapshot.
+
+        Iterating it needs no query; chaining (filter, values, ...) builds a
+        normal query restricted to the same ids.
+        """
+        queryset = DocumentCategory.objects.filter(pk__in=category_ids)
+        if ordering:
+            queryset = queryset.order_by(*ordering)
+        queryset._result_cache = self.get_categories(category_ids)
+        queryset._prefetch_done = True
+        return queryset
+
+    def get_category_by_path(self, url_path, with_children=True):
+        category_id = self.by_url_path.get(url_path.strip('/'))
+        if category_id is None:
+            return None
+        return self.get_category(category_id, with_children=with_children)
+
+    def get_root_categories(self):
+        """Root categories with their direct children attached"""
+        return [
+            self.get_category(category_id, with_children=True)
+            for category_id in self.get_root_ids()
+        ]
+
+    def get_breadcrumbs(self, category_id):
+        return self.get_categories(self.get_ancestor_ids(category_id, include_self=True))
+
+
+def _set_prefetched_children(category, children):
+    """Attach children so that ``category.children.all()`` needs no query"""
+    queryset = category.children.all()
+    queryset._result_cache = children
+    queryset._prefetch_done = True
+    if not hasattr(category, '_prefetched_objects_cache'):
+        category._prefetched_objects_cache = {}
+    category._prefetched_objects_cache['children'] = queryset
+
+
+def get_generation():
+    """Return the current tree generation, initialising it if needed"""
+    generation = cache.get(GENERATION_KEY)
+    if generation is None:
+        # Seed with a timestamp so an evicted counter never reuses an old key
+        cache.add(GENERATION_KEY, time.time_ns(), None)
+        generation = cache.get(GENERATION_KEY)
+    return generation
+
+
+def bump_generation():
+    """Invalidate every snapshot, in this process and in the shared cache"""
+    global _process_snapshot
+    _process_snapshot = None
+    try:
+        cache.incr(GENERATION_KEY)
+    except ValueError:
+        cache.add(GENERATION_KEY, time.time_ns(), None)
+
+
+def build_category_tree(generation=None):
+    """Build a snapshot straight from the database"""
+    # Counts come from the maintained counter columns, no aggregation needed
+    rows = list(DocumentCategory.objects.order_by('path').values_list(*CATEGORY_FIELDS))
+    return CategoryTree(generation, rows)
+
+
+def get_category_tree():
+    """Return the current snapshot, building it at most once per generation"""
+    global _process_snapshot
+    generation = get_generation()
+
+    tree = _process_snapshot
+    if tree is not None and tree.generation == generation:
+        return tree
+
+    with _build_lock:
+        tree = _process_snapshot
+        if tree is not None and tree.generation == generation:
+            return tree
+
+        snapshot_key = SNAPSHOT_KEY.format(generation)
+        tree = cache.get(snapshot_key)
+        if tree is None:
+            tree = build_category_tree(generation)
+            cache.set(snapshot_key, tree, SNAPSHOT_TIMEOUT)
+
+        _process_snapshot = tree
+        return tree
+
+
+def get_loaded_category_tree():
+    """
+    Return the process snapshot if one is loaded and still current, else None.
+
+    Unlike get_category_tree() this never builds a snapshot, so model methods
+    can use it opportunistically and fall back to the database.
+    """
+    tree = _process_snapshot
+    if tree is not None and tree.generation == get_generation():
+        return tree
+    return None
+
+
+def attach_url_paths(categories, tree=None):
+    """Set cached_url_path on category instances from the snapshot"""
+    tree = tree or get_category_tree()
+    for category in categories:
+        if category is None:
+            continue
+        url_path = tree.get_url_path(category.id)
+        if url_path is not None:
+            category.cached_url_path = url_path
+    return categories
@@ -1,36 +1,52 @@
-from django.db.models import Count
-from .models import DocumentCategory, Document
+from datetime import datetime, time
+
+from django.conf import settings
+from django.core.exceptions import BadRequest
+from django.db.models import Prefetch
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+
+from .models import DocumentCategory, Document, DocumentVersion, Changelog
+from .tree import get_category_tree, attach_url_paths
 
 
 def get_optimized_categories_queryset():
-    """Get optimized queryset for categories with counts and relationships"""
-    return DocumentCategory.objects.filter(parent=None)\
-        .prefetch_related('children', 'children__documents')\
-        .annotate(
-            document_count=Count('documents'),
-            child_count=Count('children')
-        )
+    """Get optimized queryset for root categories and their children"""
+    # document_count and child_count are stored on the rows, no annotation needed
+    return DocumentCategory.objects.filter(parent=None).prefetch_related('children')
+
+
+RECENT_HISTORY_LIMIT = 5
+
+
+def get_recent_history_prefetches(limit=RECENT_HISTORY_LIMIT):
+    """
+    Prefetch only the newest versions and changelog entries of each document.
+
+    The sliced querysets are windowed per document, and version content is
+    deferred because the listings only show numbers, dates and authors.
+    """
+    return (
+        Prefetch(
+            'versions',
+            queryset=DocumentVersion.objects.defer('content').order_by('-version_number')[:limit],
+            to_attr='recent_versions',
+        ),
+        Prefetch(
+            'changelogs',
+            queryset=Changelog.objects.select_related('created_by', 'version')
+                .defer('version__content').order_by('-created_at')[:limit],
+            to_attr='recent_changes',
+        ),
+    )
 
 
 def compute_url_paths(categories):
     """Compute cached_url_path for categories and their children"""
+    tree = get_category_tree()
     for category in categories:
-        # Build path from the already-fetched parent data
-        path_parts = []
-        current = category
-        while current:
-            path_parts.insert(0, current.slug)
-            current = getattr(current, 'parent', None)
-        category.cached_url_path = '/'.join(path_parts)
-        
-        # Do the same for children
-        for subcategory in category.children.all():
-            path_parts = []
-            current = subcategory
-            while current:
-                path_parts.insert(0, current.slug)
-                current = getattr(current, 'parent', None)
-            subcategory.cached_url_path = '/'.join(path_parts)
+        attach_url_paths([category], tree)
+        attach_url_paths(category.children.all(), tree)
 
 
 def get_documents_for_category(category, use_prefetched_data=False, prefetched_documents=None):
@@ -42,30 +58,32 @@ def get_documents_for_category(category, use_prefetched_data=False, prefetched_d
         documents.sort(key=lambda x: x.updated_at, reverse=True)
         
         # Pre-compute URL paths for document categories
-        for document in documents:
-            if document.category:
-                path_parts = []
-                current = document.category
-                while current:
-                    path_parts.insert(0, current.slug)
-                    current = getattr(current, 'parent', None)
-                document.category.cached_url_path = '/'.join(path_parts)
+        attach_url_paths([document.category for document in documents])
         
         return documents
     
-    # Fallback: query database
-    documents = Document.objects.filter(category=category)\
-        .select_related('category', 'category__parent', 'created_by')\
+    # Fallback: query database. The queryset stays lazy so it can be paginated
+    # in SQL; views attach URL paths to the documents on the current page.
+    return Document.objects.filter(category=category)\
+        .select_related('category', 'created_by')\
         .order_by('-updated_at')
-    
-    # Pre-compute URL paths for document categories
-    for document in documents:
-        if document.category:
-            path_parts = []
-            current = document.category
-            while current:
-                path_parts.insert(0, current.slug)
-                current = getattr(current, 'parent', None)
-            document.category.cached_url_path = '/'.join(path_parts)
-    
-    return documents 
\ No newline at end of file
+
+
+def parse_as_of(value):
+    """
+    Parse an ?as_of= value: an ISO datetime, or a date meaning the end of
+    that day. Naive values are taken in the current time zone.
+    """
+    try:
+        timestamp = parse_datetime(value)
+        if timestamp is None:
+            day = parse_date(value)
+            if day is not None:
+                timestamp = datetime.combine(day, time.max)
+    except ValueError:
+        timestamp = None
+    if timestamp is None:
+        raise BadRequest("as_of must be an ISO 8601 date or datetime")
+    if settings.USE_TZ and timezone.is_naive(timestamp):
+        timestamp = timezone.make_aware(timestamp)
+    return timestamp
@@ -1,11 +1,18 @@
+from urllib.parse import urlencode
+
 from django.shortcuts import render, get_object_or_404, redirect
 from django.views.generic import ListView, DetailView, View
-from django.http import Http404
-from django.db.models import Q, Count
+from django.http import Http404, StreamingHttpResponse
+from django.template.loader import render_to_string
+from django.utils.safestring import mark_safe
+from django.db.models import Q
 
-from .models import Document, DocumentCategory, DocumentVersion, Changelog
+from .diff import get_version_diff, side_by_side, stream_word_diff
+from .models import Document, DocumentCategory, DocumentVersion, Changelog, rewind_documents
 from .mixins import CategoryContextMixin, DocumentContextMixin
-from .utils import get_optimized_categories_queryset, compute_url_paths, get_documents_for_category
+from .search import category_facets, get_search_backend, in_category, search_documents
+from .utils import get_documents_for_category, get_recent_history_prefetches, parse_as_of
+from .tree import get_category_tree, attach_url_paths
 
 
 class DocumentListView(CategoryContextMixin, ListView):
@@ -19,6 +26,7 @@ class DocumentListView(CategoryContextMixin, ListView):
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
+        attach_url_paths([document.category for document in context['documents']], self.get_category_tree())
         context['categories'] = self.get_categories_with_url_paths()
         return context
 
@@ -29,20 +37,8 @@ class CategoryListView(CategoryContextMixin, ListView):
     context_object_name = 'categories'
 
     def get_queryset(self):
-        return get_optimized_categories_queryset()
-    
-    def get_context_data(self, **kwargs):
-        context = super().get_context_data(**kwargs)
-        
-        # Use pre-fetched data if available (from SmartRouterView)
-        if hasattr(self.request, '_prefetched_data'):
-            # Use the pre-fetched categories that already have cached_url_path computed
-            context['categories'] = [cat for cat in self.request._prefetched_data['all_categories'] if cat.parent is None]
-        else:
-            # Pre-compute URL paths for categories (required by base template)
-            compute_url_paths(context['categories'])
-        
-        return context
+        # Root categories from the tree snapshot already carry URL paths and counts
+        return self.get_categories_with_url_paths()
 
 
 class DocumentListByCategoryView(CategoryContextMixin, ListView):
@@ -52,51 +48,35 @@ class DocumentListByCategoryView(CategoryContextMixin, ListView):
     paginate_by = 10
 
     def get_queryset(self):
-        # Use pre-fetched data if available (from SmartRouterView)
-        if hasattr(self.request, '_prefetched_data') and hasattr(self.request, '_category_cache'):
-            category = self.request._category_cache.get(self.kwargs['category_path'])
-            if category:
-                self.category = category
-                return get_documents_for_category(
-                    category, 
-                    use_prefetched_data=True, 
-                    prefetched_documents=self.request._prefetched_data['all_documents']
-                )
-        
-        # Fallback: Get category with all optimizations in one query
-        optimized_qs = DocumentCategory.objects.select_related('parent')\
-            .prefetch_related('children', 'children__documents', 'documents')\
-            .annotate(document_count=Count('documents'), child_count=Count('children'))
-        
-        self.category = DocumentCategory.get_by_path(self.kwargs['category_path'], queryset=optimized_qs)
-        
-        if not self.category:
+        # Use the category resolved by SmartRouterView if available
+        category = getattr(self.request, '_category_cache', {}).get(self.kwargs['category_path'])
+        
+        # Fallback: resolve the category (with children and counts) from the tree snapshot
+        if not category:
+            category = self.get_category_tree().get_category_by_path(self.kwargs['category_path'])
+        
+        if not category:
             raise Http404("Category not found")
         
-        return get_documents_for_category(self.category)
+        self.category = category
+        documents = get_documents_for_category(self.category)
+        self.as_of = None
+        if self.request.GET.get('as_of'):
+            # The versions of the whole page are resolved in one query
+            self.as_of = parse_as_of(self.request.GET['as_of'])
+            documents = documents.as_of(self.as_of)
+        return documents
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
+        for document in context['documents']:
+            document.category = self.category
         context['category'] = self.category
+        context['as_of'] = self.as_of
+        if self.as_of is not None:
+            context['as_of_query'] = urlencode({'as_of': self.request.GET['as_of']})
         context['categories'] = self.get_categories_with_url_paths()
         
-        # Ensure children have document_count annotation
-        if hasattr(self.category, 'children') and self.category.children.exists():
-            # Get children with document count annotation
-            children_with_counts = DocumentCategory.objects.filter(
-                parent=self.category
-            ).annotate(
-                document_count=Count('documents')
-            ).select_related('parent')
-            
-            # Update the children with the annotated counts
-            for child in children_with_counts:
-                # Find the corresponding child in the original queryset and update it
-                for original_child in self.category.children.all():
-                    if original_child.id == child.id:
-                        original_child.document_count = child.document_count
-                        break
-        
         # Optimized breadcrumb generation (cached)
         if not hasattr(self.request, '_breadcrumbs_cache'):
             self.request._breadcrumbs_cache = {}
@@ -116,27 +96,47 @@ class DocumentDetailView(CategoryContextMixin, DocumentContextMixin, DetailView)
     context_object_name = 'document'
 
     def get_object(self):
+        self.as_of = None
+        document = self.get_document()
+        if self.request.GET.get('as_of'):
+            self.as_of = parse_as_of(self.request.GET['as_of'])
+            # Swaps in the content of the version current at that time
+            if not rewind_documents([document], self.as_of):
+                raise Http404("Document did not exist at that time")
+        return document
+
+    def get_document(self):
         # Try to get document from cache first
         document = self.get_document_from_cache(self.kwargs['category_path'], self.kwargs['document_slug'])
         if document:
             return document
         
-        # Fallback: Get document with all optimizations in one query
+        # Fallback: resolve the category from the tree snapshot, then the document
+        category = self.get_category_tree().get_category_by_path(self.kwargs['category_path'], with_children=False)
+        if not category:
+            raise Http404("Category not found")
+        
         try:
-            return Document.objects.select_related('category', 'category__parent', 'created_by')\
-                .prefetch_related('versions', 'changelogs')\
-                .get(slug=self.kwargs['document_slug'])
+            return Document.objects.select_related('category', 'created_by')\
+                .prefetch_related(*get_recent_history_prefetches())\
+                .get(category=category, slug=self.kwargs['document_slug'])
         except Document.DoesNotExist:
             raise Http404("Document not found")
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
         document = self.object
-
-        # Use prefetched data (no additional queries)
-        context['recent_versions'] = list(document.versions.all()[:5])
-        context['recent_changes'] = list(document.changelogs.all()[:5])
-        context['table_of_contents'] = document.generate_toc()
+        attach_url_paths([document.category], self.get_category_tree())
+
+        # Windowed prefetches from get_object() hold only the newest entries
+        context['recent_versions'] = document.recent_versions
+        if self.as_of is not None:
+            context['recent_versions'] = [
+                version for version in document.recent_versions if version.created_at <= self.as_of
+            ]
+        context['as_of'] = self.as_of
+        context['recent_changes'] = document.recent_changes
+        context['table_of_contents'] = document.get_table_of_contents()
 
         # Optimized breadcrumb generation (cached)
         if not hasattr(self.request, '_breadcrumbs_cache'):
@@ -167,16 +167,23 @@ class VersionHistoryView(CategoryContextMixin, DocumentContextMixin, ListView):
             raise Http404("Category not found")
         
         try:
-            return Document.objects.select_related('category').get(
+            document = Document.objects.get(
                 category=category,
                 slug=self.kwargs['document_slug']
             )
         except Document.DoesNotExist:
             raise Http404("Document not found")
+        
+        # Reuse the resolved category so its URL path is already known
+        document.category = category
+        return document
 
     def get_queryset(self):
         self.document = self.get_document()
-        return DocumentVersion.objects.filter(document=self.document).order_by('-version_number')
+        # Only metadata and precomputed statistics, never content
+        return DocumentVersion.objects.filter(document=self.document)\
+            .only('document', 'version_number', 'created_at', 'created_by', *DocumentVersion.STATS_FIELDS)\
+            .select_related('created_by').order_by('-version_number')
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
@@ -200,12 +207,16 @@ class DocumentVersionView(CategoryContextMixin, DocumentContextMixin, DetailView
             raise Http404("Category not found")
         
         try:
-            return Document.objects.select_related('category').get(
+            document = Document.objects.get(
                 category=category,
                 slug=self.kwargs['document_slug']
             )
         except Document.DoesNotExist:
             raise Http404("Document not found")
+        
+        # Reuse the resolved category so its URL path is already known
+        document.category = category
+        return document
 
     def get_object(self):
         self.document = self.get_document()
@@ -264,12 +275,16 @@ class DocumentChangelogView(CategoryContextMixin, DocumentContextMixin, ListView
             raise Http404("Category not found")
         
         try:
-            return Document.objects.select_related('category').get(
+            document = Document.objects.get(
                 category=category,
                 slug=self.kwargs['document_slug']
             )
         except Document.DoesNotExist:
             raise Http404("Document not found")
+        
+        # Reuse the resolved category so its URL path is already known
+        document.category = category
+        return document
 
     def get_queryset(self):
         self.document = self.get_document()
@@ -292,16 +307,47 @@ class DocumentSearchView(CategoryContextMixin, ListView):
 
     def get_queryset(self):
         query = self.request.GET.get('q', '')
+        self.category = None
+        if self.request.GET.get('category'):
+            # ?category= takes a category URL path, e.g. engineering/runbooks
+            self.category = self.get_category_tree().get_category_by_path(
+                self.request.GET['category'], with_children=False
+            )
+            if not self.category:
+                raise Http404("Category not found")
+
         if query:
-            return Document.objects.filter(
-                Q(title__icontains=query) |
-                Q(content__icontains=query)
-            ).select_related('category', 'created_by').order_by('-updated_at')
+            # Ranked by the configured search backend, see search.py; results
+            # show snippets instead of content, so it is never loaded
+            self.results = search_documents(query).select_related('category', 'created_by').defer('content')
+            if self.category:
+                return in_category(self.results, self.category)
+            return self.results
         return Document.objects.none()
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
         context['query'] = self.request.GET.get('q', '')
+        context['search_category'] = self.category
+        if context['query']:
+            # Only for the current page, so the work per request stays bounded
+            snippets = get_search_backend().snippets(context['documents'], context['query'])
+            for document in context['documents']:
+                document.search_snippet = snippets.get(document.pk)
+
+            # Facets count all results, so other categories stay one click away
+            facets = category_facets(self.results)
+            roots = self.get_category_tree().get_categories(
+                sorted(facets, key=lambda category_id: -facets[category_id])
+            )
+            context['category_facets'] = [(root, facets[root.pk]) for root in roots if root is not None]
+            context['facet_total'] = sum(facets.values())
+
+            params = {'q': context['query']}
+            context['all_categories_query'] = urlencode(params)
+            if self.category:
+                params['category'] = self.category.get_url_path()
+            context['search_query_params'] = urlencode(params)
         context['categories'] = self.get_categories_with_url_paths()
         return context
 
@@ -327,6 +373,7 @@ class GlobalChangelogView(CategoryContextMixin, ListView):
 class DocumentCompareView(CategoryContextMixin, DocumentContextMixin, View):
     """Compare two versions of a document and show the differences"""
     template_name = 'docvault/document_compare.html'
+    DIFF_STREAM_MARKER = '<!-- docvault:diff -->'
 
     def get(self, request, **kwargs):
         # Use request-level cache if available
@@ -338,6 +385,7 @@ class DocumentCompareView(CategoryContextMixin, DocumentContextMixin, View):
             raise Http404("Category not found")
         
         document = get_object_or_404(Document, category=category, slug=kwargs['document_slug'])
+        document.category = category
         
         # Check if user wants to select versions
         select_mode = request.GET.get('select', 'false').lower() == 'true'
@@ -350,31 +398,60 @@ class DocumentCompareView(CategoryContextMixin, DocumentContextMixin, View):
             # Show version selection form
             version1 = None
             version2 = None
-        elif not version1_id or not version2_id:
-            # Default to comparing current version with previous version
-            versions = document.versions.all()[:2]
-            if len(versions) >= 2:
-                version1 = versions[1]  # Previous version
-                version2 = versions[0]  # Current version
-            else:
-                version1 = version2 = versions[0] if versions else None
         else:
-            # Get the specific versions to compare
-            version1 = get_object_or_404(DocumentVersion, document=document, version_number=version1_id)
-            version2 = get_object_or_404(DocumentVersion, document=document, version_number=version2_id)
+            # Content is only loaded if the diff is not cached yet
+            versions = document.versions.defer('content').select_related('created_by')
+            if not version1_id or not version2_id:
+                # Default to comparing current version with previous version
+                versions = versions.order_by('-version_number')[:2]
+                if len(versions) >= 2:
+                    version1 = versions[1]  # Previous version
+                    version2 = versions[0]  # Current version
+                else:
+                    version1 = version2 = versions[0] if versions else None
+            else:
+                # Get the specific versions to compare
+                version1 = get_object_or_404(versions, version_number=version1_id)
+                version2 = get_object_or_404(versions, version_number=version2_id)
+        
+        diff_mode = 'words' if request.GET.get('mode') == 'words' else 'lines'
+        diff = None
+        if version1 and version2 and diff_mode == 'lines':
+            diff = get_version_diff(version1, version2)
+            for hunk in diff['hunks']:
+                hunk['rows'] = side_by_side(hunk['lines'])
         
         context = {
             'document': document,
             'version1': version1,
             'version2': version2,
-            'versions': document.versions.all().order_by('-version_number'),
+            'diff': diff,
+            'diff_mode': diff_mode,
+            # The selection lists only need numbers, dates and authors
+            'versions': document.versions.defer('content').select_related('created_by').order_by('-version_number'),
             'compare_mode': 'diff' if version1 and version2 else 'select',
             'breadcrumbs': DocumentCategory.get_breadcrumbs(document.category),
-            'categories': self.get_categories_with_url_paths()
+            'categories': self.get_categories_with_url_paths(),
+            'sidebar_html': self.get_sidebar_html,
         }
         
+        if diff_mode == 'words' and version1 and version2:
+            return self.stream_word_diff(request, context, version1, version2)
         return render(request, self.template_name, context)
 
+    def stream_word_diff(self, request, context, version1, version2):
+        """Send the page around the diff first, then the diff hunk by hunk"""
+        context['diff_stream_marker'] = mark_safe(self.DIFF_STREAM_MARKER)
+        head, tail = render_to_string(self.template_name, context, request).split(self.DIFF_STREAM_MARKER)
+
+        def content():
+            yield head
+            # Version content is only loaded once the page head is on its way
+            yield from stream_word_diff(version1.content, version2.content)
+            yield tail
+
+        return StreamingHttpResponse(content())
+
 
 class SmartPathView(View):
     """Smart view that handles category paths only"""
@@ -403,104 +480,37 @@ class SmartRouterView(View):
         if not parts:
             raise Http404("Invalid path")
         
-        # OPTIMIZATION: Pre-fetch all categories and documents in one go
-        # This eliminates the N+1 problem completely
-        if not hasattr(request, '_prefetched_data'):
-            # Get all categories with their relationships in a single query
-            all_categories = DocumentCategory.objects.select_related('parent')\
-                .prefetch_related('children', 'children__documents')\
-                .annotate(
-                    document_count=Count('documents'),
-                    child_count=Count('children')
-                )
-            
-            # Get all documents with their categories in a single query
-            all_documents = Document.objects.select_related('category').all()
-            
-            # Build efficient lookups
-            categories_by_path = {}
-            categories_by_slug_parent = {}
-            documents_by_category_slug = {}
-            
-            # Build category path lookup and pre-compute cached_url_path
-            for category in all_categories:
-                # Build the full path for this category
-                path_parts = []
-                current = category
-                while current:
-                    path_parts.insert(0, current.slug)
-                    current = current.parent
-                full_path = '/'.join(path_parts)
-                categories_by_path[full_path] = category
-                category.cached_url_path = full_path
-                
-                # Build slug+parent lookup for efficient path traversal
-                key = (category.slug, category.parent_id)
-                categories_by_slug_parent[key] = category
-                
-                # Pre-compute cached_url_path for children
-                for subcategory in category.children.all():
-                    path_parts = []
-                    current = subcategory
-                    while current:
-                        path_parts.insert(0, current.slug)
-                        current = current.parent
-                    subcategory.cached_url_path = '/'.join(path_parts)
-            
-            # Build document lookup
-            for document in all_documents:
-                if document.category:
-                    key = (document.category.id, document.slug)
-                    documents_by_category_slug[key] = document
-            
-            request._prefetched_data = {
-                'categories_by_path': categories_by_path,
-                'categories_by_slug_parent': categories_by_slug_parent,
-                'documents_by_category_slug': documents_by_category_slug,
-                'all_categories': all_categories,
-                'all_documents': all_documents
-            }
-        
-        # Use the pre-fetched data
-        data = request._prefetched_data
-        
-        # Check if this is a category path first
-        if path in data['categories_by_path']:
-            category = data['categories_by_path'][path]
-            
-            # Check if there's a document with this exact path
-            if len(parts) > 1:
-                # Try to find a document in the parent category
-                parent_path = '/'.join(parts[:-1])
-                if parent_path in data['categories_by_path']:
-                    parent_category = data['categories_by_path'][parent_path]
-                    document_key = (parent_category.id, parts[-1])
-                    
-                    if document_key in data['documents_by_category_slug']:
-                        document = data['documents_by_category_slug'][document_key]
-                        # It's a document, route to document detail
-                        request._category_cache = {parent_path: parent_category}
-                        request._document_cache = document
-                        return DocumentDetailView.as_view()(request, category_path=parent_path, document_slug=parts[-1])
-            
-            # It's a category, route to category view
-            request._category_cache = {path: category}
-            return DocumentListByCategoryView.as_view()(request, category_path=path)
+        # Resolve against the shared category tree snapshot. It is only rebuilt
+        # when a category or document changes, not on every request.
+        tree = get_category_tree()
+        request._category_tree = tree
         
-        # If no category found, try to find a document
+        # A document takes precedence over a subcategory with the same slug.
+        # The category comes from the snapshot, so the document itself is a
+        # single lookup on the (category, slug) index regardless of corpus size.
         if len(parts) > 1:
             parent_path = '/'.join(parts[:-1])
+            parent_category = tree.get_category_by_path(parent_path, with_children=False)
             
-            if parent_path in data['categories_by_path']:
-                parent_category = data['categories_by_path'][parent_path]
-                document_key = (parent_category.id, parts[-1])
+            if parent_category:
+                document = Document.objects.select_related('created_by')\
+                    .prefetch_related(*get_recent_history_prefetches())\
+                    .filter(category_id=parent_category.id, slug=parts[-1])\
+                    .first()
                 
-                if document_key in data['documents_by_category_slug']:
-                    document = data['documents_by_category_slug'][document_key]
+                if document:
                     # It's a document, route to document detail
+                    document.category = parent_category
                     request._category_cache = {parent_path: parent_category}
                     request._document_cache = document
                     return DocumentDetailView.as_view()(request, category_path=parent_path, document_slug=parts[-1])
         
+        # Check if this is a category path
+        category = tree.get_category_by_path(path)
+        if category:
+            # It's a category, route to category view
+            request._category_cache = {path: category}
+            return DocumentListByCategoryView.as_view()(request, category_path=path)
+        
         # If we get here, nothing was found
-        raise Http404("Category or document not found")
\ No newline at end of file
+        raise Http404("Category or document not found")